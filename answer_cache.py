@@ -0,0 +1,132 @@
+# answer_cache.py
+"""
+Semantic answer cache in front of generation.
+
+A cached answer is reused when
+  - the new question's embedding is within `threshold` cosine similarity of a cached question,
+  - retrieval returned exactly the same chunks, by UUID and content_hash (so the context is
+    the same, even if another process re-ingested the file and this one was never told), and
+  - it would be generated the same way: same models and max_tokens (main.py and the app differ).
+
+Entries expire after `ttl` seconds, the least recently used ones are dropped past
+`max_entries`, and everything built on a file is invalidated when that file is re-ingested.
+"""
+import os, time, threading
+from collections import OrderedDict
+import numpy as np
+
+from chunk_ids import hit_content_hash
+from tracing import get_tracer
+
+
+def context_key(hits: list[dict]) -> frozenset:
+    """(uuid, content_hash) of every hit; chunks stored without a hash are hashed from their text."""
+    return frozenset((str(h["uuid"]), hit_content_hash(h)) for h in hits)
+
+
+class _Entry:
+    __slots__ = ("vector", "context", "generation", "file_names", "answer", "sources", "strategy", "created")
+
+    def __init__(self, vector, context, generation, file_names, answer, sources, strategy):
+        self.vector = vector
+        self.context = context
+        self.generation = generation    # (model, max_tokens)
+        self.file_names = file_names
+        self.answer = answer
+        self.sources = sources
+        self.strategy = strategy
+        self.created = time.monotonic()
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold: float = 0.95, ttl: float = 3600, max_entries: int = 512):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()     # id → _Entry, least recently used first
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        return v / max(float(np.linalg.norm(v)), 1e-12)
+
+    def _expire(self):
+        now = time.monotonic()
+        for key in [k for k, e in self._entries.items() if now - e.created > self.ttl]:
+            del self._entries[key]
+
+    def lookup(self, question_vector, hits: list[dict], model: str, max_tokens: int):
+        """Return {"answer", "sources", "strategy"} on a hit, else None."""
+        context, generation = context_key(hits), (model, max_tokens)
+        q = self._unit(question_vector)
+        with self._lock:
+            self._expire()
+            best_key, best_sim = None, self.threshold
+            for key, entry in self._entries.items():
+                if entry.context != context or entry.generation != generation:
+                    continue
+                sim = float(entry.vector @ q)
+                if sim >= best_sim:
+                    best_key, best_sim = key, sim
+
+            if best_key is None:
+                self.misses += 1
+                get_tracer().count("answer_cache", result="miss")
+                return None
+            self.hits += 1
+            get_tracer().count("answer_cache", result="hit")
+            self._entries.move_to_end(best_key)
+            entry = self._entries[best_key]
+            return {"answer": entry.answer, "sources": entry.sources, "strategy": entry.strategy}
+
+    def store(self, question_vector, hits: list[dict], answer: str, sources, strategy,
+              model: str, max_tokens: int):
+        entry = _Entry(self._unit(question_vector),
+                       context_key(hits),
+                       (model, max_tokens),
+                       frozenset(h["file_name"] for h in hits),
+                       answer, sources, strategy)
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_file(self, file_name: str) -> int:
+        """Drop every answer whose context came from `file_name`. Returns how many were dropped."""
+        with self._lock:
+            stale = [k for k, e in self._entries.items() if file_name in e.file_names]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                    "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """Process-wide cache, shared by every Streamlit session and the CLI."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticAnswerCache(
+                threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95)),
+                ttl=float(os.getenv("ANSWER_CACHE_TTL", 3600)),
+                max_entries=int(os.getenv("ANSWER_CACHE_SIZE", 512)),
+            )
+        return _cache
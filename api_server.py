@@ -0,0 +1,282 @@
+# api_server.py
+"""
+HTTP API over the RAG pipeline (stdlib only), for other services.
+
+    python api_server.py [--port 8000] [--query-workers 8] [--queue-size 64]
+
+    POST /ingest   {"path": "/data/deck.pdf"}                 → ingest / re-sync report
+                   (only files under --ingest-dir / INGEST_DIR; without it, paths are refused)
+                   or the raw PDF body with Content-Type: application/pdf and ?name=deck.pdf
+    POST /query    {"query": "...", "k": 3, "hybrid": false,
+                    "filters": {"file_names": [...], "page_range": [1, 20], "sections": [...]}}
+    GET  /health   queue depths, embedding batch sizes, answer cache stats, stage latencies
+    GET  /metrics  Prometheus text (stage latency / payload histograms, event counters)
+
+Requests go through bounded queues served by fixed worker pools; when a queue is
+full the server answers 503 with Retry-After instead of piling up threads.
+After request_timeout the client gets 504: a job still waiting in the queue is
+cancelled, one that already started keeps running to completion (an ingest
+finishes and is stored, a query's answer lands in the answer cache).
+Concurrent queries share one embedding call through QueryBatcher, and all
+clients (Weaviate, HTTP session, LLM) are the process-wide pooled ones.
+"""
+import os, json, time, queue, shutil, argparse, tempfile, threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+
+class QueryBatcher:
+    """
+    Drop-in embedder that coalesces concurrent encode() calls into one call on the
+    wrapped embedder. A lone request is encoded immediately; requests arriving
+    while a batch is being encoded are sent together in the next one.
+    """
+
+    def __init__(self, embedder, max_batch: int = 64):
+        self.embedder = embedder
+        self.model_id = getattr(embedder, "model_id", None)
+        self.max_batch = max_batch
+        self.batches = 0
+        self.items = 0
+        self._pending = queue.Queue()
+        threading.Thread(target=self._run, name="query-batcher", daemon=True).start()
+
+    def encode(self, texts: list[str]):
+        fut = Future()
+        self._pending.put((list(texts), fut))
+        return fut.result()
+
+    def _run(self):
+        while True:
+            batch = [self._pending.get()]
+            size = len(batch[0][0])
+            while size < self.max_batch:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+                size += len(batch[-1][0])
+            texts = [t for ts, _ in batch for t in ts]
+            try:
+                vectors = np.asarray(self.embedder.encode(texts), dtype=np.float32)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(texts)
+            offset = 0
+            for ts, fut in batch:
+                fut.set_result(vectors[offset:offset + len(ts)])
+                offset += len(ts)
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "texts": self.items,
+                "mean_batch": round(self.items / self.batches, 2) if self.batches else 0.0}
+
+
+class WorkQueue:
+    """Bounded job queue + fixed worker threads; submit() raises queue.Full when saturated."""
+
+    def __init__(self, name: str, workers: int, size: int):
+        self.name = name
+        self._jobs = queue.Queue(maxsize=size)
+        for i in range(workers):
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True).start()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        fut = Future()
+        self._jobs.put_nowait((fut, fn, args, kwargs))
+        return fut
+
+    def _run(self):
+        while True:
+            fut, fn, args, kwargs = self._jobs.get()
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                fut.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                fut.set_exception(e)
+
+    def depth(self) -> int:
+        return self._jobs.qsize()
+
+
+def _hit_summary(h: dict) -> dict:
+    return {"uuid": str(h["uuid"]), "file_name": h["file_name"], "page": h["page"],
+            "distance": h.get("distance"), "score": h.get("rerank_score", h.get("score"))}
+
+
+class RAGService:
+    def __init__(self, query_workers: int = 8, ingest_workers: int = 1, queue_size: int = 64,
+                 request_timeout: float = 180,
+                 ingest_dir: str = None):           # JSON {"path"} ingests are limited to this directory
+        import main                                  # config; embedder / packer / reranker load on first use
+        self.main = main
+        self.batcher = QueryBatcher(main.get_embedder())
+        main.get_engine(self.batcher)
+        self.queries = WorkQueue("query", query_workers, queue_size)
+        self.ingests = WorkQueue("ingest", ingest_workers, max(4, queue_size // 8))
+        self.request_timeout = request_timeout
+        self.upload_dir = tempfile.mkdtemp(prefix="rag_api_")
+        ingest_dir = ingest_dir or os.getenv("INGEST_DIR")
+        self.ingest_dir = os.path.realpath(ingest_dir) if ingest_dir else None
+
+    def query(self, body: dict) -> dict:
+        if not body.get("query"):
+            raise ValueError("'query' is required")
+        filters = body.get("filters") or None
+        if filters and filters.get("page_range"):
+            filters = {**filters, "page_range": tuple(filters["page_range"])}
+        result = self.main.run_rag_query_and_generate(body["query"], int(body.get("k", 3)),
+                                                      filters=filters, hybrid=body.get("hybrid"))
+        return {"answer": result["answer"], "sources": result["sources"],
+                "strategy": result["strategy"], "cached": result["cached"],
+                "timings": result["timings"], "hits": [_hit_summary(h) for h in result["hits"]]}
+
+    def ingest(self, path: str) -> dict:
+        if not os.path.isfile(path):
+            raise ValueError(f"no such file: {path}")
+        return self.main.ingest_pdf(path)
+
+    def ingest_path(self, path: str) -> dict:
+        """JSON {"path"}: only files inside ingest_dir (symlinks resolved)."""
+        if self.ingest_dir is None:
+            raise ValueError("ingesting by path is disabled; start the server with --ingest-dir / INGEST_DIR")
+        real = os.path.realpath(path)
+        if os.path.commonpath([real, self.ingest_dir]) != self.ingest_dir:
+            raise ValueError(f"path outside the ingest directory: {path}")
+        return self.ingest(real)
+
+    def save_upload(self, name: str, data: bytes) -> str:
+        # A private directory per upload keeps the file name (it identifies the document)
+        # while concurrent uploads of the same name can't overwrite each other
+        path = os.path.join(tempfile.mkdtemp(dir=self.upload_dir), name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    @staticmethod
+    def discard_upload(path: str):
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+    def ingest_upload(self, path: str) -> dict:
+        try:
+            return self.ingest(path)
+        finally:
+            self.discard_upload(path)
+
+    def health(self) -> dict:
+        from answer_cache import get_answer_cache
+        from tracing import get_tracer
+        return {"status": "ok", "query_queue": self.queries.depth(), "ingest_queue": self.ingests.depth(),
+                "embedding_batches": self.batcher.stats(), "answer_cache": get_answer_cache().stats(),
+                "stages": get_tracer().stage_summary()}
+
+
+class Handler(BaseHTTPRequestHandler):
+    service: RAGService = None
+    protocol_version = "HTTP/1.1"          # keep-alive for clients that pool connections
+
+    def _send(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _run(self, work_queue: WorkQueue, fn, *args, discard=None):
+        """discard() runs if the job never will: rejected with 503, or cancelled on timeout."""
+        try:
+            fut = work_queue.submit(fn, *args)
+        except queue.Full:
+            if discard:
+                discard()
+            return self._send(503, {"error": f"{work_queue.name} queue full"}, {"Retry-After": "1"})
+        start = time.perf_counter()
+        try:
+            result = fut.result(timeout=self.service.request_timeout)
+        except ValueError as e:
+            return self._send(400, {"error": str(e)})
+        except TimeoutError:
+            # Only a job still in the queue can be cancelled; a running one finishes in the background
+            cancelled = fut.cancel()
+            if cancelled and discard:
+                discard()
+            return self._send(504, {"error": "timed out", "cancelled": cancelled})
+        except Exception as e:
+            return self._send(500, {"error": f"{type(e).__name__}: {e}"})
+        self._send(200, {**result, "elapsed_s": round(time.perf_counter() - start, 4)})
+
+    def _send_text(self, status: int, text: str, content_type: str):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            return self._send(200, self.service.health())
+        if path == "/metrics":
+            from tracing import get_tracer
+            return self._send_text(200, get_tracer().prometheus_text(), "text/plain; version=0.0.4")
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        try:
+            if url.path == "/query":
+                return self._run(self.service.queries, self.service.query, json.loads(self._body() or b"{}"))
+            if url.path == "/ingest":
+                if self.headers.get("Content-Type", "").startswith("application/pdf"):
+                    name = os.path.basename(parse_qs(url.query).get("name", ["upload.pdf"])[0]) or "upload.pdf"
+                    path = self.service.save_upload(name, self._body())
+                    return self._run(self.service.ingests, self.service.ingest_upload, path,
+                                     discard=lambda: self.service.discard_upload(path))
+                path = json.loads(self._body() or b"{}").get("path", "")
+                return self._run(self.service.ingests, self.service.ingest_path, path)
+        except json.JSONDecodeError as e:
+            return self._send(400, {"error": f"invalid JSON: {e}"})
+        self._send(404, {"error": "not found"})
+
+    def log_message(self, fmt, *args):
+        pass                                   # per-request logging costs more than the lookups
+
+
+def serve(host: str = "0.0.0.0", port: int = 8000, **service_kwargs):
+    Handler.service = RAGService(**service_kwargs)
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    print(f"🚀 RAG API on http://{host}:{port}  (POST /query, POST /ingest, GET /health, GET /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP API for ingestion and question answering.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", 8000)))
+    parser.add_argument("--query-workers", type=int, default=8)
+    parser.add_argument("--ingest-workers", type=int, default=1)
+    parser.add_argument("--queue-size", type=int, default=64, help="pending queries before answering 503")
+    parser.add_argument("--ingest-dir", default=None, help="directory JSON {\"path\"} ingests may read from")
+    args = parser.parse_args()
+    serve(args.host, args.port, query_workers=args.query_workers,
+          ingest_workers=args.ingest_workers, queue_size=args.queue_size, ingest_dir=args.ingest_dir)
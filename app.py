@@ -1,19 +1,18 @@
 # app.py
-import os, tempfile, shutil, warnings,atexit
+import os, time, uuid, tempfile, shutil, warnings,atexit
 import streamlit as st
 from dotenv import load_dotenv
-from weaviate import connect_to_local
-import weaviate.classes as wvc
-
-from pdf_extraction import extract_text_as_documents
-from chunking          import chunk_texts
-from weaviate_handler  import WeaviateHandler
-from rag               import RAGRetriever
-from hf_embedder       import HFEmbedderAPI
-from generator         import generate_answer_hf_api
-from strategy          import choose_strategy
-from summarizer        import get_or_create_summary   
-from main import generate_metadata       
+
+from resources         import get_resources
+from answer_cache      import get_answer_cache
+from embedded_store    import open_handler
+from async_engine      import AsyncQueryEngine
+from local_embedder    import make_embedder
+from embedding_cache   import with_cache
+from summary_worker    import SummaryQueue, SummaryWorker
+from tracing           import get_tracer
+# Ingestion (pipeline, batch_ingest, incremental → PyMuPDF, chunker), the context packer and
+# the reranker are imported where first used, so the first page render doesn't wait for them.
 
 warnings.filterwarnings("ignore", category=DeprecationWarning,
                         message=".*swigvarlink.*")
@@ -26,68 +25,93 @@ CHUNK_SIZE        = 512
 CHUNK_OVERLAP     = 64
 MIN_TOKENS        = 50
 MODEL_CONTEXT     = 2048            
-PORT_HTTP, PORT_GRPC = 8080, 50051
+RERANK_CANDIDATES = 20              # hits scored by the cross-encoder before keeping top k
+EXTRACT_TABLES    = os.getenv("EXTRACT_TABLES") == "1"   # tables as row text; ingest and re-sync must agree
 TMP_DIR = tempfile.mkdtemp(prefix="rag_upload_") #temporary director where pdfs would be stored. 
 
-@st.cache_resource(show_spinner=False)
 def get_client():
-    # One Weaviate connection reused across reruns
-    return connect_to_local(port=PORT_HTTP, grpc_port=PORT_GRPC)
+    # One Weaviate connection reused across reruns and sessions; health-checked and
+    # reconnected by the resource manager if Weaviate restarted.
+    # VECTOR_BACKEND=embedded swaps in the in-process store (no server needed).
+    return get_resources().vector_client()
 
 @st.cache_resource(show_spinner=False)
 def get_embedder():
     # Embedder is also the same across reruns. 
-    return HFEmbedderAPI()
+    return with_cache(make_embedder())   # EMBEDDER_BACKEND=local|api, behind the persistent cache
+
+@st.cache_resource(show_spinner=False)
+def get_summary_worker():
+    # One background summariser per server process, fed by ingestion when enabled.
+    return SummaryWorker(open_handler(COLLECTION_NAME, get_client()), SummaryQueue())
+
+@st.cache_resource(show_spinner=False)
+def get_packer():
+    # Tokenizer load + per-chunk token-count memo survive reruns
+    from context_packer import ContextPacker
+    return ContextPacker(MODEL_CONTEXT, answer_tokens=400)
+
+@st.cache_resource(show_spinner=False)
+def get_reranker():
+    # ONNX session + (query, chunk) score cache shared by all sessions
+    from reranker import CrossEncoderReranker
+    return CrossEncoderReranker()
+
+@st.cache_resource(show_spinner=False)
+def get_engine():
+    # One asyncio query engine (event loop, async Weaviate + LLM clients, concurrency limits)
+    # shared by every session instead of a new RAGRetriever per question
+    return AsyncQueryEngine(COLLECTION_NAME, get_embedder(), get_packer(), candidates=RERANK_CANDIDATES)
 
 client    = get_client()
 embedder  = get_embedder()
-handler   = WeaviateHandler(COLLECTION_NAME, client)
+handler   = open_handler(COLLECTION_NAME, client)
+answer_cache = get_answer_cache()      # process-wide, shared by all sessions
+summary_worker = get_summary_worker()
+engine    = get_engine()
 
 # ------------------------------------------------------------------
 # ----- INGESTION ---------------------------------------------------
-def ingest_pdf_file(file_path: str):
-    file_name = os.path.basename(file_path)
-    if handler.document_already_exists(file_name):
-        st.info(f"{file_name} already indexed – skipping.")
-        return
+def show_timings(rows, events=None, label="Timing breakdown"):
+    with st.expander(label):
+        st.dataframe(rows, use_container_width=True)
+        if events:
+            st.caption("Events: " + ", ".join(f"{name} ×{n}" for name, n in events.items()))
+
 
-    st.write(f"Extracting **{file_name}** …")
-    docs        = extract_text_as_documents(file_path)
-    cleaned_docs      = [doc.replace("\n", " ").replace("  ", " ").strip() for doc in docs]
-    chunked_docs  = chunk_texts(cleaned_docs, CHUNK_SIZE, CHUNK_OVERLAP)
+def ingest_pdf_file(file_path: str, summary_queue=None):
+    with get_tracer().trace("ingest_pdf", file=os.path.basename(file_path)) as trace:
+        _ingest_pdf_file(file_path, summary_queue)
+    show_timings([{"span": name, **t} for name, t in trace.totals().items()], trace.events,
+                 label=f"Timing breakdown – {os.path.basename(file_path)}")
 
-    # Filter & split meta / text
-    filtered_docs = [d for d in chunked_docs
-                     if len(d.page_content.split()) >= MIN_TOKENS]
-    chunks = [doc.page_content for doc in filtered_docs]
-    metas   = [ generate_metadata(i, file_name, page=doc.metadata["page"])
-               for i, doc in enumerate(filtered_docs)]
 
-    st.write(f" {len(chunks)} chunks after filtering; embedding …")
-    vectors = embedder.encode(chunks)
+def _ingest_pdf_file(file_path: str, summary_queue=None):
+    from pipeline import IngestPipeline, format_report
+    from incremental import sync_document, format_sync_report
+    file_name = os.path.basename(file_path)
+    if handler.document_already_exists(file_name):
+        st.info(f"{file_name} already indexed – updating changed chunks only.")
+        report = sync_document(file_path, handler, embedder,
+                               chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                               min_tokens=MIN_TOKENS, summary_queue=summary_queue, tables=EXTRACT_TABLES)
+        st.success(f"✅ {format_sync_report(report)}")
+        return
 
-    handler.insert_chunks(chunks, vectors, metas)
-    st.success(f"✅ Ingested {file_name}")
+    st.write(f"Ingesting **{file_name}** …")
+    pipeline = IngestPipeline(handler, embedder,
+                              chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                              min_tokens=MIN_TOKENS, summary_queue=summary_queue, tables=EXTRACT_TABLES)
+    report = pipeline.run(file_path)
+    st.success(f"✅ Ingested {file_name}: {format_report(report)}")
 
 # ------------------------------------------------------------------
 # ----- RAG QUERY ---------------------------------------------------
-def answer_query(question: str, k: int):
-    retriever  = RAGRetriever(COLLECTION_NAME, embedder, client)
-    hits       = retriever.retrieve(question, k=k)
-    strategy   = choose_strategy(len(hits), CHUNK_SIZE, MODEL_CONTEXT)
+@st.cache_data(ttl=60, show_spinner=False)
+def scope_options():
+    # Files / sections / last page for the search-scope widgets (aggregate queries, cached briefly)
+    return handler.list_file_names(), handler.list_sections(), handler.max_page()
 
-    if strategy == "full_text":
-        context = [h["text"] for h in hits]
-    elif strategy == "sliding_window":
-        context = [" ".join(h["text"].split()[:200]) for h in hits]
-    else:                       # summarize
-        context = [get_or_create_summary(h, handler.collection) for h in hits]
-
-    sources = sorted({f"{h['file_name']} page {h['page']}" for h in hits})
-    answer  = generate_answer_hf_api(question, context,max_tokens=400,
-        temperature=0.2)
-
-    return answer, sources, strategy
 
 # ------------------------------------------------------------------
 # ----- STREAMLIT LAYOUT -------------------------------------------
@@ -100,28 +124,87 @@ with st.sidebar:
         type=["pdf"],
         accept_multiple_files=True)
 
+    # The worker is shared by all sessions: it keeps running while any session has this on
+    session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+    presummarize = st.toggle("Pre-summarize in background", value=summary_worker.wanted_by(session_id),
+                             help="Summaries are generated right after ingestion instead of on the first query.")
+    if presummarize:
+        summary_worker.acquire(session_id)
+    else:
+        summary_worker.release(session_id)
+    summary_queue = summary_worker.queue if presummarize else None
+
     if uploaded:
         if st.button("Ingest"):
+            paths = []
             for file in uploaded:
                 dest = os.path.join(TMP_DIR, file.name)
                 with open(dest, "wb") as f:
                     f.write(file.getbuffer())
-                ingest_pdf_file(dest)
+                paths.append(dest)
+
+            if len(paths) == 1:
+                ingest_pdf_file(paths[0], summary_queue)
+            else:
+                # Several files: extract/chunk them in parallel processes
+                from batch_ingest import ingest_many
+                with st.spinner(f"Ingesting {len(paths)} files …"):
+                    result = ingest_many(paths, handler, embedder,
+                                         chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                                         min_tokens=MIN_TOKENS, update_existing=True,
+                                         summary_queue=summary_queue, log=st.write)
+                for name, status in sorted(result["files"].items()):
+                    st.write(f"**{name}**: {status}")
+            scope_options.clear()          # new files / pages show up in the scope widgets
             st.success("All selected files processed.")
 
+    if presummarize:
+        progress = summary_worker.progress()
+        st.caption(f"Summaries: {progress['done']} done, {progress['pending']} pending, "
+                   f"{progress['failed']} failed")
+
+    stats = answer_cache.stats()
+    st.caption(f"Answer cache: {stats['hits']} hits / {stats['misses']} misses "
+               f"({stats['entries']} entries)")
+
 st.subheader("Ask a question")
 col_q, col_k = st.columns([3, 1])
 question = col_q.text_input("Enter your question")
 top_k     = col_k.slider("k", 1, 8, 3)
+hybrid    = st.checkbox("Hybrid search (keyword + vector)",
+                        help="Also matches exact names and terms via BM25, fused with the vector results.")
+rerank    = st.checkbox("Rerank candidates (cross-encoder)",
+                        help=f"Scores the top {RERANK_CANDIDATES} candidates with a local cross-encoder and keeps the best k.")
+
+with st.expander("Search scope"):
+    all_files, all_sections, last_page = scope_options()
+    scope_files = st.multiselect("Files", all_files, help="Leave empty to search every file.")
+    scope_pages = st.slider("Pages", 1, max(last_page, 1), (1, max(last_page, 1))) if last_page > 1 else None
+    scope_sections = st.multiselect("Sections", all_sections) if len(all_sections) > 1 else []
+scope = {"file_names": scope_files, "sections": scope_sections,
+         # full range selected → no page filter
+         "page_range": scope_pages if scope_pages and scope_pages != (1, last_page) else None}
 
 if st.button("Get answer") and question:
     with st.spinner("Retrieving …"):
-        answer, sources, strat = answer_query(question, top_k)
+        prepared = engine.prepare(question, top_k, hybrid=hybrid, filters=scope,
+                                  reranker=get_reranker() if rerank else None, max_tokens=400)
+    st.caption("Stages: " + ", ".join(f"{stage} {t * 1000:.0f} ms" for stage, t in prepared["timings"].items()))
 
     st.markdown("#### Answer")
-    st.write(answer)
+    sources, strat = prepared["sources"], prepared["strategy"]
+    if prepared["cached"]:
+        st.write(prepared["answer"])
+        strat += " · cached"
+    else:
+        # Tokens are rendered as they arrive; the engine holds an LLM slot and enforces the
+        # generate timeout, and caches the answer once the stream finished
+        t0 = time.perf_counter()
+        st.write_stream(engine.stream_answer(question, prepared, temperature=0.2))
+        prepared["trace"].append({"span": "llm.stream", "ms": round(1000 * (time.perf_counter() - t0), 1)})
     st.markdown("**Sources:** " + ", ".join(sources))
     st.caption(f"Strategy used: {strat}")
+    show_timings(prepared["trace"], prepared["events"])
 
 # ------------------------------------------------------------------
 # ----- CLEAN-UP WHEN SERVER STOPS ---------------------------------
@@ -0,0 +1,288 @@
+# async_engine.py
+"""
+Asyncio query engine, shared by every Streamlit session (and by main.py through
+the sync wrappers).
+
+One event loop runs on a background thread. A query goes
+
+    embed ──── vector search ─┐
+    BM25 (hybrid only) ───────┴─ fuse → rerank → answer cache → pack (+summaries) → generate
+
+so the BM25 leg runs while the question is still being embedded. Weaviate is
+queried through its async client and the LLM through AsyncOpenAI; the embedder,
+reranker and summariser are blocking and run on the loop's bounded thread pool.
+Every stage has its own timeout, a semaphore caps the queries in flight and a
+second one the concurrent LLM calls.
+"""
+import os, time, asyncio, threading
+from concurrent.futures import ThreadPoolExecutor
+
+from rag import reciprocal_rank_fusion, fetch_sizes
+from answer_cache import get_answer_cache
+from generator import agenerate_answer_hf_api, astream_answer_hf_api, models_id
+from resources import get_resources, llm_base_url
+from embedded_store import EmbeddedClient, open_handler
+from tracing import get_tracer
+
+# seconds per stage
+DEFAULT_TIMEOUTS = {"embed": 15, "retrieve": 10, "bm25": 10, "rerank": 15, "summarize": 30, "generate": 90}
+
+
+class StageTimeout(TimeoutError):
+    def __init__(self, stage: str, seconds: float):
+        super().__init__(f"{stage} took longer than {seconds}s")
+        self.stage = stage
+
+
+class AsyncQueryEngine:
+    def __init__(self, collection_name: str, embedder, packer,
+                 candidates: int = 20,          # over-fetched when a reranker is passed to a query
+                 max_concurrent: int = 8,       # queries in flight across all sessions
+                 llm_concurrency: int = 4,      # simultaneous LLM calls
+                 workers: int = 16,             # threads for the blocking stages
+                 timeouts: dict = None):
+        self.collection_name = collection_name
+        self.embedder = embedder
+        self.packer = packer
+        self.candidates = candidates
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.answer_cache = get_answer_cache()
+        self._handler = None
+        self._handler_lock = threading.Lock()
+
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(ThreadPoolExecutor(max_workers=workers,
+                                                           thread_name_prefix="query-engine"))
+        self._thread = threading.Thread(target=self._loop.run_forever, name="query-engine-loop", daemon=True)
+        self._thread.start()
+        self._weaviate = self._collection = self._llm = None
+        self._run(self._setup(max_concurrent, llm_concurrency))
+
+    # ---------------- plumbing ----------------
+    @property
+    def handler(self):
+        """
+        Blocking handler (summary write-back, every search on the embedded backend), opened on
+        the client get_resources() hands out right now, so a reconnect there is picked up.
+        """
+        client = get_resources().vector_client()
+        with self._handler_lock:
+            if self._handler is None or self._handler.client is not client:
+                self._handler = open_handler(self.collection_name, client)
+            return self._handler
+
+    async def _setup(self, max_concurrent, llm_concurrency):
+        self._queries = asyncio.Semaphore(max_concurrent)
+        self._llm_slots = asyncio.Semaphore(llm_concurrency)
+        self._reconnecting = asyncio.Lock()
+        if not isinstance(self.handler.client, EmbeddedClient):
+            await self._connect_weaviate()
+
+    async def _connect_weaviate(self):
+        import weaviate
+        r = get_resources()
+        client = weaviate.use_async_with_local(host=r.host, port=r.http_port, grpc_port=r.grpc_port)
+        await client.connect()
+        self._weaviate, self._collection = client, client.collections.use(self.collection_name)
+
+    @staticmethod
+    async def _healthy(client) -> bool:
+        try:
+            return client.is_connected() and await client.is_ready()
+        except Exception:
+            return False
+
+    async def _reconnect(self, failed):
+        async with self._reconnecting:
+            if self._weaviate is not failed:            # another query already reconnected
+                return
+            print("🔌 Async Weaviate connection lost — reconnecting …")
+            try:
+                await failed.close()
+            except Exception:
+                pass
+            await self._connect_weaviate()
+
+    async def _query(self, method: str, **kwargs):
+        """collection.query.<method>(**kwargs); on a dead connection, reconnect and retry once."""
+        client = self._weaviate
+        try:
+            return await getattr(self._collection.query, method)(**kwargs)
+        except Exception:
+            if await self._healthy(client):
+                raise                                   # a real query error, not the connection
+            await self._reconnect(client)
+        return await getattr(self._collection.query, method)(**kwargs)
+
+    def _run(self, coro, timeout: float = None):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def _llm_client(self):
+        if self._llm is None:
+            import openai
+            hf_key = os.getenv("HUGGINGFACE_API_KEY")
+            if not hf_key:
+                raise RuntimeError("HUGGINGFACE_API_KEY not set")
+            self._llm = openai.AsyncOpenAI(base_url=llm_base_url(), api_key=hf_key)
+        return self._llm
+
+    async def _stage(self, name: str, awaitable, timings: dict):
+        t0 = time.perf_counter()
+        try:
+            with get_tracer().span(f"query.{name}"):
+                return await asyncio.wait_for(awaitable, self.timeouts[name])
+        except asyncio.TimeoutError:
+            raise StageTimeout(name, self.timeouts[name]) from None
+        finally:
+            timings[name] = time.perf_counter() - t0
+
+    # ---------------- stages ----------------
+    def _embed(self, query: str) -> list[float]:
+        vector = self.embedder.encode([query])[0]
+        return vector.tolist() if hasattr(vector, "tolist") else list(vector)
+
+    async def _near_vector(self, vector, k, filters):
+        if self._collection is None:
+            return await asyncio.to_thread(lambda: self.handler.near_vector(vector, k, filters))
+        import weaviate.classes as wvc
+        from weaviate_handler import HIT_PROPERTIES, WeaviateHandler, _as_filter
+        result = await self._query(
+            "near_vector", near_vector=vector, limit=k, filters=_as_filter(filters),
+            return_properties=HIT_PROPERTIES, return_metadata=wvc.query.MetadataQuery(distance=True))
+        return [WeaviateHandler._to_hit(o) for o in result.objects]
+
+    async def _bm25(self, query, k, filters):
+        if self._collection is None:
+            return await asyncio.to_thread(lambda: self.handler.bm25(query, k, filters))
+        import weaviate.classes as wvc
+        from weaviate_handler import HIT_PROPERTIES, WeaviateHandler, _as_filter
+        result = await self._query(
+            "bm25", query=query, query_properties=["text"], limit=k, filters=_as_filter(filters),
+            return_properties=HIT_PROPERTIES, return_metadata=wvc.query.MetadataQuery(score=True))
+        return [{**WeaviateHandler._to_hit(o), "distance": None, "bm25_score": o.metadata.score}
+                for o in result.objects]
+
+    async def _prepare(self, query, k, hybrid, filters, reranker, max_tokens, timings):
+        fetch, per_leg = fetch_sizes(k, hybrid, reranker is not None, self.candidates)
+        keyword = asyncio.ensure_future(self._stage("bm25", self._bm25(query, per_leg, filters), timings)) \
+            if hybrid else None
+        try:
+            vector = await self._stage("embed", asyncio.to_thread(self._embed, query), timings)
+            hits = await self._stage("retrieve", self._near_vector(vector, per_leg, filters), timings)
+            if keyword is not None:
+                hits = reciprocal_rank_fusion(hits, await keyword, fetch)
+        finally:
+            if keyword is not None and not keyword.done():
+                keyword.cancel()
+        if reranker is not None:
+            hits = await self._stage("rerank", asyncio.to_thread(reranker.rerank, query, hits, k), timings)
+
+        prepared = {"vector": vector, "hits": hits, "timings": timings, "max_tokens": max_tokens,
+                    "sources": sorted({f"{h['file_name']} page {h['page']}" for h in hits})}
+        cached = self.answer_cache.lookup(vector, hits, models_id(), max_tokens)
+        if cached:
+            return {**prepared, **cached, "cached": True, "context": None}
+
+        try:
+            # copies: a timed-out packing thread keeps running and must not touch our hits;
+            # self.handler is resolved there too, as it may health-check (block on) the client
+            copies = [dict(h) for h in hits]
+            context, strategy = await self._stage(
+                "summarize", asyncio.to_thread(lambda: self.packer.pack(copies, self.handler)), timings)
+        except StageTimeout:
+            context, strategy = self.packer.pack(hits)        # no summaries: trim or drop what doesn't fit
+            strategy += " · summaries timed out"
+        return {**prepared, "context": context, "strategy": strategy, "cached": False}
+
+    # ---------------- async API ----------------
+    async def aprepare(self, query: str, k: int = 3, hybrid: bool = False,
+                       filters: dict = None, reranker=None, max_tokens: int = 300) -> dict:
+        """
+        Everything up to generation. Returns {"vector", "hits", "sources", "timings", "max_tokens",
+        "cached", "context", "strategy", "trace", "events"} plus "answer" when the answer cache
+        already had one for this max_tokens (astream_answer then generates with the same limit).
+        """
+        async with self._queries:
+            with get_tracer().trace("query", k=k, hybrid=hybrid) as trace:
+                result = await self._prepare(query, k, hybrid, filters, reranker, max_tokens, {})
+            return {**result, "trace": trace.breakdown(), "events": trace.events}
+
+    async def aanswer(self, query: str, k: int = 3, hybrid: bool = False, filters: dict = None,
+                      reranker=None, max_tokens: int = 300, temperature: float = 0.2) -> dict:
+        """aprepare + generation; the answer is stored in the answer cache."""
+        async with self._queries:
+            start = time.perf_counter()
+            with get_tracer().trace("query", k=k, hybrid=hybrid) as trace:
+                result = await self._prepare(query, k, hybrid, filters, reranker, max_tokens, {})
+                if not result["cached"]:
+                    async with self._llm_slots:
+                        result["answer"] = await self._stage(
+                            "generate", agenerate_answer_hf_api(query, result["context"], self._llm_client(),
+                                                                max_tokens, temperature), result["timings"])
+                    self.answer_cache.store(result["vector"], result["hits"], result["answer"],
+                                            result["sources"], result["strategy"], models_id(), max_tokens)
+            result["timings"]["total"] = time.perf_counter() - start
+            return {**result, "trace": trace.breakdown(), "events": trace.events}
+
+    async def astream_answer(self, query: str, prepared: dict, temperature: float = 0.2):
+        """
+        Stream the answer for an aprepare() result, piece by piece. Holds an LLM slot for
+        the whole stream and enforces the "generate" timeout across it, with the max_tokens
+        aprepare() looked the answer cache up with. When the stream ends, prepared["answer"]
+        is set; only an answer that passed the completeness check goes into the answer cache
+        (a truncated one would be served again).
+        """
+        limit = self.timeouts["generate"]
+        outcome, start = {}, time.perf_counter()
+        async with self._llm_slots:
+            pieces = astream_answer_hf_api(query, prepared["context"], self._llm_client(),
+                                           prepared["max_tokens"], temperature, outcome)
+            deadline = self._loop.time() + limit
+            try:
+                while True:
+                    try:
+                        piece = await asyncio.wait_for(pieces.__anext__(), max(deadline - self._loop.time(), 0))
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        raise StageTimeout("generate", limit) from None
+                    yield piece
+            finally:
+                await pieces.aclose()
+                elapsed = time.perf_counter() - start
+                prepared["timings"]["generate"] = elapsed
+                get_tracer().record("query.generate", elapsed)
+        prepared["answer"] = outcome["answer"]
+        if outcome["complete"]:
+            self.answer_cache.store(prepared["vector"], prepared["hits"], outcome["answer"],
+                                    prepared["sources"], prepared["strategy"], models_id(), prepared["max_tokens"])
+
+    # ---------------- sync wrappers ----------------
+    def prepare(self, query: str, k: int = 3, **kwargs) -> dict:
+        return self._run(self.aprepare(query, k, **kwargs))
+
+    def answer(self, query: str, k: int = 3, **kwargs) -> dict:
+        return self._run(self.aanswer(query, k, **kwargs))
+
+    def stream_answer(self, query: str, prepared: dict, **kwargs):
+        """astream_answer as a plain generator (for st.write_stream); every piece is awaited on the engine loop."""
+        pieces = self.astream_answer(query, prepared, **kwargs)
+        try:
+            while True:
+                try:
+                    yield self._run(pieces.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            # Consumer stopped early (Streamlit rerun): release the LLM slot
+            self._run(pieces.aclose(), timeout=10)
+
+    def close(self):
+        async def _close():
+            for client in (self._weaviate, self._llm):
+                if client is not None:
+                    await client.close()
+        self._run(_close(), timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
@@ -0,0 +1,180 @@
+# batch_ingest.py
+"""
+Ingest many PDFs at once.
+
+Extraction + chunking (CPU-bound, GIL-limited) run in a process pool; the
+resulting chunks are funnelled into a shared pool of embedding threads and a
+single insert worker. Files already in the collection are skipped with one
+bulk query up front, so a file whose embed/insert only partly succeeded is
+rolled back rather than left behind half-indexed.
+
+    python batch_ingest.py <dir-or-pdf> [more ...] [--processes N] [--embed-workers N]
+"""
+import os, glob, time, queue, argparse, threading, warnings, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from pipeline import prepare_chunks, enqueue_for_summary
+from incremental import sync_document, format_sync_report
+from answer_cache import get_answer_cache
+
+warnings.filterwarnings("ignore", category=DeprecationWarning,
+                        message=".*swigvarlink.*")
+
+_DONE = object()
+
+
+def collect_pdfs(paths) -> list[str]:
+    """Expand directories into the PDFs they contain; keep explicit files as given."""
+    pdfs = []
+    for path in paths:
+        if os.path.isdir(path):
+            pdfs.extend(sorted(glob.glob(os.path.join(path, "**", "*.pdf"), recursive=True)))
+        else:
+            pdfs.append(path)
+    return pdfs
+
+
+def ingest_many(pdf_paths, handler, embedder,
+                chunk_size: int = 512, chunk_overlap: int = 64, min_tokens: int = 50,
+                processes: int = None, embed_workers: int = 2, embed_batch: int = 64,
+                update_existing: bool = False, summary_queue=None, tables: bool = None, log=print) -> dict:
+    """
+    Ingest a list of PDFs. Returns {"files": {file_name: chunks|"skipped"|"error: …"}, "wall_s": float}.
+    With update_existing, already indexed files are re-synced through their content hashes
+    instead of being skipped. tables: extract tables as row text (default: EXTRACT_TABLES env).
+    """
+    start = time.perf_counter()
+    by_name = {}
+    for path in pdf_paths:
+        by_name.setdefault(os.path.basename(path), path)   # file_name is the identity in the collection
+
+    existing = handler.existing_file_names(list(by_name))
+    report = {name: "skipped" for name in existing}
+    todo = [path for name, path in by_name.items() if name not in existing]
+    if existing and update_existing:
+        for name in sorted(existing):
+            sync = sync_document(by_name[name], handler, embedder,
+                                 chunk_size, chunk_overlap, min_tokens, summary_queue, tables)
+            report[name] = f"synced ({sync['embedded']} embedded, {sync['deleted']} deleted)"
+            log(f"♻️  {format_sync_report(sync)}")
+    elif existing:
+        log(f"⚠️  Already indexed, skipping: {', '.join(sorted(existing))}")
+    if not todo:
+        return {"files": report, "wall_s": round(time.perf_counter() - start, 3)}
+
+    # Single insert worker: the batch API already parallelises internally.
+    insert_q = queue.Queue(maxsize=embed_workers * 2)
+    inserted, expected, failed_chunks = {}, {}, {}
+    insert_errors = []
+    counts_lock = threading.Lock()      # failures are counted from the embed threads too
+
+    def count_failed(name, n, error):
+        with counts_lock:
+            failed_chunks[name] = failed_chunks.get(name, 0) + n
+            insert_errors.append(error)
+
+    def insert_worker():
+        while (item := insert_q.get()) is not _DONE:
+            texts, vectors, metas = item
+            name = metas[0]["file_name"]
+            try:
+                failed = handler.insert_chunks(texts, vectors, metas, skip_existing=False)
+                inserted[name] = inserted.get(name, 0) + len(texts) - len(failed)
+                if failed:
+                    count_failed(name, len(failed), failed[0][1])
+                if summary_queue is not None:
+                    enqueue_for_summary(summary_queue, metas, failed)
+            except Exception as e:
+                count_failed(name, len(texts), e)
+
+    def embed_and_queue(texts, metas):
+        try:
+            vectors = embedder.encode(texts)
+        except Exception as e:
+            count_failed(metas[0]["file_name"], len(texts), e)
+            return
+        insert_q.put((texts, vectors, metas))     # blocks when the inserter falls behind
+
+    inserter = threading.Thread(target=insert_worker, name="batch-insert", daemon=True)
+    inserter.start()
+
+    try:
+        # spawn, not fork: the parent already holds client sockets, SQLite handles and thread locks
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as procs, \
+             ThreadPoolExecutor(max_workers=embed_workers) as embed_pool:
+            futures = {procs.submit(prepare_chunks, path, chunk_size, chunk_overlap, min_tokens, tables): path
+                       for path in todo}
+            embed_futures = []
+            for fut in as_completed(futures):
+                name = os.path.basename(futures[fut])
+                try:
+                    file_name, texts, metas = fut.result()
+                except Exception as e:
+                    report[name] = f"error: {e}"
+                    log(f"❌ {name}: extraction failed: {e}")
+                    continue
+                log(f"✂️ {file_name}: {len(texts)} chunks")
+                inserted.setdefault(file_name, 0)
+                expected[file_name] = len(texts)
+                for i in range(0, len(texts), embed_batch):
+                    embed_futures.append(embed_pool.submit(
+                        embed_and_queue, texts[i:i + embed_batch], metas[i:i + embed_batch]))
+
+            for fut in embed_futures:
+                try:
+                    fut.result()
+                except Exception as e:
+                    insert_errors.append(e)
+    finally:
+        insert_q.put(_DONE)
+        inserter.join()
+
+    if insert_errors:
+        log(f"❌ {len(insert_errors)} embed/insert batches failed; first error: {insert_errors[0]}")
+    report.update(inserted)
+    # A partly indexed file would pass the skip check on the next run: remove it so it gets retried
+    for name, n_failed in failed_chunks.items():
+        removed = handler.delete_chunks_from(name, 0)
+        report[name] = f"error: {n_failed}/{expected.get(name, n_failed)} chunks failed, rolled back"
+        log(f"❌ {name}: {n_failed} chunks failed to embed/insert, removed {removed} partial chunks")
+    cache = get_answer_cache()
+    for name in inserted:
+        cache.invalidate_file(name)
+    return {"files": report, "wall_s": round(time.perf_counter() - start, 3)}
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from resources import get_resources
+    from embedded_store import open_handler
+    from weaviate_handler import INDEX_PROFILES
+    from local_embedder import make_embedder
+    from embedding_cache import with_cache
+    from summary_worker import SummaryQueue
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Ingest a directory or list of PDFs into Weaviate.")
+    parser.add_argument("paths", nargs="+", help="PDF files and/or directories")
+    parser.add_argument("--collection", default="LectureSlides")
+    parser.add_argument("--processes", type=int, default=None, help="extraction processes (default: CPU count)")
+    parser.add_argument("--embed-workers", type=int, default=2)
+    parser.add_argument("--index-profile", default=None, choices=sorted(INDEX_PROFILES),
+                        help="HNSW/compression profile (applied at creation, mutable parts updated otherwise)")
+    parser.add_argument("--update", action="store_true", help="re-sync already indexed files instead of skipping them")
+    parser.add_argument("--tables", action="store_true", default=None,
+                        help="extract detected tables as row text (default: EXTRACT_TABLES env)")
+    parser.add_argument("--presummarize", action="store_true",
+                        help="queue new chunks for summary_worker.py")
+    args = parser.parse_args()
+
+    pdfs = collect_pdfs(args.paths)
+    print(f"📚 {len(pdfs)} PDFs found")
+    handler = open_handler(args.collection, get_resources().vector_client(), index_profile=args.index_profile)
+    result = ingest_many(pdfs, handler, with_cache(make_embedder()),
+                         processes=args.processes, embed_workers=args.embed_workers,
+                         update_existing=args.update, tables=args.tables,
+                         summary_queue=SummaryQueue() if args.presummarize else None)
+
+    for name, status in sorted(result["files"].items()):
+        print(f"  {name}: {status}")
+    print(f"⏱️  Done in {result['wall_s']:.2f}s")
@@ -0,0 +1,80 @@
+# bench_chunking.py
+"""
+Built-in chunker vs LangChain's RecursiveCharacterTextSplitter.
+
+    python bench_chunking.py [pdf ...] [--synthetic-pages 500] [--runs 3]
+
+For every PDF (test.pdf and a seeded synthetic one by default) the cleaned pages
+are chunked by both splitters with the pipeline's settings. The script prints
+chunks/s and MB/s of each, and whether the chunks (text, page, start offset)
+are identical. The import cost of each module is measured in a fresh interpreter.
+Needs langchain-text-splitters installed; the app itself no longer does.
+"""
+import os, sys, time, argparse, tempfile, subprocess
+
+from pdf_extraction import extract_text_from_pdf
+from pipeline import clean_page_text
+from chunking import TextChunker, DEFAULT_SEPARATORS
+
+CHUNK_SIZE = 512
+CHUNK_OVERLAP = 64
+
+
+def import_ms(statement: str) -> float:
+    code = f"import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return 1000 * float(out.stdout.strip().splitlines()[-1])
+
+
+def best_of(runs, fn):
+    best, result = float("inf"), None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdfs", nargs="*", default=["test.pdf"])
+    parser.add_argument("--synthetic-pages", type=int, nargs="*", default=[500])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    langchain = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                                               separators=DEFAULT_SEPARATORS, add_start_index=True)
+    native = TextChunker(CHUNK_SIZE, CHUNK_OVERLAP)
+
+    pdfs = list(args.pdfs)
+    if args.synthetic_pages:
+        from benchmark import synthetic_pdf
+        workdir = tempfile.mkdtemp(prefix="bench_chunking_")
+        for pages in args.synthetic_pages:
+            pdfs.append(os.path.join(workdir, f"synthetic_{pages}p.pdf"))
+            synthetic_pdf(pdfs[-1], pages)
+
+    print(f"import: langchain {import_ms('from langchain_text_splitters import RecursiveCharacterTextSplitter'):.0f} ms,"
+          f" chunking {import_ms('import chunking'):.0f} ms")
+    print(f"{'pdf':>22} {'chunks':>7} {'langchain c/s':>14} {'native c/s':>11} {'MB/s':>7} {'speed-up':>9} {'identical':>10}")
+    for pdf in pdfs:
+        pages = [clean_page_text(p["text"]) for p in extract_text_from_pdf(pdf)]
+        metas = [{"page": i + 1} for i in range(len(pages))]
+        lc_s, lc_docs = best_of(args.runs, lambda: langchain.create_documents(pages, metadatas=metas))
+        nat_s, chunks = best_of(args.runs, lambda: native.create_chunks(pages, metas))
+
+        expected = [(d.page_content, d.metadata["page"], d.metadata["start_index"]) for d in lc_docs]
+        got = [(c.page_content, c.metadata["page"], c.start) for c in chunks]
+        # LangChain's start_index is a text.find() from the previous chunk, so only compare offsets
+        # where that lookup is unambiguous; the texts must always match
+        same_text = [e[:2] for e in expected] == [g[:2] for g in got]
+        offsets_ok = all(e[2] == g[2] or pages[g[1] - 1].count(g[0]) > 1 for e, g in zip(expected, got))
+        mb = sum(map(len, pages)) / 1e6
+        print(f"{os.path.basename(pdf)[-22:]:>22} {len(chunks):>7} {len(lc_docs) / lc_s:>14.0f} "
+              f"{len(chunks) / nat_s:>11.0f} {mb / nat_s:>7.1f} {lc_s / nat_s:>8.1f}x "
+              f"{'yes' if same_text and offsets_ok else 'NO':>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# bench_embedders.py
+"""
+Compare the HF router embedder with the local ONNX embedder on test.pdf.
+
+    python bench_embedders.py [pdf_path] [--threads N] [--runs R]
+
+Prints chunks/s for each backend and the cosine agreement between them.
+"""
+import argparse, time
+import numpy as np
+from dotenv import load_dotenv
+
+from pdf_extraction import extract_text_as_documents
+from chunking import chunk_texts
+from hf_embedder import HFEmbedderAPI
+from local_embedder import LocalONNXEmbedder
+
+load_dotenv()
+
+CHUNK_SIZE = 512
+CHUNK_OVERLAP = 64
+
+
+def load_chunks(pdf_path):
+    docs = extract_text_as_documents(pdf_path)
+    cleaned = [d.replace("\n", " ").replace("  ", " ").strip() for d in docs]
+    return [d.page_content for d in chunk_texts(cleaned, CHUNK_SIZE, CHUNK_OVERLAP)]
+
+
+def timed(embedder, chunks, runs):
+    best, vectors = float("inf"), None
+    for _ in range(runs):
+        start = time.perf_counter()
+        vectors = embedder.encode(chunks)
+        best = min(best, time.perf_counter() - start)
+    return best, np.asarray(vectors, dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdf_path", nargs="?", default="test.pdf")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--skip-api", action="store_true", help="only benchmark local backends")
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.pdf_path)
+    print(f"📄 {args.pdf_path}: {len(chunks)} chunks")
+
+    backends = {
+        "onnx-int8": LocalONNXEmbedder(quantized=True, num_threads=args.threads),
+        "onnx-fp32": LocalONNXEmbedder(quantized=False, num_threads=args.threads),
+    }
+    if not args.skip_api:
+        backends["hf-api"] = HFEmbedderAPI()
+
+    results = {}
+    for name, embedder in backends.items():
+        embedder.encode(chunks[:2])                     # warm-up: session init / connection
+        seconds, vectors = timed(embedder, chunks, args.runs)
+        results[name] = vectors
+        print(f"{name:>10}: {seconds:7.3f}s  {len(chunks) / seconds:8.1f} chunks/s")
+
+    reference = results.get("hf-api", results["onnx-fp32"])
+    for name, vectors in results.items():
+        cos = (vectors * reference).sum(axis=1) / (
+            np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference, axis=1))
+        print(f"{name:>10}: mean cosine vs reference {cos.mean():.4f} (min {cos.min():.4f})")
+
+
+if __name__ == "__main__":
+    main()
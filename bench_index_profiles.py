@@ -0,0 +1,104 @@
+# bench_index_profiles.py
+"""
+Recall vs latency of each HNSW index profile on our own data.
+
+    python bench_index_profiles.py [pdf ...] [--profiles fast-ingest high-recall low-memory]
+                                   [--k 10] [--queries 200] [--scale 1]
+
+The PDFs are chunked and embedded once; every profile gets its own throw-away
+collection with the same vectors. Queries are held-out chunk prefixes, and
+ground truth is an exact NumPy cosine search over the whole corpus.
+--scale N adds N-1 jittered copies of every vector, to see how the profiles
+behave once the corpus is larger than a handful of decks (PQ only starts
+compressing after `training_limit` objects).
+"""
+import argparse, time
+import numpy as np
+from dotenv import load_dotenv
+
+from pipeline import prepare_chunks
+from local_embedder import make_embedder
+from embedding_cache import with_cache
+from resources import get_resources
+from weaviate_handler import INDEX_PROFILES, WeaviateHandler
+
+load_dotenv()
+
+
+def load_corpus(pdf_paths, scale, seed=0):
+    texts, metas = [], []
+    for path in pdf_paths:
+        _, file_texts, file_metas = prepare_chunks(path)
+        texts += file_texts
+        metas += file_metas
+    vectors = np.asarray(with_cache(make_embedder()).encode(texts), dtype=np.float32)
+
+    rng = np.random.default_rng(seed)
+    all_texts, all_metas, all_vectors = list(texts), list(metas), [vectors]
+    for copy in range(1, scale):
+        jitter = vectors + rng.normal(0, 0.02, vectors.shape).astype(np.float32)
+        all_vectors.append(jitter / np.linalg.norm(jitter, axis=1, keepdims=True))
+        all_texts += texts
+        all_metas += [{**m, "file_name": f"copy{copy}-{m['file_name']}"} for m in metas]
+    return all_texts, all_metas, np.vstack(all_vectors)
+
+
+def make_queries(texts, n, seed=1):
+    # First sentence (or 200 chars) of random chunks: related to, but not identical with, stored text
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(texts), size=min(n, len(texts)), replace=False)
+    return [texts[i].split(". ")[0][:200] for i in picks]
+
+
+def run_profile(name, client, texts, metas, vectors, queries, qvecs, truth, k):
+    collection = f"BenchIndex_{name.replace('-', '_')}"
+    if collection in client.collections.list_all():
+        client.collections.delete(collection)
+    handler = WeaviateHandler(collection, client, index_profile=name)
+    try:
+        start = time.perf_counter()
+        handler.insert_chunks(texts, vectors, metas, skip_existing=False)
+        ingest_s = time.perf_counter() - start
+
+        latencies, recalls = [], []
+        for qvec, expected in zip(qvecs, truth):
+            t0 = time.perf_counter()
+            hits = handler.near_vector(qvec.tolist(), k)
+            latencies.append(time.perf_counter() - t0)
+            found = {(h["file_name"], h["text"]) for h in hits}
+            recalls.append(len(found & expected) / len(expected))
+        lat = 1000 * np.asarray(latencies)
+        return {"profile": name, "ingest_s": ingest_s, "recall": float(np.mean(recalls)),
+                "p50_ms": float(np.percentile(lat, 50)), "p95_ms": float(np.percentile(lat, 95))}
+    finally:
+        client.collections.delete(collection)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdfs", nargs="*", default=["test.pdf"])
+    parser.add_argument("--profiles", nargs="+", default=list(INDEX_PROFILES))
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--scale", type=int, default=1)
+    args = parser.parse_args()
+
+    texts, metas, vectors = load_corpus(args.pdfs, args.scale)
+    queries = make_queries(texts, args.queries)
+    qvecs = np.asarray(with_cache(make_embedder()).encode(queries), dtype=np.float32)
+
+    # Exact top-k by cosine similarity (vectors are L2-normalised)
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(qvecs, axis=1)[:, None]
+    top = np.argsort(-(qvecs @ vectors.T) / norms, axis=1)[:, :args.k]
+    truth = [{(metas[i]["file_name"], texts[i]) for i in row} for row in top]
+    print(f"📄 {len(texts)} vectors, {len(queries)} queries, k={args.k}")
+
+    client = get_resources().weaviate()
+    print(f"{'profile':>14} {'ingest s':>9} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for name in args.profiles:
+        r = run_profile(name, client, texts, metas, vectors, queries, qvecs, truth, args.k)
+        print(f"{r['profile']:>14} {r['ingest_s']:9.2f} {r['recall']:9.3f} {r['p50_ms']:8.2f} {r['p95_ms']:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# bench_reranker.py
+"""
+Latency cost of cross-encoder reranking per candidate count.
+
+    python bench_reranker.py [pdf_path] [--candidates 10 20 40 80] [--threads N]
+
+First-stage candidates come from a brute-force NumPy search over the local ONNX
+embeddings of test.pdf (no Weaviate needed). For each candidate count the
+script prints the cold rerank latency (empty score cache) and the warm one
+(same question again, all pair scores cached).
+"""
+import argparse, time
+import numpy as np
+from dotenv import load_dotenv
+
+from bench_embedders import load_chunks
+from local_embedder import LocalONNXEmbedder
+from reranker import CrossEncoderReranker
+
+load_dotenv()
+
+QUERIES = [
+    "Who is Mr. Higgins?",
+    "What is the main argument of the lecture?",
+    "Which examples are used to explain the concept?",
+    "What happens at the end?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdf_path", nargs="?", default="test.pdf")
+    parser.add_argument("--candidates", type=int, nargs="+", default=[10, 20, 40, 80])
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.pdf_path)
+    embedder = LocalONNXEmbedder(num_threads=args.threads)
+    matrix = embedder.encode(chunks)                         # rows are L2-normalised
+    queries = embedder.encode(QUERIES)
+    reranker = CrossEncoderReranker(num_threads=args.threads)
+    reranker.rerank("warm-up", [{"uuid": "w", "text": chunks[0]}], 1)
+    print(f"📄 {args.pdf_path}: {len(chunks)} chunks, {len(QUERIES)} queries")
+
+    print(f"{'candidates':>10} {'cold ms':>9} {'warm ms':>9} {'ms/pair':>8}")
+    for n in args.candidates:
+        cold, warm = [], []
+        for query, qvec in zip(QUERIES, queries):
+            top = np.argsort(-(matrix @ qvec))[:n]
+            hits = [{"uuid": str(i), "text": chunks[i]} for i in top]
+            reranker._cache.clear()
+            for bucket in (cold, warm):
+                start = time.perf_counter()
+                reranker.rerank(query, hits, args.k)
+                bucket.append(time.perf_counter() - start)
+        cold_ms, warm_ms = 1000 * np.mean(cold), 1000 * np.mean(warm)
+        print(f"{n:>10} {cold_ms:9.1f} {warm_ms:9.2f} {cold_ms / n:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# bench_startup.py
+"""
+Cold-start import cost of the entry points, measured with `python -X importtime`.
+
+    python bench_startup.py [--runs 5] [--top 10] [--out bench_results/startup_<commit>.json]
+
+Every target is imported in a fresh interpreter `--runs` times; the best total
+is reported together with the heaviest packages it pulled in. Heavy
+dependencies that are loaded at import (instead of on first use) are listed,
+and a query-only entry point that drags in the ingestion stack fails the check.
+app.py is a Streamlit script, so only its top-level imports are measured.
+"""
+import os, re, ast, sys, json, argparse, subprocess
+
+from benchmark import git_commit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HEAVY = ["weaviate", "openai", "fitz", "pymupdf", "onnxruntime", "langchain", "langchain_text_splitters",
+         "transformers", "streamlit"]
+INGESTION = ["pipeline", "pdf_extraction", "chunking", "incremental", "batch_ingest", "fitz", "pymupdf"]
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+
+def app_imports() -> str:
+    """app.py's module-level import statements, without running the Streamlit script."""
+    with open(os.path.join(HERE, "app.py")) as f:
+        tree = ast.parse(f.read())
+    return "; ".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+TARGETS = {
+    "main": ("import main", True),                     # (statement, query-only: no ingestion stack allowed)
+    "api_server": ("import api_server, main", True),
+    "async_engine": ("import async_engine", True),
+    "app (imports)": (app_imports(), False),
+    "pipeline": ("import pipeline", False),
+}
+
+
+def importtime(statement: str):
+    """(total ms, {package: cumulative ms}, loaded modules) for one fresh interpreter."""
+    code = f"{statement}\nimport sys, json; print(json.dumps(sorted(sys.modules)))"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=HERE,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    total, packages = 0, {}
+    for _, cumulative_us, indent, name in _LINE.findall(proc.stderr):
+        if not indent:                                  # top level: counted once in the total
+            total += int(cumulative_us)
+        root = name.split(".")[0]
+        if name == root:
+            packages[root] = max(packages.get(root, 0), int(cumulative_us) / 1000)
+    return total / 1000, packages, set(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    results, failed = {}, False
+    for name, (statement, query_only) in TARGETS.items():
+        try:
+            runs = [importtime(statement) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{name:>14}: import failed ({e})")
+            results[name] = {"error": str(e)}
+            continue
+        total, packages, modules = min(runs, key=lambda r: r[0])
+        heavy = [m for m in HEAVY if m in modules]
+        ingestion = [m for m in INGESTION if m in modules]
+        top = sorted(packages.items(), key=lambda kv: -kv[1])[:args.top]
+        results[name] = {"total_ms": round(total, 1), "modules": len(modules), "heavy_loaded": heavy,
+                         "ingestion_loaded": ingestion, "query_only": query_only,
+                         "top_packages_ms": {k: round(v, 1) for k, v in top}}
+        print(f"{name:>14}: {total:7.1f} ms, {len(modules):4d} modules, heavy: {', '.join(heavy) or '-'}")
+        print(f"{'':>16}" + ", ".join(f"{k} {v:.0f}" for k, v in top[:6]))
+        if query_only and ingestion:
+            failed = True
+            print(f"{'':>16}❌ query-only entry point imports the ingestion stack: {', '.join(ingestion)}")
+
+    commit = git_commit()
+    out = args.out or os.path.join(HERE, "bench_results", f"startup_{commit}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"meta": {"commit": commit, "python": sys.version.split()[0], "runs": args.runs},
+                   "targets": results}, f, indent=2)
+    print(f"💾 {out}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
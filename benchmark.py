@@ -0,0 +1,373 @@
+# benchmark.py
+"""
+Offline, reproducible benchmark of ingestion and querying.
+
+    python benchmark.py [--pdfs test.pdf] [--synthetic-pages 50 500] [--queries 200]
+                        [--concurrency 1 4 16] [--embed-ms 40] [--summary-ms 300] [--chat-ms 800]
+                        [--out bench_results/<commit>.json] [--compare old.json]
+
+No network and no Weaviate: the HF embedding, summarisation and chat endpoints
+are replaced by local stand-in HTTP servers with a fixed, configurable latency
+(pointed at through HF_ROUTER_URL / SUMMARY_API_URL / LLM_BASE_URL), and chunks
+go to the embedded vector store in a temporary directory. The real clients,
+pools, retries, pipeline and query engine are what gets measured.
+
+Ingestion (per PDF): pages/s and chunks/s for extraction, chunking, embedding
+and insertion run one after the other, then the streaming pipeline end to end.
+Extraction is also timed with worker processes, plain and layout-aware.
+Synthetic PDFs of the requested page counts are generated with PyMuPDF from a
+seeded vocabulary, so every run sees the same text.
+
+Query: p50/p95/p99 latency and QPS of full answers (embed → search → pack →
+generate) at each concurrency level, with the answer cache disabled.
+
+Results are written as JSON; --compare prints the relative change of every
+throughput / latency figure against an earlier result file.
+"""
+import os, sys, json, time, zlib, random, argparse, platform, tempfile, threading, subprocess
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+EMBED_DIM = 384           # all-MiniLM-L6-v2
+
+
+# ---------------- stand-in services ----------------
+def fake_embedding(text: str) -> list[float]:
+    """Hashed bag of words, L2-normalised: deterministic, and texts sharing words end up close."""
+    v = np.zeros(EMBED_DIM, dtype=np.float32)
+    for word in text.lower().split():
+        h = zlib.crc32(word.encode("utf-8"))
+        v[h % EMBED_DIM] += 1.0 if h & 1 else -1.0
+    norm = float(np.linalg.norm(v))
+    return (v / norm if norm else v).round(5).tolist()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = {"embed_ms": 40.0, "embed_item_ms": 0.5, "summary_ms": 300.0, "chat_ms": 800.0}
+    calls = {"embed": 0, "summary": 0, "chat": 0}
+    lock = threading.Lock()
+
+    def _count(self, name):
+        with self.lock:
+            self.calls[name] += 1
+
+    def _send(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if self.path.endswith("/feature-extraction"):
+            self._count("embed")
+            inputs = body["inputs"] if isinstance(body["inputs"], list) else [body["inputs"]]
+            time.sleep((self.latency["embed_ms"] + self.latency["embed_item_ms"] * len(inputs)) / 1000)
+            return self._send([fake_embedding(t) for t in inputs])
+        if self.path.startswith("/summarize"):
+            self._count("summary")
+            time.sleep(self.latency["summary_ms"] / 1000)
+            inputs = body["inputs"] if isinstance(body["inputs"], list) else [body["inputs"]]
+            return self._send([{"summary_text": " ".join(t.split()[:40]) + "."} for t in inputs])
+        if self.path.endswith("/chat/completions"):
+            self._count("chat")
+            time.sleep(self.latency["chat_ms"] / 1000)
+            return self._chat(body)
+        self.send_error(404)
+
+    def _chat(self, body):
+        prompt = " ".join(m["content"] for m in body.get("messages", []))
+        answer = "According to the provided context, " + " ".join(prompt.split()[-30:]) + "."
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for word in answer.split(" "):
+                chunk = {"id": "bench", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                         "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+            return
+        self._send({"id": "bench", "object": "chat.completion", "created": 0, "model": body["model"],
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": answer}}],
+                    "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(answer) // 4,
+                              "total_tokens": (len(prompt) + len(answer)) // 4}})
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def start_stand_ins(latency: dict) -> str:
+    """Start the stand-in server on a free local port; returns its base URL."""
+    StandInHandler.latency = {**StandInHandler.latency, **latency}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stand-ins", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def configure_env(base_url: str, store_path: str):
+    # Must run before the repo modules are imported (some read their settings at import time)
+    os.environ.update({
+        "HF_ROUTER_URL": base_url,
+        "SUMMARY_API_URL": f"{base_url}/summarize",
+        "LLM_BASE_URL": f"{base_url}/v1",
+        "HUGGINGFACE_API_KEY": os.getenv("HUGGINGFACE_API_KEY", "offline-benchmark"),
+        "VECTOR_BACKEND": "embedded",
+        "VECTOR_STORE_PATH": store_path,
+        "EMBEDDER_BACKEND": "api",
+        "ANSWER_CACHE_THRESHOLD": "2",       # cosine similarity never reaches 2: every query is a miss
+        "HF_HUB_OFFLINE": "1",               # tokenizers from the local HF cache only, no download retries
+    })
+
+
+# ---------------- synthetic PDFs ----------------
+WORDS = ("model data system query vector index page chunk summary answer lecture student theory method "
+         "result analysis network memory latency cache batch token context search document section table "
+         "figure example process function value error signal energy market policy history language").split()
+
+
+def synthetic_pdf(path: str, pages: int, seed: int = 0):
+    """A `pages`-page PDF of seeded pseudo-text (a heading and ~350 words per page)."""
+    import fitz
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for n in range(pages):
+        page = doc.new_page()
+        paragraphs = []
+        for _ in range(rng.randint(3, 5)):
+            sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 18))).capitalize() + "."
+                         for _ in range(rng.randint(3, 6))]
+            paragraphs.append(" ".join(sentences))
+        page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50),
+                            f"Section {n + 1}\n\n" + "\n\n".join(paragraphs), fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+# ---------------- measurements ----------------
+def _rate(n, seconds):
+    return round(n / seconds, 2) if seconds > 0 else None
+
+
+def bench_ingest(pdf_path, embedder, client, batch: int = 64, extract_workers: int = 4):
+    """Returns (report, chunk texts); the collection is left filled for the query benchmark."""
+    from pdf_extraction import extract_text_from_pdf
+    from pipeline import page_to_chunks, IngestPipeline
+    from embedded_store import open_handler
+
+    file_name = os.path.basename(pdf_path)
+    collection = "Bench_" + "".join(c if c.isalnum() else "_" for c in file_name)
+
+    start = time.perf_counter()
+    pages = list(extract_text_from_pdf(pdf_path))
+    extract_s = time.perf_counter() - start
+
+    timed = {}
+    for name, layout in (("extract_parallel", False), ("extract_layout", True)):
+        start = time.perf_counter()
+        for _ in extract_text_from_pdf(pdf_path, layout=layout, workers=extract_workers):
+            pass
+        timed[name] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    texts, metas = [], []
+    for page in pages:
+        page_texts, page_metas = page_to_chunks(page, file_name, len(texts))
+        texts += page_texts
+        metas += page_metas
+    chunk_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectors = np.vstack([embedder.encode(texts[i:i + batch]) for i in range(0, len(texts), batch)]) \
+        if texts else np.zeros((0, EMBED_DIM), dtype=np.float32)
+    embed_s = time.perf_counter() - start
+
+    client.delete_collection(collection)
+    handler = open_handler(collection, client)
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch):
+        handler.insert_chunks(texts[i:i + batch], vectors[i:i + batch], metas[i:i + batch], skip_existing=False)
+    insert_s = time.perf_counter() - start
+
+    client.delete_collection(collection)
+    report = IngestPipeline(open_handler(collection, client), embedder, embed_batch=batch).run(pdf_path)
+    n_pages, n_chunks = len(pages), len(texts)
+    return {
+        "pdf": file_name, "pages": n_pages, "chunks": n_chunks, "collection": collection,
+        "extract":  {"s": round(extract_s, 4), "pages_per_s": _rate(n_pages, extract_s)},
+        **{name: {"s": round(s, 4), "pages_per_s": _rate(n_pages, s), "workers": extract_workers}
+           for name, s in timed.items()},
+        "chunk":    {"s": round(chunk_s, 4), "pages_per_s": _rate(n_pages, chunk_s),
+                     "chunks_per_s": _rate(n_chunks, chunk_s)},
+        "embed":    {"s": round(embed_s, 4), "chunks_per_s": _rate(n_chunks, embed_s)},
+        "insert":   {"s": round(insert_s, 4), "chunks_per_s": _rate(n_chunks, insert_s)},
+        "pipeline": {"s": report["wall_s"], "pages_per_s": _rate(n_pages, report["wall_s"]),
+                     "chunks_per_s": _rate(report["chunks"], report["wall_s"])},
+    }, texts
+
+
+def make_queries(texts, n: int, seed: int = 1) -> list[str]:
+    # First sentence of random chunks: related to, but not identical with, stored text
+    rng = random.Random(seed)
+    return [rng.choice(texts).split(". ")[0][:200] for _ in range(n)]
+
+
+def bench_queries(engine, queries, concurrency: int, k: int, hybrid: bool) -> dict:
+    latencies, failures = [], {}        # "Type: message" → count
+    lock = threading.Lock()
+
+    def one(query):
+        t0 = time.perf_counter()
+        try:
+            engine.answer(query, k, hybrid=hybrid)
+        except Exception as e:
+            with lock:
+                key = f"{type(e).__name__}: {e}"[:200]
+                failures[key] = failures.get(key, 0) + 1
+            return
+        with lock:
+            latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, queries))
+    wall = time.perf_counter() - start
+    lat = 1000 * np.asarray(latencies)
+
+    def pct(q):
+        return round(float(np.percentile(lat, q)), 2) if len(lat) else None     # null, not NaN, in the JSON
+
+    return {"concurrency": concurrency, "queries": len(queries), "errors": sum(failures.values()),
+            "error_samples": dict(sorted(failures.items(), key=lambda kv: -kv[1])[:5]),
+            "qps": _rate(len(latencies), wall),
+            "p50_ms": pct(50), "p95_ms": pct(95), "p99_ms": pct(99)}
+
+
+# ---------------- comparison ----------------
+def _flatten(result: dict) -> dict:
+    out = {}
+    for r in result.get("ingest", []):
+        for stage, values in r.items():
+            if isinstance(values, dict):
+                for metric, v in values.items():
+                    out[f"ingest {r['pdf']} {stage} {metric}"] = v
+    for r in result.get("query", []):
+        for metric in ("qps", "p50_ms", "p95_ms", "p99_ms"):
+            out[f"query c={r['concurrency']} {metric}"] = r[metric]
+    return out
+
+
+def compare(old: dict, new: dict):
+    before, after = _flatten(old), _flatten(new)
+    print(f"\n📊 vs {old['meta'].get('commit', '?')}  (+ is better)")
+    for key, value in after.items():
+        if not isinstance(before.get(key), (int, float)) or not before[key] or value is None or key.endswith(" s"):
+            continue
+        change = (value - before[key]) / before[key]
+        if key.endswith("_ms"):
+            change = -change                          # lower latency is better
+        print(f"  {key:<48} {before[key]:>10} → {value:<10} {change:+.1%}")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingestion / query benchmark with local stand-in services.")
+    parser.add_argument("--pdfs", nargs="*", default=["test.pdf"])
+    parser.add_argument("--synthetic-pages", type=int, nargs="*", default=[50, 500])
+    parser.add_argument("--queries", type=int, default=200, help="queries per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--extract-workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--hybrid", action="store_true")
+    parser.add_argument("--embed-ms", type=float, default=40, help="stand-in latency per embedding request")
+    parser.add_argument("--embed-item-ms", type=float, default=0.5, help="… plus this per text")
+    parser.add_argument("--summary-ms", type=float, default=300)
+    parser.add_argument("--chat-ms", type=float, default=800)
+    parser.add_argument("--out", default=None, help="default: bench_results/<commit>.json")
+    parser.add_argument("--compare", default=None, help="earlier result JSON to diff against")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="rag_bench_")
+    base_url = start_stand_ins({"embed_ms": args.embed_ms, "embed_item_ms": args.embed_item_ms,
+                                "summary_ms": args.summary_ms, "chat_ms": args.chat_ms})
+    configure_env(base_url, os.path.join(workdir, "store"))
+
+    from hf_embedder import HFEmbedderAPI
+    from resources import get_resources
+    from context_packer import ContextPacker
+    from async_engine import AsyncQueryEngine
+
+    pdfs = list(args.pdfs)
+    for pages in args.synthetic_pages:
+        path = os.path.join(workdir, f"synthetic_{pages}p.pdf")
+        synthetic_pdf(path, pages)
+        pdfs.append(path)
+
+    embedder = HFEmbedderAPI()                    # no embedding cache: every run pays the same calls
+    client = get_resources().vector_client()
+    result = {"meta": {"commit": git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "python": platform.python_version(), "machine": platform.machine(),
+                       "cpus": os.cpu_count(), "args": vars(args)},
+              "ingest": [], "query": []}
+
+    print(f"{'pdf':>22} {'pages':>6} {'chunks':>7} {'extract p/s':>12} {'chunk c/s':>10} "
+          f"{'embed c/s':>10} {'insert c/s':>11} {'pipeline c/s':>13}")
+    corpora = {}
+    for pdf in pdfs:
+        r, corpora[pdf] = bench_ingest(pdf, embedder, client, extract_workers=args.extract_workers)
+        result["ingest"].append(r)
+        print(f"{r['pdf'][-22:]:>22} {r['pages']:>6} {r['chunks']:>7} {r['extract']['pages_per_s']:>12} "
+              f"{r['chunk']['chunks_per_s']:>10} {r['embed']['chunks_per_s']:>10} "
+              f"{r['insert']['chunks_per_s']:>11} {r['pipeline']['chunks_per_s']:>13}")
+
+    # Query the largest corpus that was ingested
+    largest = max(range(len(pdfs)), key=lambda i: result["ingest"][i]["chunks"])
+    engine = AsyncQueryEngine(result["ingest"][largest]["collection"], embedder,
+                              ContextPacker(2048, answer_tokens=300))
+    queries = make_queries(corpora[pdfs[largest]], args.queries)
+    bench_queries(engine, queries[:5], 1, args.k, args.hybrid)         # warm-up: connections, tokenizer
+    print(f"\n{'concurrency':>11} {'qps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    failed = False
+    for c in args.concurrency:
+        r = bench_queries(engine, queries, c, args.k, args.hybrid)
+        result["query"].append(r)
+        print(f"{c:>11} {r['qps']:>8} {r['p50_ms']!s:>9} {r['p95_ms']!s:>9} {r['p99_ms']!s:>9} {r['errors']:>7}")
+        for message, n in r["error_samples"].items():
+            print(f"{'':>13}❌ {n}× {message}")
+        if r["errors"] == r["queries"]:
+            failed = True
+    engine.close()
+    result["meta"]["stand_in_calls"] = dict(StandInHandler.calls)
+
+    out = args.out or os.path.join("bench_results", f"{result['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\n💾 {out}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
+    if failed:
+        print("❌ Every query failed at some concurrency level; the latency numbers are missing")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
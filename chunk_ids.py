@@ -0,0 +1,20 @@
+# chunk_ids.py
+"""
+Deterministic object ids for chunks, shared by both vector backends, the
+pipeline and the summary queue. Stdlib only, so none of them has to import
+the weaviate client just to name a chunk.
+"""
+import uuid, hashlib
+
+
+def chunk_uuid(file_name: str, chunk_index: int) -> str:
+    # Same (file, chunk) always maps to the same object id, so re-running an
+    # ingestion overwrites instead of duplicating.
+    # Identical to weaviate.util.generate_uuid5(f"{file_name}:{chunk_index}").
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{file_name}:{chunk_index}"))
+
+
+def hit_content_hash(hit: dict) -> str:
+    # UUIDs survive edits on re-ingestion, so caches keyed by chunk also need its content.
+    # Stored content_hash when present, else the same whitespace-insensitive sha256 of the text.
+    return hit.get("content_hash") or hashlib.sha256(" ".join(hit["text"].split()).encode("utf-8")).hexdigest()
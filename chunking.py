@@ -1,18 +1,195 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-
-def chunk_texts(pages: list[str], chunk_size=512, chunk_overlap=64):
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        separators=["\n\n", "\n", ".", " ", ""]
-    )
-    page_metas = [{"page": i + 1} for i in range(len(pages))]
+# chunking.py
+"""
+Built-in recursive splitter, a drop-in for LangChain's RecursiveCharacterTextSplitter.
+
+Same size / overlap / separator semantics as
+
+    RecursiveCharacterTextSplitter(chunk_size, chunk_overlap, separators=["\\n\\n", "\\n", ".", " ", ""])
+
+(keep_separator=True, strip_whitespace=True), so it yields the same chunks, but
+it works on (start, end) offsets into the page text instead of building and
+re-joining substrings. Every separator level is one left-to-right str.find
+scan, a chunk is a single slice at the end, and the result is a light Chunk
+record (page_content, metadata, start, end) instead of a pydantic Document.
+
+Modes (CHUNK_MODE env, or mode=):
+  "recursive"  the LangChain-equivalent default above
+  "sentence"   splits at sentence ends before line breaks, keeps the punctuation with its sentence
+  "token"      chunk_size / chunk_overlap count tokens of TOKENIZER_ID instead of characters
+
+CHUNKER=langchain falls back to LangChain itself (if installed), e.g. for bench_chunking.py.
+"""
+import os, re
+from collections import deque
+from functools import lru_cache
+
+DEFAULT_SEPARATORS = ["\n\n", "\n", ".", " ", ""]
+# End of a sentence: punctuation (plus closing quotes/brackets) followed by whitespace
+SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*(?=\s)")
+SENTENCE_SEPARATORS = ["\n\n", SENTENCE_END, "\n", " ", ""]
+TOKENIZER_ID = os.getenv("CHUNK_TOKENIZER", "sentence-transformers/all-MiniLM-L6-v2")
+
+
+class Chunk:
+    """One chunk; page_content / metadata match LangChain's Document, start / end are offsets in the source text."""
+    __slots__ = ("page_content", "metadata", "start", "end")
+
+    def __init__(self, page_content: str, metadata: dict, start: int, end: int):
+        self.page_content = page_content
+        self.metadata = metadata
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return f"Chunk({self.start}:{self.end}, {self.metadata}, {self.page_content[:40]!r}…)"
+
+
+def token_length_function(tokenizer_id: str = TOKENIZER_ID):
+    """Batch length function counting tokens (no special tokens, no truncation)."""
+    from tokenizers import Tokenizer
+    tokenizer = Tokenizer.from_pretrained(tokenizer_id)
+    tokenizer.no_truncation()
+    tokenizer.no_padding()
+    return lambda texts: [len(e.ids) for e in tokenizer.encode_batch(texts, add_special_tokens=False)]
+
+
+class TextChunker:
+    def __init__(self, chunk_size: int = 512, chunk_overlap: int = 64,
+                 separators: list = None,       # strings (kept at the start of the next piece) or compiled
+                                                # patterns (the cut is after the match); "" = characters
+                 mode: str = "recursive",
+                 length_function=None):         # list[str] -> list[int]; default: characters
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) is larger than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.mode = mode
+        if separators is None:
+            separators = SENTENCE_SEPARATORS if mode == "sentence" else DEFAULT_SEPARATORS
+        self.separators = separators
+        if length_function is None and mode == "token":
+            length_function = token_length_function()
+        self._lengths = length_function
+
+    # ---------------- splitting ----------------
+    @staticmethod
+    def _cuts(text, start, end, sep):
+        """Cut positions of one separator level inside text[start:end] (None if it doesn't occur)."""
+        if isinstance(sep, re.Pattern):
+            cuts = [m.end() for m in sep.finditer(text, start, end)]
+            return [c for c in cuts if start < c < end] or None
+        pos = text.find(sep, start, end)
+        if pos == -1:
+            return None
+        cuts = []
+        while pos != -1:
+            if pos > start:
+                cuts.append(pos)
+            pos = text.find(sep, pos + len(sep), end)
+        return cuts
+
+    def _piece_lengths(self, text, spans):
+        if self._lengths is None:
+            return [e - s for s, e in spans]
+        return self._lengths([text[s:e] for s, e in spans])
+
+    def _split(self, text, start, end, separators, out):
+        # Coarsest separator present in this piece; the finer ones are for pieces still too long
+        cuts, rest, chars = None, [], False
+        for i, sep in enumerate(separators):
+            if sep == "":
+                chars = True
+                break
+            cuts = self._cuts(text, start, end, sep)
+            if cuts is not None:
+                rest = separators[i + 1:]
+                break
+        if chars:
+            spans = [(i, i + 1) for i in range(start, end)]
+        elif cuts is None:                                  # no separator left that occurs
+            spans = [(start, end)]
+        else:
+            bounds = [start, *cuts, end]
+            spans = [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+        good, good_lengths = [], []
+        for span, n in zip(spans, self._piece_lengths(text, spans)):
+            if n < self.chunk_size:
+                good.append(span)
+                good_lengths.append(n)
+                continue
+            if good:
+                self._merge(text, good, good_lengths, out)
+                good, good_lengths = [], []
+            if rest:
+                self._split(text, span[0], span[1], rest, out)
+            else:
+                out.append(span)                            # too long and nothing finer: as is, unstripped
+        if good:
+            self._merge(text, good, good_lengths, out)
+
+    def _merge(self, text, spans, lengths, out):
+        """Greedily pack adjacent pieces up to chunk_size, keeping up to chunk_overlap of the tail."""
+        window, total = deque(), 0
+        for span, n in zip(spans, lengths):
+            if total + n > self.chunk_size and window:
+                self._emit(text, window[0][0][0], window[-1][0][1], out)
+                while total > self.chunk_overlap or (total + n > self.chunk_size and total > 0):
+                    total -= window.popleft()[1]
+            window.append((span, n))
+            total += n
+        if window:
+            self._emit(text, window[0][0][0], window[-1][0][1], out)
+
+    @staticmethod
+    def _emit(text, start, end, out):
+        # Adjacent pieces are contiguous, so a merged chunk is one slice; strip it by moving the offsets
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            out.append((start, end))
+
+    # ---------------- API ----------------
+    def split_spans(self, text: str) -> list[tuple[int, int]]:
+        out = []
+        self._split(text, 0, len(text), self.separators, out)
+        return out
+
+    def split_text(self, text: str) -> list[str]:
+        return [text[s:e] for s, e in self.split_spans(text)]
+
+    def create_chunks(self, texts: list[str], metadatas: list[dict] = None) -> list[Chunk]:
+        metadatas = metadatas or [{}] * len(texts)
+        return [Chunk(text[s:e], dict(meta), s, e)
+                for text, meta in zip(texts, metadatas) for s, e in self.split_spans(text)]
+
+
+@lru_cache(maxsize=16)
+def get_chunker(chunk_size: int, chunk_overlap: int, mode: str) -> TextChunker:
+    # chunk_texts runs once per page: build the splitter (and load a tokenizer) once per setting
+    return TextChunker(chunk_size, chunk_overlap, mode=mode)
+
+
+def _langchain_chunks(pages, chunk_size, chunk_overlap, page_metas):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                              separators=DEFAULT_SEPARATORS)
     return splitter.create_documents(pages, metadatas=page_metas)
 
-""" 
 
-We are going for character-wise chunking for now. 
-Later on, we could try sentence wise or some other chunking as an experiment
+def chunk_texts(pages: list[str], chunk_size=512, chunk_overlap=64, first_page=1, mode=None):
+    # first_page lets a streaming caller chunk one page at a time and keep real page numbers
+    page_metas = [{"page": i + first_page} for i in range(len(pages))]
+    if os.getenv("CHUNKER") == "langchain":
+        return _langchain_chunks(pages, chunk_size, chunk_overlap, page_metas)
+    chunker = get_chunker(chunk_size, chunk_overlap, mode or os.getenv("CHUNK_MODE", "recursive"))
+    return chunker.create_chunks(pages, page_metas)
+
+"""
+Character-wise chunking stays the default; "sentence" and "token" modes are
+there to experiment with.
 
-Still, it's not ready for column-wise or any other weirdly formatted pdf. 
-"""
\ No newline at end of file
+Still, it's not ready for column-wise or any other weirdly formatted pdf.
+"""
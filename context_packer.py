@@ -0,0 +1,129 @@
+# context_packer.py
+"""
+Token-accurate context packing (replaces the chunk-count heuristics in strategy.py).
+
+Hits are taken in retrieval order (best first) and packed greedily into the
+model's context budget, counting real tokens with a fast tokenizer:
+
+  full      the whole chunk fits
+  trimmed   most of it fits → cut at a sentence boundary
+  summary   it doesn't fit → use its (batched, cached) summary instead
+  dropped   not even the summary fits
+
+Token counts are memoised per chunk UUID, so repeated packing is nearly free.
+"""
+import re, threading
+from collections import OrderedDict
+
+TOKENIZER_ID = "openai/gpt-oss-120b"    # the generator's tokenizer (o200k-based)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+class ContextPacker:
+    def __init__(self, model_context: int = 2048,
+                 answer_tokens: int = 400,       # reserved for the completion
+                 prompt_overhead: int = 120,     # system prompt + question scaffolding
+                 tokenizer_id: str = TOKENIZER_ID,
+                 min_piece_tokens: int = 40,     # don't bother with slivers smaller than this
+                 memo_size: int = 50_000):
+        self.budget = model_context - answer_tokens - prompt_overhead
+        self.min_piece_tokens = min_piece_tokens
+        self.memo_size = memo_size
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        self._tokenizer = self._load_tokenizer(tokenizer_id)
+
+    @staticmethod
+    def _load_tokenizer(tokenizer_id):
+        try:
+            from tokenizers import Tokenizer
+            return Tokenizer.from_pretrained(tokenizer_id)
+        except Exception as e:
+            print(f"⚠️  Tokenizer {tokenizer_id} unavailable ({e}); estimating 4 chars per token")
+            return None
+
+    def _count_raw(self, text: str) -> int:
+        if self._tokenizer is None:
+            return (len(text) + 3) // 4
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def count(self, text: str, key=None) -> int:
+        """Token count of `text`; memoised under `key` (e.g. (uuid, "text")) when given."""
+        if key is None:
+            return self._count_raw(text)
+        key = (*key, hash(text))          # UUIDs are reused on re-ingestion, so key on content too
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+        n = self._count_raw(text)
+        with self._lock:
+            self._memo[key] = n
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return n
+
+    def trim(self, text: str, max_tokens: int) -> str:
+        """Longest sentence-aligned prefix of `text` within `max_tokens` ('' if not even one sentence fits)."""
+        kept, used = [], 0
+        for sentence in _SENTENCE_END.split(text):
+            n = self._count_raw(sentence) + 1
+            if used + n > max_tokens:
+                break
+            kept.append(sentence)
+            used += n
+        return " ".join(kept)
+
+    def pack(self, hits: list[dict], handler=None):
+        """
+        Returns (context: list[str], label: str).
+        `handler` is used to create/store missing summaries; without it
+        chunks that don't fit are trimmed or dropped.
+        """
+        from summarizer import get_or_create_summaries   # only needed when something overflows
+
+        sep = 2                                   # "\n\n" between chunks
+        ordered = hits                            # retrievers return best-first (distance or fused rank)
+        remaining = self.budget
+        plan = []                                 # (hit, mode, text|None)
+        overflow = []
+
+        for h in ordered:
+            n = self.count(h["text"], (str(h["uuid"]), "text")) + sep
+            if n <= remaining:
+                plan.append([h, "full", h["text"]])
+                remaining -= n
+            elif remaining >= max(n // 2, self.min_piece_tokens):
+                text = self.trim(h["text"], remaining - sep)      # most of it fits: keep original wording
+                plan.append([h, "trimmed" if text else "dropped", text])
+                remaining -= self.count(text) + sep if text else 0
+            else:
+                entry = [h, "summary", None]
+                plan.append(entry)
+                overflow.append(entry)
+
+        if overflow and handler is not None:
+            get_or_create_summaries([e[0] for e in overflow], handler)   # one batched call for all of them
+
+        for entry in overflow:
+            h = entry[0]
+            summary = h.get("summary") or ""
+            n = self.count(summary, (str(h["uuid"]), "summary")) + sep if summary else None
+            if n is not None and n <= remaining:
+                entry[2] = summary
+                remaining -= n
+            elif remaining >= self.min_piece_tokens:
+                entry[1], entry[2] = "trimmed", self.trim(h["text"], remaining - sep)
+                remaining -= self.count(entry[2]) + sep if entry[2] else 0
+            else:
+                entry[1] = "dropped"
+            if not entry[2]:
+                entry[1] = "dropped"
+
+        context = [text for _, mode, text in plan if mode != "dropped"]
+        counts = OrderedDict((m, 0) for m in ("full", "trimmed", "summary", "dropped"))
+        for _, mode, _ in plan:
+            counts[mode] += 1
+        label = "packed (" + ", ".join(f"{v} {k}" for k, v in counts.items() if v) + \
+                f"; {self.budget - remaining}/{self.budget} tokens)"
+        return context, label
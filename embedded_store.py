@@ -0,0 +1,412 @@
+# embedded_store.py
+"""
+In-process vector store: the WeaviateHandler surface without a Weaviate server.
+
+  vectors   one memory-mapped float32 matrix per collection (<dir>/<collection>.f32),
+            L2-normalised, searched by exact NumPy brute force (cosine distance)
+  metadata  SQLite (<dir>/store.sqlite), with an FTS5 index for the BM25 leg
+
+Selected with VECTOR_BACKEND=embedded (VECTOR_STORE_PATH sets the directory);
+open_handler() then hands out EmbeddedVectorStore instead of WeaviateHandler,
+so RAGRetriever, ingestion and the summariser work unchanged. Meant for a
+single process; for several writers, or corpora where exact search gets slow,
+use Weaviate.
+"""
+import os, re, time, sqlite3, threading
+import numpy as np
+
+from chunk_ids import chunk_uuid
+from tracing import get_tracer
+
+DEFAULT_STORE_PATH = os.getenv("VECTOR_STORE_PATH", ".vector_store")
+COLUMNS = ["uuid", "file_name", "chunk_index", "page", "section", "text", "summary",
+           "content_hash", "page_hash", "bboxes"]
+_WORD = re.compile(r"\w+")
+
+
+def open_handler(collection_name: str, client, index_profile: str = None):
+    """WeaviateHandler or EmbeddedVectorStore, depending on which client is passed in."""
+    if isinstance(client, EmbeddedClient):
+        return EmbeddedVectorStore(collection_name, client)
+    from weaviate_handler import WeaviateHandler
+    return WeaviateHandler(collection_name, client, index_profile=index_profile)
+
+
+def _filter_sql(filters):
+    """Scope dict (see weaviate_handler.build_filters) → SQL condition on `chunks` + params."""
+    if not filters:
+        return "", []
+    if not isinstance(filters, dict):
+        raise TypeError("The embedded store takes scope dicts (file_names, page_range, sections), "
+                        "not Weaviate Filter objects")
+    clauses, params = [], []
+    if filters.get("file_names"):
+        clauses.append(f"c.file_name IN ({','.join('?' * len(filters['file_names']))})")
+        params += list(filters["file_names"])
+    first, last = filters.get("page_range") or (None, None)
+    if first is not None:
+        clauses.append("c.page >= ?")
+        params.append(int(first))
+    if last is not None:
+        clauses.append("c.page <= ?")
+        params.append(int(last))
+    if filters.get("sections"):
+        clauses.append(f"c.section IN ({','.join('?' * len(filters['sections']))})")
+        params += list(filters["sections"])
+    return "".join(f" AND {c}" for c in clauses), params
+
+
+class EmbeddedClient:
+    """Plays the role of the Weaviate client: owns the SQLite file and the per-collection matrices."""
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(os.path.join(path, "store.sqlite"), check_same_thread=False)
+        self.db.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS collections (
+                name TEXT PRIMARY KEY,
+                dim INTEGER,
+                capacity INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                collection TEXT NOT NULL,
+                uuid TEXT NOT NULL,
+                row INTEGER NOT NULL,                 -- row of the vector in <collection>.f32
+                file_name TEXT, chunk_index INTEGER, page INTEGER, section TEXT,
+                text TEXT, summary TEXT, content_hash TEXT, page_hash TEXT, bboxes TEXT,
+                UNIQUE (collection, uuid)
+            );
+            CREATE INDEX IF NOT EXISTS chunks_file ON chunks(collection, file_name, chunk_index);
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(text, collection UNINDEXED);
+        """)
+        # Stores created before layout boxes were kept
+        if "bboxes" not in {r[1] for r in self.db.execute("PRAGMA table_info(chunks)")}:
+            self.db.execute("ALTER TABLE chunks ADD COLUMN bboxes TEXT")
+        self._collections = {}
+
+    def list_collections(self) -> list[str]:
+        with self.lock:
+            return [n for (n,) in self.db.execute("SELECT name FROM collections")]
+
+    def collection(self, name: str) -> "_EmbeddedCollection":
+        # One shared state per collection: handlers are cheap to create per query, the matrix is not.
+        with self.lock:
+            if name not in self._collections:
+                self._collections[name] = _EmbeddedCollection(self, name)
+            return self._collections[name]
+
+    def delete_collection(self, name: str):
+        with self.lock:
+            state = self._collections.pop(name, None)
+            if state is not None:
+                state.vectors = None
+            self.db.execute("DELETE FROM chunks_fts WHERE rowid IN "
+                            "(SELECT id FROM chunks WHERE collection = ?)", (name,))
+            self.db.execute("DELETE FROM chunks WHERE collection = ?", (name,))
+            self.db.execute("DELETE FROM collections WHERE name = ?", (name,))
+            self.db.commit()
+            path = os.path.join(self.path, f"{name}.f32")
+            if os.path.exists(path):
+                os.remove(path)
+
+    def close(self):
+        with self.lock:
+            for state in self._collections.values():
+                if state.vectors is not None:
+                    state.vectors.flush()
+            self._collections.clear()
+            self.db.close()
+
+
+class _EmbeddedCollection:
+    """Vector matrix + row bookkeeping of one collection (all access under client.lock)."""
+
+    def __init__(self, client: EmbeddedClient, name: str):
+        self.client, self.db, self.name = client, client.db, name
+        self.path = os.path.join(client.path, f"{name}.f32")
+        self.db.execute("INSERT OR IGNORE INTO collections (name) VALUES (?)", (name,))
+        self.db.commit()
+        self.dim, self.capacity = self.db.execute(
+            "SELECT dim, capacity FROM collections WHERE name = ?", (name,)).fetchone()
+        self.vectors = None
+        self.valid = np.zeros(self.capacity, dtype=bool)
+        if self.dim and self.capacity and os.path.exists(self.path):
+            self.vectors = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+        for (row,) in self.db.execute("SELECT row FROM chunks WHERE collection = ?", (name,)):
+            self.valid[row] = True
+        self.free = [int(r) for r in np.flatnonzero(~self.valid)[::-1]]   # pop() hands out low rows first
+
+    def _grow(self, needed: int):
+        capacity = max(1024, self.capacity)
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self.capacity:
+            return
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.vectors = None
+        with open(self.path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self.vectors = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self.valid = np.concatenate([self.valid, np.zeros(capacity - self.capacity, dtype=bool)])
+        self.free = list(range(capacity - 1, self.capacity - 1, -1)) + self.free
+        self.capacity = capacity
+        self.db.execute("UPDATE collections SET capacity = ? WHERE name = ?", (capacity, self.name))
+
+    def allocate(self, n: int, dim: int) -> list[int]:
+        if self.dim is None:
+            self.dim = dim
+            self.db.execute("UPDATE collections SET dim = ? WHERE name = ?", (dim, self.name))
+        elif dim != self.dim:
+            raise ValueError(f"{self.name} stores {self.dim}-d vectors, got {dim}-d")
+        if len(self.free) < n:
+            self._grow(self.capacity - len(self.free) + n)
+        rows = [self.free.pop() for _ in range(n)]
+        self.valid[rows] = True
+        return rows
+
+    def release(self, rows):
+        rows = list(rows)
+        self.valid[rows] = False
+        self.free += rows
+
+
+class EmbeddedVectorStore:
+    def __init__(self, collection_name: str, client: EmbeddedClient, index_profile: str = None):
+        # index_profile is accepted for symmetry with WeaviateHandler; search here is always exact
+        self.client = client
+        self.collection_name = collection_name
+        self.state = client.collection(collection_name)
+        self._db = client.db
+        self._lock = client.lock
+
+    def apply_index_profile(self, profile_name: str):
+        print(f"ℹ️  {self.collection_name}: the embedded store always searches exactly; "
+              f"index profile '{profile_name}' ignored")
+
+    # ---------------- reads ----------------
+    def _rows(self, sql: str, params=()) -> list[dict]:
+        cur = self._db.execute(sql, params)
+        names = [d[0] for d in cur.description]
+        return [dict(zip(names, r)) for r in cur.fetchall()]
+
+    @staticmethod
+    def _to_hit(r: dict, distance=None) -> dict:
+        return {"uuid": r["uuid"], "text": r["text"], "summary": r["summary"] or "",
+                "page": r["page"] or 0, "file_name": r["file_name"] or "unknown.pdf",
+                "section": r["section"] or "N/A", "content_hash": r["content_hash"] or "",
+                "distance": distance}
+
+    def document_already_exists(self, file_name) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM chunks WHERE collection = ? AND file_name = ? LIMIT 1",
+                                    (self.collection_name, file_name)).fetchone() is not None
+
+    def near_vector(self, vector, k: int, filters=None) -> list[dict]:
+        """Exact cosine search; `filters` (scope dict) restricts the rows scored."""
+        q = np.asarray(vector, dtype=np.float32)
+        q /= np.linalg.norm(q) or 1.0
+        where, params = _filter_sql(filters)
+        with get_tracer().span("store.near_vector", k=k, filtered=bool(where)) as span, self._lock:
+            state = self.state
+            if state.vectors is None:
+                return []
+            if where:
+                rows = np.fromiter((r for (r,) in self._db.execute(
+                    f"SELECT c.row FROM chunks c WHERE c.collection = ?{where}",
+                    [self.collection_name, *params])), dtype=np.int64)
+                scores = state.vectors[rows] @ q if len(rows) else np.empty(0, np.float32)
+            else:
+                rows = np.flatnonzero(state.valid)
+                scores = state.vectors[:state.capacity] @ q
+                scores = scores[rows]
+            span["scanned"] = len(rows)
+            if not len(rows):
+                return []
+            top = np.argpartition(-scores, min(k, len(rows)) - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            best = {int(rows[i]): float(scores[i]) for i in top}
+            found = self._rows(f"SELECT * FROM chunks c WHERE c.collection = ? "
+                               f"AND c.row IN ({','.join('?' * len(best))})",
+                               [self.collection_name, *best])
+        by_row = {r["row"]: r for r in found}
+        return [self._to_hit(by_row[row], 1.0 - score) for row, score in best.items() if row in by_row]
+
+    def bm25(self, query: str, k: int, filters=None) -> list[dict]:
+        """Keyword search through SQLite FTS5 (its bm25() ranking); hits carry no distance."""
+        words = _WORD.findall(query)
+        if not words:
+            return []
+        match = " OR ".join(f'"{w}"' for w in words)
+        where, params = _filter_sql(filters)
+        with get_tracer().span("store.bm25", k=k, filtered=bool(where)), self._lock:
+            found = self._rows(
+                f"SELECT c.*, bm25(chunks_fts) AS rank FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid "
+                f"WHERE chunks_fts MATCH ? AND chunks_fts.collection = ?{where} ORDER BY rank LIMIT ?",
+                [match, self.collection_name, *params, k])
+        return [{**self._to_hit(r), "bm25_score": -r["rank"]} for r in found]
+
+    def existing_file_names(self, file_names: list[str]) -> set[str]:
+        if not file_names:
+            return set()
+        return set(self.list_file_names()) & set(file_names)
+
+    def list_file_names(self) -> list[str]:
+        with self._lock:
+            return [f for (f,) in self._db.execute(
+                "SELECT DISTINCT file_name FROM chunks WHERE collection = ? ORDER BY file_name",
+                (self.collection_name,))]
+
+    def list_sections(self, file_names=None) -> list[str]:
+        where, params = _filter_sql({"file_names": file_names})
+        with self._lock:
+            return [s for (s,) in self._db.execute(
+                f"SELECT DISTINCT c.section FROM chunks c WHERE c.collection = ?{where} ORDER BY c.section",
+                [self.collection_name, *params])]
+
+    def max_page(self, file_names=None) -> int:
+        where, params = _filter_sql({"file_names": file_names})
+        with self._lock:
+            (page,) = self._db.execute(f"SELECT MAX(c.page) FROM chunks c WHERE c.collection = ?{where}",
+                                       [self.collection_name, *params]).fetchone()
+        return page or 0
+
+    def fetch_file_chunks(self, file_name: str, page_size: int = 1000) -> list[dict]:
+        with self._lock:
+            return self._rows("SELECT uuid, chunk_index, page, content_hash, page_hash, summary FROM chunks "
+                              "WHERE collection = ? AND file_name = ?", (self.collection_name, file_name))
+
+    def fetch_chunks(self, uuids: list, properties=("text", "summary", "file_name")) -> dict:
+        if not uuids:
+            return {}
+        cols = ", ".join(p for p in properties if p in COLUMNS)
+        with self._lock:
+            rows = self._rows(f"SELECT uuid, {cols} FROM chunks WHERE collection = ? "
+                              f"AND uuid IN ({','.join('?' * len(uuids))})",
+                              [self.collection_name, *map(str, uuids)])
+        return {r.pop("uuid"): r for r in rows}
+
+    def iter_missing_summaries(self):
+        with self._lock:
+            rows = self._db.execute("SELECT uuid, file_name FROM chunks WHERE collection = ? "
+                                    "AND (summary IS NULL OR summary = '')", (self.collection_name,)).fetchall()
+        yield from rows
+
+    def fetch_vectors(self, uuids: list) -> dict:
+        if not uuids:
+            return {}
+        with self._lock:
+            rows = self._db.execute(f"SELECT uuid, row FROM chunks WHERE collection = ? "
+                                    f"AND uuid IN ({','.join('?' * len(uuids))})",
+                                    [self.collection_name, *map(str, uuids)]).fetchall()
+            return {uid: self.state.vectors[row].tolist() for uid, row in rows}
+
+    # ---------------- writes ----------------
+    def update_properties(self, updates: dict, max_workers: int = 8) -> list:
+        """Merge {uuid: {prop: value}} into stored chunks. Returns [(uuid, error)] like WeaviateHandler."""
+        failed = []
+        with self._lock:
+            for uid, props in updates.items():
+                cols = [c for c in props if c in COLUMNS and c != "uuid"]
+                unknown = set(props) - set(cols)
+                if unknown:
+                    failed.append((str(uid), f"unknown properties {sorted(unknown)}"))
+                    continue
+                cur = self._db.execute(
+                    f"UPDATE chunks SET {', '.join(f'{c} = ?' for c in cols)} WHERE collection = ? AND uuid = ?",
+                    [props[c] for c in cols] + [self.collection_name, str(uid)])
+                if cur.rowcount and "text" in props:
+                    self._db.execute("UPDATE chunks_fts SET text = ? WHERE rowid = "
+                                     "(SELECT id FROM chunks WHERE collection = ? AND uuid = ?)",
+                                     (props["text"], self.collection_name, str(uid)))
+            self._db.commit()
+        return failed
+
+    def delete_chunks(self, uuids: list) -> int:
+        uuids = [str(u) for u in uuids]
+        if not uuids:
+            return 0
+        with self._lock:
+            rows = self._db.execute(f"SELECT id, row FROM chunks WHERE collection = ? "
+                                    f"AND uuid IN ({','.join('?' * len(uuids))})",
+                                    [self.collection_name, *uuids]).fetchall()
+            self._db.executemany("DELETE FROM chunks_fts WHERE rowid = ?", [(i,) for i, _ in rows])
+            self._db.executemany("DELETE FROM chunks WHERE id = ?", [(i,) for i, _ in rows])
+            self._db.commit()
+            self.state.release(r for _, r in rows)
+        return len(rows)
+
+    def delete_chunks_from(self, file_name: str, first_index: int) -> int:
+        with self._lock:
+            rows = self._db.execute("SELECT id, row FROM chunks WHERE collection = ? AND file_name = ? "
+                                    "AND chunk_index >= ?", (self.collection_name, file_name, first_index)).fetchall()
+            self._db.executemany("DELETE FROM chunks_fts WHERE rowid = ?", [(i,) for i, _ in rows])
+            self._db.executemany("DELETE FROM chunks WHERE id = ?", [(i,) for i, _ in rows])
+            self._db.commit()
+            self.state.release(r for _, r in rows)
+        return len(rows)
+
+    def insert_chunks(self, chunks: list[str], embeddings, metadatas: list[dict],
+                      batch_size: int = 100, concurrent_requests: int = 2,
+                      max_retries: int = 3, skip_existing: bool = True):
+        """
+        Upsert chunks under the same deterministic UUIDs as WeaviateHandler.
+        batch_size / concurrent_requests / max_retries only exist for signature compatibility.
+        Returns [] (writes are local and transactional).
+        """
+        if not chunks:
+            return []
+        if skip_existing and self.document_already_exists(metadatas[0]["file_name"]):
+            print(f"⚠️ File '{metadatas[0]['file_name']}' already ingested. Skipping.")
+            return []
+
+        start = time.perf_counter()
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        records = {}
+        for chunk, vector, metadata in zip(chunks, vectors, metadatas):
+            uid = str(chunk_uuid(metadata["file_name"], metadata["chunk_index"]))
+            records[uid] = ({"summary": "", **metadata, "text": chunk}, vector)   # last one wins, like an upsert
+
+        with get_tracer().span("store.insert", objects=len(records)), self._lock:
+            state = self.state
+            existing = dict(self._db.execute(
+                f"SELECT uuid, row FROM chunks WHERE collection = ? AND uuid IN ({','.join('?' * len(records))})",
+                [self.collection_name, *records]).fetchall())
+            new_rows = iter(state.allocate(len(records) - len(existing), vectors.shape[1]))
+            for uid, (props, vector) in records.items():
+                row = existing.get(uid)
+                if row is None:
+                    row = next(new_rows)
+                state.vectors[row] = vector
+                values = [props.get(c) for c in COLUMNS[1:]]
+                if uid in existing:
+                    self._db.execute(f"UPDATE chunks SET {', '.join(f'{c} = ?' for c in COLUMNS[1:])} "
+                                     f"WHERE collection = ? AND uuid = ?", [*values, self.collection_name, uid])
+                    self._db.execute("UPDATE chunks_fts SET text = ? WHERE rowid = "
+                                     "(SELECT id FROM chunks WHERE collection = ? AND uuid = ?)",
+                                     (props["text"], self.collection_name, uid))
+                else:
+                    cur = self._db.execute(f"INSERT INTO chunks (collection, uuid, row, {', '.join(COLUMNS[1:])}) "
+                                           f"VALUES (?, ?, ?{', ?' * len(values)})",
+                                           [self.collection_name, uid, row, *values])
+                    self._db.execute("INSERT INTO chunks_fts (rowid, text, collection) VALUES (?, ?, ?)",
+                                     (cur.lastrowid, props["text"], self.collection_name))
+            state.vectors.flush()
+            self._db.commit()
+
+        elapsed = time.perf_counter() - start
+        rate = len(records) / elapsed if elapsed > 0 else float("inf")
+        print(f"✅ Inserted {len(records)}/{len(chunks)} chunks into the embedded store "
+              f"in {elapsed:.2f}s ({rate:.1f} objects/s)")
+        return []
+
+    def close(self):
+        # The client (SQLite connection, other collections) is shared: ResourceManager.close() closes it
+        with self._lock:
+            if self.state.vectors is not None:
+                self.state.vectors.flush()
@@ -0,0 +1,264 @@
+# embedding_cache.py
+import os, re, time, sqlite3, hashlib, threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List
+import numpy as np
+
+from tracing import get_tracer
+
+try:
+    import fcntl
+except ImportError:         # Windows: no cross-process lock, one process per cache directory
+    fcntl = None
+
+DEFAULT_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".embedding_cache")
+
+
+def normalize_text(text: str) -> str:
+    # Whitespace-only differences (re-extracted pages, re-flowed lines) should hit the same entry.
+    return " ".join(text.split())
+
+
+def text_key(model_id: str, text: str) -> str:
+    return hashlib.sha256(f"{model_id}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class CachedEmbedder:
+    """
+    Disk-backed, content-addressed cache in front of any embedder with .encode(list[str]).
+
+    Keys are (model_id, sha256 of normalized text). Vectors live in a memory-mapped
+    float32 file (one row per slot); SQLite maps key → slot and tracks last use.
+    A small in-memory LRU sits in front of the disk store, and once `max_entries`
+    is exceeded the least recently used rows are evicted and their slots reused.
+    Other processes share the cache through a lock file next to it (shared for
+    reads, exclusive for writes).
+    """
+
+    def __init__(self, embedder, cache_dir: str = DEFAULT_CACHE_DIR,
+                 max_entries: int = 200_000, memory_items: int = 4096):
+        self.embedder = embedder
+        self.model_id = getattr(embedder, "model_id", type(embedder).__name__)
+        self.max_entries = max_entries
+        self.memory_items = memory_items
+        self.hits = self.misses = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        stem = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", self.model_id))
+        self.vec_path = stem + ".f32"
+
+        self._lock = threading.Lock()
+        self._lock_file = open(stem + ".lock", "a+")
+        self._memory = OrderedDict()   # key → np.ndarray (LRU front)
+        self._db = sqlite3.connect(stem + ".sqlite", timeout=30, check_same_thread=False)
+        with self._file_lock():
+            self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER UNIQUE, last_used REAL);
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used);
+            CREATE TABLE IF NOT EXISTS free_slots (slot INTEGER PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER);
+            """)
+        self.dim, self.capacity, self.next_slot = None, 0, 0
+        self._vectors = None
+        self._reload_meta()
+
+    @contextmanager
+    def _file_lock(self, shared: bool = False):
+        # Shared for readers (key → slot → row must not be re-used in between), exclusive for writers
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _reload_meta(self):
+        """Pick up dim / capacity / next_slot written by another process (the file only ever grows)."""
+        meta = dict(self._db.execute("SELECT name, value FROM meta").fetchall())
+        self.dim = meta.get("dim", self.dim)
+        self.next_slot = meta.get("next_slot", self.next_slot)
+        capacity = meta.get("capacity", 0)
+        if self.dim and (capacity != self.capacity or self._vectors is None):
+            self.capacity = capacity
+            self._open_vectors()
+
+    # ---------------- vector file ----------------
+    def _open_vectors(self):
+        if self.capacity == 0:
+            self._vectors = None
+            return
+        self._vectors = np.memmap(self.vec_path, dtype=np.float32, mode="r+",
+                                  shape=(self.capacity, self.dim))
+
+    def _grow(self, needed: int):
+        """Double the backing file until `needed` slots fit (capped at max_entries)."""
+        if needed <= self.capacity:
+            return
+        new_cap = max(needed, min(max(self.capacity * 2, 1024), self.max_entries))
+        if self._vectors is not None:
+            self._vectors.flush()
+        with open(self.vec_path, "ab") as f:
+            f.truncate(new_cap * self.dim * 4)
+        self.capacity = new_cap
+        self._open_vectors()
+
+    def _save_meta(self):
+        self._db.executemany("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                             [("dim", self.dim), ("capacity", self.capacity),
+                              ("next_slot", self.next_slot)])
+
+    # ---------------- lookups ----------------
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, keys: List[str]) -> dict:
+        found = {}
+        disk_keys = []
+        for key in keys:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                found[key] = self._memory[key]
+            else:
+                disk_keys.append(key)
+
+        if not disk_keys:
+            return found
+        # Slot lookup and row read under one lock: another process can't evict and re-use the slot in between
+        with self._file_lock(shared=True):
+            if self._vectors is None:
+                self._reload_meta()                     # another process may have created the file
+            if self._vectors is not None:
+                self._read_rows(disk_keys, found)
+        return found
+
+    def _read_rows(self, disk_keys: List[str], found: dict):
+        now = time.time()
+        for i in range(0, len(disk_keys), 500):    # stay under SQLite's variable limit
+            part = disk_keys[i:i + 500]
+            rows = self._db.execute(
+                f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            if rows and max(slot for _, slot in rows) >= self.capacity:
+                self._reload_meta()                 # slots added by another process
+            for key, slot in rows:
+                vector = np.array(self._vectors[slot])
+                found[key] = vector
+                self._remember(key, vector)
+            self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?",
+                                 [(now, key) for key, _ in rows])
+        self._db.commit()                           # don't hold SQLite's write lock between calls
+
+    def _allocate_slots(self, n: int) -> List[int]:
+        slots = [s for (s,) in self._db.execute("SELECT slot FROM free_slots LIMIT ?", (n,))]
+        self._db.executemany("DELETE FROM free_slots WHERE slot = ?", [(s,) for s in slots])
+        while len(slots) < n:
+            slots.append(self.next_slot)
+            self.next_slot += 1
+        self._grow(self.next_slot)
+        return slots
+
+    def _evict(self, incoming: int = 0):
+        """Free least recently used entries so that `incoming` new ones fit within max_entries."""
+        (count,) = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()
+        excess = count + incoming - self.max_entries
+        if excess <= 0:
+            return
+        victims = self._db.execute(
+            "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (excess,)
+        ).fetchall()
+        self._db.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in victims])
+        self._db.executemany("INSERT OR IGNORE INTO free_slots (slot) VALUES (?)", [(s,) for _, s in victims])
+        for key, _ in victims:
+            self._memory.pop(key, None)
+
+    def _store(self, keys: List[str], vectors: np.ndarray):
+        # Slot allocation reads and bumps shared state, so the whole write runs under the file lock
+        with self._file_lock():
+            self._reload_meta()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+            # Another process may have stored some of these meanwhile; re-inserting would leak their slots
+            stored = {k for i in range(0, len(keys), 500) for (k,) in self._db.execute(
+                f"SELECT key FROM entries WHERE key IN ({','.join('?' * len(keys[i:i + 500]))})", keys[i:i + 500])}
+            new = [(k, v) for k, v in zip(keys, vectors) if k not in stored][:self.max_entries]
+            if new:
+                self._evict(len(new))                   # before allocating: the file never outgrows max_entries
+                slots = self._allocate_slots(len(new))
+                for slot, (_, vector) in zip(slots, new):
+                    self._vectors[slot] = vector
+                self._vectors.flush()
+                now = time.time()
+                self._db.executemany("INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                                     [(k, s, now) for (k, _), s in zip(new, slots)])
+                self._save_meta()
+            self._db.commit()
+        for key, vector in zip(keys, vectors):
+            self._remember(key, np.array(vector))
+
+    # ---------------- public API ----------------
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Same contract as the wrapped embedder; only texts never seen before hit the backend."""
+        keys = [text_key(self.model_id, t) for t in texts]
+        with self._lock:
+            found = self._lookup(list(dict.fromkeys(keys)))
+
+        missing = {}                    # key → text, deduplicated, first occurrence wins
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        hits = len(texts) - sum(1 for k in keys if k in missing)
+        self.hits += hits
+        self.misses += len(missing)
+        tracer = get_tracer()
+        tracer.count("embedding_cache", hits, result="hit")
+        tracer.count("embedding_cache", len(missing), result="miss")
+
+        if missing:
+            new_vectors = np.asarray(self.embedder.encode(list(missing.values())), dtype=np.float32)
+            with self._lock:
+                self._store(list(missing), new_vectors)
+            found.update(zip(missing, new_vectors))
+
+        if not texts:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.stack([found[k] for k in keys]).astype(np.float32, copy=False)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "memory_items": len(self._memory)}
+
+    def close(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            self._db.close()
+            self._lock_file.close()
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def with_cache(embedder, cache_dir: str = DEFAULT_CACHE_DIR):
+    """
+    Wrap `embedder` in a CachedEmbedder, sharing one cache per (directory, model)
+    in this process. Already-cached embedders are returned unchanged.
+
+    There is exactly one CachedEmbedder per cache file: a second embedder instance
+    with the same model_id gets the existing one (which keeps encoding with the
+    first instance — same model_id means the same vectors).
+    """
+    if isinstance(embedder, CachedEmbedder):
+        return embedder
+    key = (os.path.abspath(cache_dir), getattr(embedder, "model_id", type(embedder).__name__))
+    with _shared_lock:
+        cached = _shared.get(key)
+        if cached is None:
+            cached = _shared[key] = CachedEmbedder(embedder, cache_dir)
+        return cached
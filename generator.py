@@ -1,8 +1,47 @@
 # generator.py
-import openai
 import os
 import time
 import random
+from resources import get_resources, llm_base_url
+from tracing import get_tracer
+
+# Tried in order; the second one is the fallback.
+MODELS = [
+    "openai/gpt-oss-120b:cerebras",
+    "openai/gpt-oss-20b:fireworks-ai"
+]
+
+
+def models_id() -> str:
+    # Which models answer (in fallback order): part of the answer cache key
+    return ",".join(MODELS)
+
+
+def _build_messages(query: str, retrieved_chunks: list[str]) -> list[dict]:
+    context = "\n\n".join(retrieved_chunks)
+    
+    # Enhanced prompt for complete responses
+    system_prompt = """You are a helpful assistant that answers questions based on provided context. 
+    Provide complete, well-structured answers using only the information from the context. 
+    Always finish your sentences and provide comprehensive responses."""
+    
+    user_prompt = f"""Context:
+{context}
+
+Question: {query}
+
+Please provide a complete and detailed answer based on the context above."""
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def _looks_complete(answer: str) -> bool:
+    # Check if answer seems complete (basic validation)
+    return len(answer) > 20 and not answer.endswith(('—', '-', 'who is', 'that is', 'which is'))
+
 
 def generate_answer_hf_api(
     query: str,
@@ -19,64 +58,208 @@ def generate_answer_hf_api(
     if not hf_key:
         raise RuntimeError("HUGGINGFACE_API_KEY not set")
     
-    context = "\n\n".join(retrieved_chunks)
+    messages = _build_messages(query, retrieved_chunks)
     
-    # Enhanced prompt for complete responses
-    system_prompt = """You are a helpful assistant that answers questions based on provided context. 
-    Provide complete, well-structured answers using only the information from the context. 
-    Always finish your sentences and provide comprehensive responses."""
+    # Try GPT-OSS models with higher token limits (shared, long-lived client)
+    client = get_resources().llm()
     
-    user_prompt = f"""Context:
-{context}
-
-Question: {query}
-
-Please provide a complete and detailed answer based on the context above."""
-    
-    # Try GPT-OSS models with higher token limits
-    client = openai.OpenAI(
-        base_url="https://router.huggingface.co/v1",
-        api_key=hf_key
-    )
-    
-    models = [
-        "openai/gpt-oss-120b:cerebras",
-        "openai/gpt-oss-20b:fireworks-ai"
-    ]
-    
-    for model in models:
+    tracer = get_tracer()
+    for model in MODELS:
         try:
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                max_tokens=max_tokens,  
-                temperature=temperature,
-            
-                stop=None  # Let it finish naturally
-            )
+            with tracer.span("llm.generate", model=model) as span:
+                response = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,  
+                    temperature=temperature,
+                
+                    stop=None  # Let it finish naturally
+                )
+                if response.usage:
+                    span["prompt_tokens"] = response.usage.prompt_tokens
+                    span["completion_tokens"] = response.usage.completion_tokens
             
             answer = response.choices[0].message.content.strip()
             
-            # Check if answer seems complete (basic validation)
-            if len(answer) > 20 and not answer.endswith(('—', '-', 'who is', 'that is', 'which is')):
+            if _looks_complete(answer):
                 return answer
             else:
                 print(f"⚠️  {model} gave incomplete answer: {answer[-50:]}")
+                tracer.count("llm_fallback", model=model, reason="incomplete")
                 continue
                 
         except Exception as e:
             print(f"❌ Model {model} failed: {e}")
+            tracer.count("llm_fallback", model=model, reason="error")
             continue
     
     raise RuntimeError("All GPT-OSS models failed or gave incomplete answers")
 
+
+async def agenerate_answer_hf_api(
+    query: str,
+    retrieved_chunks: list[str],
+    client,                      # openai.AsyncOpenAI bound to the caller's event loop
+    max_tokens: int = 300,
+    temperature: float = 0.2,
+) -> str:
+    """Async twin of generate_answer_hf_api (same models, same fallback order)."""
+    messages = _build_messages(query, retrieved_chunks)
+    tracer = get_tracer()
+    for model in MODELS:
+        try:
+            with tracer.span("llm.generate", model=model) as span:
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                )
+                if response.usage:
+                    span["prompt_tokens"] = response.usage.prompt_tokens
+                    span["completion_tokens"] = response.usage.completion_tokens
+            answer = response.choices[0].message.content.strip()
+            if _looks_complete(answer):
+                return answer
+            print(f"⚠️  {model} gave incomplete answer: {answer[-50:]}")
+            tracer.count("llm_fallback", model=model, reason="incomplete")
+        except Exception as e:
+            print(f"❌ Model {model} failed: {e}")
+            tracer.count("llm_fallback", model=model, reason="error")
+
+    raise RuntimeError("All GPT-OSS models failed or gave incomplete answers")
+
+
+def stream_answer_hf_api(
+    query: str,
+    retrieved_chunks: list[str],
+    max_tokens: int = 300,
+    temperature: float = 0.2,
+):
+    """
+    Streaming version of generate_answer_hf_api: yields text pieces as the model
+    produces them (works directly with st.write_stream).
+
+    Falls back to the next model if one fails before producing any token; once
+    tokens have been shown they can't be taken back, so a later failure raises.
+    The completeness check runs on the final text and only warns. The full
+    answer is the generator's return value (StopIteration.value).
+    """
+    hf_key = os.getenv("HUGGINGFACE_API_KEY")
+    if not hf_key:
+        raise RuntimeError("HUGGINGFACE_API_KEY not set")
+
+    messages = _build_messages(query, retrieved_chunks)
+    client = get_resources().llm()
+    tracer = get_tracer()
+
+    for model in MODELS:
+        pieces = []
+        start, first_token = time.perf_counter(), None
+        try:
+            stream = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+            )
+            for event in stream:
+                if not event.choices:
+                    continue
+                delta = event.choices[0].delta.content
+                if delta:
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    pieces.append(delta)
+                    yield delta
+        except Exception as e:
+            tracer.record("llm.stream", time.perf_counter() - start, model=model, error=type(e).__name__)
+            if pieces:
+                raise RuntimeError(f"Model {model} failed mid-answer: {e}") from e
+            print(f"❌ Model {model} failed: {e}")
+            tracer.count("llm_fallback", model=model, reason="error")
+            continue
+
+        tracer.record("llm.stream", time.perf_counter() - start, model=model, pieces=len(pieces),
+                      first_token_ms=round(1000 * (first_token or 0)))
+        answer = "".join(pieces).strip()
+        if not answer:
+            print(f"⚠️  {model} returned an empty answer")
+            tracer.count("llm_fallback", model=model, reason="empty")
+            continue
+        if not _looks_complete(answer):
+            print(f"⚠️  {model} gave incomplete answer: {answer[-50:]}")
+        return answer
+
+    raise RuntimeError("All GPT-OSS models failed or gave incomplete answers")
+
+async def astream_answer_hf_api(
+    query: str,
+    retrieved_chunks: list[str],
+    client,                      # openai.AsyncOpenAI bound to the caller's event loop
+    max_tokens: int = 300,
+    temperature: float = 0.2,
+    outcome: dict = None,        # filled with {"answer", "model", "complete"} when the stream ends
+):
+    """
+    Async twin of stream_answer_hf_api (same models, same fallback rules). An async
+    generator can't return a value, so the full answer is left in `outcome`; "complete"
+    is False when the completeness check failed or the model stopped at max_tokens.
+    """
+    outcome = {} if outcome is None else outcome
+    messages = _build_messages(query, retrieved_chunks)
+    tracer = get_tracer()
+
+    for model in MODELS:
+        pieces = []
+        start, first_token, finish_reason = time.perf_counter(), None, None
+        try:
+            stream = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+            )
+            async for event in stream:
+                if not event.choices:
+                    continue
+                finish_reason = event.choices[0].finish_reason or finish_reason
+                delta = event.choices[0].delta.content
+                if delta:
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    pieces.append(delta)
+                    yield delta
+        except Exception as e:
+            tracer.record("llm.stream", time.perf_counter() - start, model=model, error=type(e).__name__)
+            if pieces:
+                raise RuntimeError(f"Model {model} failed mid-answer: {e}") from e
+            print(f"❌ Model {model} failed: {e}")
+            tracer.count("llm_fallback", model=model, reason="error")
+            continue
+
+        tracer.record("llm.stream", time.perf_counter() - start, model=model, pieces=len(pieces),
+                      first_token_ms=round(1000 * (first_token or 0)))
+        answer = "".join(pieces).strip()
+        if not answer:
+            print(f"⚠️  {model} returned an empty answer")
+            tracer.count("llm_fallback", model=model, reason="empty")
+            continue
+        complete = _looks_complete(answer) and finish_reason != "length"
+        if not complete:
+            print(f"⚠️  {model} gave incomplete answer: {answer[-50:]}")
+        outcome.update(answer=answer, model=model, complete=complete)
+        return
+
+    raise RuntimeError("All GPT-OSS models failed or gave incomplete answers")
+
 def try_gpt_oss_models(hf_key, system_prompt, user_prompt, max_tokens, temperature):
     """Try GPT-OSS models with fresh client"""
+    import openai
     client = openai.OpenAI(
-        base_url="https://router.huggingface.co/v1",
+        base_url=llm_base_url(),
         api_key=hf_key
     )
     
@@ -104,13 +287,14 @@ def try_gpt_oss_models(hf_key, system_prompt, user_prompt, max_tokens, temperatu
 
 def try_gpt_oss_with_retry(hf_key, system_prompt, user_prompt, max_tokens, temperature):
     """Retry GPT-OSS with backoff and jitter"""
+    import openai
     for attempt in range(3):
         try:
             # Add random delay to avoid rate limits
             time.sleep(random.uniform(1, 3))
             
             client = openai.OpenAI(
-                base_url="https://router.huggingface.co/v1",
+                base_url=llm_base_url(),
                 api_key=hf_key
             )
             
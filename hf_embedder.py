@@ -1,27 +1,91 @@
 # hf_embedder.py
-import os, requests
+import os, time, random, requests
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
+import numpy as np
+from resources import get_resources, hf_router_url
+from tracing import get_tracer
+
+RETRY_STATUS = {429, 502, 503, 504}   # rate limited / model loading / gateway hiccups
+
 
 class HFEmbedderAPI:
-    def __init__(self, model_id="sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(self, model_id="sentence-transformers/all-MiniLM-L6-v2",
+                 batch_size: int = 32,          # max texts per request
+                 max_batch_chars: int = 20000,  # keeps payloads under the router's size limit
+                 max_workers: int = 4,          # parallel requests in flight
+                 max_retries: int = 5,
+                 timeout: float = 60,
+                 session=None):                 # defaults to the process-wide pooled session
         self.model_id = model_id
         self.api_key   = os.getenv("HUGGINGFACE_API_KEY")
+        self.batch_size = batch_size
+        self.max_batch_chars = max_batch_chars
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.timeout = timeout
 
-    def encode(self, texts: List[str]):
-        url = (
-            f"https://router.huggingface.co/hf-inference/models/"
+        self.url = (
+            f"{hf_router_url()}/hf-inference/models/"
             f"{self.model_id}/pipeline/feature-extraction"
         )
 
-        headers = {
+        # Shared pooled session: keep-alive connections are reused across batches and calls.
+        self.session = session or get_resources().http_session()
+        self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type":  "application/json",
         }
 
-        resp = requests.post(url, headers=headers, json={"inputs": texts})
-        
-        if resp.status_code != 200:
-            raise RuntimeError(
-                f"Hugging Face API error {resp.status_code}: {resp.text}"
-            )
-        return resp.json()          # list[list[float]]
+    def _micro_batches(self, texts: List[str]):
+        """Split inputs into (start, batch) pairs bounded by count and total characters."""
+        start, batch, chars = 0, [], 0
+        for i, text in enumerate(texts):
+            if batch and (len(batch) >= self.batch_size or chars + len(text) > self.max_batch_chars):
+                yield start, batch
+                start, batch, chars = i, [], 0
+            batch.append(text)
+            chars += len(text)
+        if batch:
+            yield start, batch
+
+    def _post(self, batch: List[str]):
+        for attempt in range(self.max_retries + 1):
+            try:
+                resp = self.session.post(self.url, headers=self.headers, json={"inputs": batch},
+                                         timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise RuntimeError(f"Hugging Face API unreachable: {e}") from e
+                resp = None
+
+            if resp is not None:
+                if resp.status_code == 200:
+                    return resp.json()          # list[list[float]]
+                if resp.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                    raise RuntimeError(
+                        f"Hugging Face API error {resp.status_code}: {resp.text}"
+                    )
+
+            get_tracer().count("hf_embed_retry", status=resp.status_code if resp is not None else "conn")
+            # Exponential backoff with jitter; honour Retry-After when the router sends it.
+            delay = min(2 ** attempt, 30) + random.uniform(0, 1)
+            if resp is not None and resp.headers.get("Retry-After", "").isdigit():
+                delay = max(delay, float(resp.headers["Retry-After"]))
+            time.sleep(delay)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embed texts; returns a float32 matrix of shape (len(texts), dim) in input order."""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        batches = list(self._micro_batches(texts))
+        with get_tracer().span("embed.hf_api", texts=len(texts), requests=len(batches)):
+            if len(batches) == 1:
+                results = [self._post(batches[0][1])]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as pool:
+                    results = list(pool.map(lambda b: self._post(b[1]), batches))  # map keeps order
+
+        vectors = np.asarray([v for batch in results for v in batch], dtype=np.float32)
+        return vectors
@@ -0,0 +1,110 @@
+# incremental.py
+"""
+Re-ingest an already indexed PDF by diffing content hashes.
+
+Every chunk carries `content_hash` (its text) and `page_hash` (its page).
+On re-ingestion each new chunk is compared against what is stored for the file:
+
+  unchanged  same index, same text, same page       → nothing to do
+  reused     text already stored (maybe elsewhere)   → upsert with the stored vector, no embedding
+  embedded   text not seen before                    → embed + upsert
+  deleted    stored indexes past the new chunk count → removed
+  migrated   legacy objects with random UUIDs        → re-written under deterministic ids, then removed
+  failed     inserts that did not go through         → counted apart; their legacy copies are kept
+
+Chunk UUIDs come from (file_name, chunk_index), so upserts overwrite in place.
+"""
+from chunk_ids import chunk_uuid
+from pipeline import prepare_chunks, enqueue_for_summary
+from answer_cache import get_answer_cache
+from tracing import get_tracer
+
+
+def sync_document(pdf_path, handler, embedder,
+                  chunk_size: int = 512, chunk_overlap: int = 64, min_tokens: int = 50,
+                  summary_queue=None, tables: bool = None) -> dict:
+    """
+    Bring the stored chunks of `pdf_path` in line with the file on disk. Returns counts per outcome.
+    tables must match the setting the file was ingested with, or every table page shows up as changed.
+    """
+    tracer = get_tracer()
+    with tracer.span("ingest.prepare") as span:
+        file_name, texts, metas = prepare_chunks(pdf_path, chunk_size, chunk_overlap, min_tokens, tables)
+        span["chunks"] = len(texts)
+    with tracer.span("ingest.fetch_stored"):
+        stored = handler.fetch_file_chunks(file_name)
+    # Objects ingested before UUIDs were derived from (file_name, chunk_index) would never be
+    # overwritten by an upsert: they only count as vector sources and are removed below.
+    legacy = [s for s in stored if s.get("chunk_index") is None
+              or str(s["uuid"]) != str(chunk_uuid(file_name, s["chunk_index"]))]
+    legacy_ids = {str(s["uuid"]) for s in legacy}
+    by_index = {s["chunk_index"]: s for s in stored if str(s["uuid"]) not in legacy_ids}
+    by_hash = {s["content_hash"]: s for s in stored if s.get("content_hash")}
+
+    report = {"file_name": file_name, "unchanged": 0, "reused": 0, "embedded": 0, "deleted": 0,
+              "migrated": 0, "failed": 0}
+    reuse, embed = [], []            # indexes into texts/metas
+    for i, meta in enumerate(metas):
+        old = by_index.get(i)
+        if (old and old.get("content_hash") == meta["content_hash"]
+                and old.get("page") == meta["page"] and old.get("page_hash") == meta["page_hash"]):
+            report["unchanged"] += 1
+        elif meta["content_hash"] in by_hash:
+            reuse.append(i)
+        else:
+            embed.append(i)
+
+    def failed_indexes(indexes, failed):
+        failed_ids = {str(uid) for uid, _ in failed or []}
+        return {i for i in indexes if str(chunk_uuid(file_name, metas[i]["chunk_index"])) in failed_ids}
+
+    not_written = set()              # indexes whose insert failed
+    if reuse:
+        sources = {i: by_hash[metas[i]["content_hash"]] for i in reuse}
+        vectors = handler.fetch_vectors([s["uuid"] for s in sources.values()])
+        reuse = [i for i in reuse if sources[i]["uuid"] in vectors]   # vanished meanwhile → embed instead
+        embed += [i for i in sources if i not in reuse]
+        if reuse:
+            failed = handler.insert_chunks([texts[i] for i in reuse],
+                                           [vectors[sources[i]["uuid"]] for i in reuse],
+                                           [{**metas[i], "summary": sources[i].get("summary") or ""} for i in reuse],
+                                           skip_existing=False)
+            lost = failed_indexes(reuse, failed)
+            not_written |= lost
+            report["reused"] = len(reuse) - len(lost)
+
+    if embed:
+        embed.sort()
+        vectors = embedder.encode([texts[i] for i in embed])
+        failed = handler.insert_chunks([texts[i] for i in embed], vectors, [metas[i] for i in embed],
+                                       skip_existing=False)
+        lost = failed_indexes(embed, failed)
+        not_written |= lost
+        report["embedded"] = len(embed) - len(lost)
+        if summary_queue is not None:          # new text → new summary needed
+            enqueue_for_summary(summary_queue, [metas[i] for i in embed], failed)
+    report["failed"] = len(not_written)
+
+    if legacy:
+        # Their text now lives under deterministic ids, except where that write failed: those
+        # legacy objects stay (as vector sources for the next sync) until it succeeds
+        missing_hashes = {metas[i]["content_hash"] for i in not_written}
+        obsolete = [s["uuid"] for s in legacy
+                    if s.get("content_hash") not in missing_hashes
+                    and (s.get("content_hash") or not not_written)]
+        report["migrated"] = handler.delete_chunks(obsolete) if obsolete else 0
+    if any(index >= len(texts) for index in by_index):
+        report["deleted"] = handler.delete_chunks_from(file_name, len(texts))
+
+    for outcome in ("unchanged", "reused", "embedded", "deleted", "migrated", "failed"):
+        tracer.count("sync_chunks", report[outcome], outcome=outcome)
+    if report["reused"] or report["embedded"] or report["deleted"] or report["migrated"]:
+        get_answer_cache().invalidate_file(file_name)
+    return report
+
+
+def format_sync_report(report: dict) -> str:
+    return (f"{report['file_name']}: {report['unchanged']} unchanged, {report['reused']} reused, "
+            f"{report['embedded']} embedded, {report['deleted']} deleted"
+            + (f", {report['migrated']} migrated" if report.get("migrated") else "")
+            + (f", {report['failed']} failed" if report.get("failed") else ""))
@@ -0,0 +1,109 @@
+# local_embedder.py
+import os
+from typing import List
+import numpy as np
+from tracing import get_tracer
+
+# ONNX exports shipped in the sentence-transformers repo on the HF hub.
+ONNX_FILES = {
+    "fp32": "onnx/model.onnx",
+    "int8": "onnx/model_quint8_avx2.onnx",   # dynamic int8 quantization, runs well on any x86-64 CPU
+}
+
+
+def load_onnx_session(model_id: str, onnx_file: str, num_threads: int):
+    """Download (once, via the HF cache) and open an ONNX model for CPU inference."""
+    import onnxruntime as ort
+    from huggingface_hub import hf_hub_download
+
+    path = onnx_file if os.path.exists(onnx_file) else hf_hub_download(model_id, onnx_file)
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = num_threads
+    opts.inter_op_num_threads = 1
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+
+
+def load_tokenizer(model_id: str, max_length: int):
+    from tokenizers import Tokenizer
+
+    tokenizer = Tokenizer.from_pretrained(model_id)
+    tokenizer.enable_truncation(max_length=max_length)
+    tokenizer.no_padding()            # we pad ourselves, per length-sorted batch
+    return tokenizer
+
+
+class LocalONNXEmbedder:
+    """
+    CPU embedder with the same .encode(list[str]) contract as HFEmbedderAPI.
+
+    Runs all-MiniLM-L6-v2 through ONNX Runtime (int8-quantized by default),
+    mean-pools the token states and L2-normalizes, which matches what the
+    HF feature-extraction endpoint returns for this model.
+    """
+
+    def __init__(self, model_id="sentence-transformers/all-MiniLM-L6-v2",
+                 quantized: bool = True,
+                 onnx_file: str = None,       # local path or repo file; overrides `quantized`
+                 num_threads: int = None,
+                 batch_size: int = 32,
+                 max_length: int = 256):      # the model was trained on 256 word pieces
+        # Cache/batcher identity: the same repo id through the API, int8 or fp32 gives different vectors
+        self.repo_id = model_id
+        self.model_id = f"{model_id}:onnx-{onnx_file or ('int8' if quantized else 'fp32')}"
+        self.batch_size = batch_size
+        self.max_length = max_length
+        num_threads = num_threads or int(os.getenv("EMBED_THREADS", os.cpu_count() or 1))
+
+        self.tokenizer = load_tokenizer(model_id, max_length)
+        self.session = load_onnx_session(model_id, onnx_file or ONNX_FILES["int8" if quantized else "fp32"],
+                                         num_threads)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _run_batch(self, encodings) -> np.ndarray:
+        n = len(encodings)
+        seq_len = max(len(e.ids) for e in encodings)
+        # Fresh arrays per call: encode() is called from several threads (API server, batcher)
+        ids = np.zeros((n, seq_len), dtype=np.int64)
+        mask = np.zeros((n, seq_len), dtype=np.int64)
+        for row, enc in enumerate(encodings):
+            ids[row, :len(enc.ids)] = enc.ids
+            mask[row, :len(enc.ids)] = 1
+
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros((n, seq_len), dtype=np.int64)
+        hidden = self.session.run(None, feeds)[0]          # (n, seq_len, dim)
+
+        weights = mask[..., None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embed texts; returns a float32 matrix of shape (len(texts), dim) in input order."""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        with get_tracer().span("embed.onnx", texts=len(texts)) as span:
+            encodings = self.tokenizer.encode_batch(texts)
+            # Batch by sorted sequence length so each batch pads to a similar length.
+            order = sorted(range(len(texts)), key=lambda i: len(encodings[i].ids))
+            span["tokens"] = sum(len(e.ids) for e in encodings)
+
+            out = None
+            for start in range(0, len(order), self.batch_size):
+                idx = order[start:start + self.batch_size]
+                vectors = self._run_batch([encodings[i] for i in idx])
+                if out is None:
+                    out = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+                out[idx] = vectors
+        return out
+
+
+def make_embedder(backend: str = None):
+    """EMBEDDER_BACKEND=local runs on this machine; anything else uses the HF router."""
+    backend = backend or os.getenv("EMBEDDER_BACKEND", "api")
+    if backend == "local":
+        return LocalONNXEmbedder()
+    from hf_embedder import HFEmbedderAPI
+    return HFEmbedderAPI()
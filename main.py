@@ -1,15 +1,12 @@
-import os
+import os, threading
 from dotenv import load_dotenv
-from pdf_extraction import extract_text_as_documents
-from chunking import chunk_texts
-from weaviate_handler import WeaviateHandler
-from rag import RAGRetriever
-from hf_embedder import HFEmbedderAPI 
-from weaviate import connect_to_local
-import weaviate.classes as wvc 
-from generator import generate_answer_hf_api
-from strategy import choose_strategy
-from summarizer import get_or_create_summary
+from embedded_store import open_handler
+from async_engine import AsyncQueryEngine
+from local_embedder import make_embedder
+from embedding_cache import with_cache
+from resources import get_resources
+from answer_cache import get_answer_cache
+from tracing import get_tracer
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning,
                         message=".*swigvarlink.*")
@@ -26,107 +23,118 @@ CHUNK_SIZE = 512
 CHUNK_OVERLAP = 64
 MIN_TOKENS = 50  # ⏳ Minimum tokens to keep a chunk
 MODEL_CONTEXT = 2048 # Zephyr context
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")  # "vector" | "hybrid" (BM25 + vector)
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))  # over-fetched, then cut to k by the cross-encoder
+EXTRACT_TABLES = os.getenv("EXTRACT_TABLES") == "1"  # tables as row text (implies PDF_LAYOUT); ingest and re-sync must agree
 
-# Load embedding model
-embedding_model = HFEmbedderAPI() 
+# Everything below is built on first use: a query-only process (e.g. api_server.py answering
+# questions) never imports the ingestion stack (PyMuPDF, chunker, pipeline) and starts faster.
+_embedder = _reranker = _summary_queue = _engine = None
+_init_lock = threading.RLock()         # api_server's query workers may race for the first build
 
-def generate_metadata(chunk_index, file_name, page=None, section="N/A"):
-    return {
-        "chunk_index": chunk_index,
-        "file_name": file_name,
-        "page": page or 0,
-        "section": section,
-    }
 
-def ingest_pdf(pdf_path):
-    file_name = os.path.basename(pdf_path) #would work for both with pdf_path being either a full path or just something like "sample.pdf"
-    with connect_to_local(port=8080, grpc_port=50051) as client:
-        handler = WeaviateHandler(COLLECTION_NAME, client)
-
-        # ---- duplication check ----
-        if handler.document_already_exists(file_name):
-            print(f"⚠️  {file_name} is already in Weaviate — skipping ingestion.")
-            return
-        # ---------------------------
-    
-    
-    print(f"📄 Processing: {file_name}")
+def get_embedder():
+    # EMBEDDER_BACKEND=local|api; repeated chunks / questions skip the remote call
+    global _embedder
+    with _init_lock:
+        if _embedder is None:
+            _embedder = with_cache(make_embedder())
+        return _embedder
 
-    # 1. Extract full text from PDF
-    docs = extract_text_as_documents(pdf_path)
-    
-    # Step 1.5: Clean line breaks and excess spacing in each page. This increases the chunk qualty considerably. 
-    cleaned_docs = [doc.replace("\n", " ").replace("  ", " ").strip() for doc in docs]
-
-    # Step 2: Chunk
-    chunked_docs = chunk_texts(cleaned_docs, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-
-    # Step 2.5: Extract chunks and filter by length
-    # keep only docs that pass the MIN_TOKENS filter
-    filtered_docs = [
-        doc for doc in chunked_docs
-        if len(doc.page_content.split()) >= MIN_TOKENS
-        ]
-    
-    # texts you will embed
-    chunks = [doc.page_content for doc in filtered_docs]
-
-    print(f"✂️ Split into {len(chunks)} chunks after filtering short ones.")
 
-    # 3. Generate embeddings
-    embeddings = embedding_model.encode(chunks)  #  returns list[list[float]]
+def get_reranker():
+    # RERANK=1 re-scores the over-fetched candidates with a local CPU cross-encoder
+    global _reranker
+    with _init_lock:
+        if _reranker is None and os.getenv("RERANK") == "1":
+            from reranker import CrossEncoderReranker
+            _reranker = CrossEncoderReranker()
+        return _reranker
 
-    # 4. Generate metadata
-    metadatas = [
-        generate_metadata(i, file_name, page=doc.metadata["page"])
-        for i, doc in enumerate(filtered_docs)
-        ]
-    
 
-    # 5. Store into Weaviate
+def get_summary_queue():
+    # PRESUMMARIZE=1 queues new chunks for the background summariser (python summary_worker.py)
+    global _summary_queue
+    with _init_lock:
+        if _summary_queue is None and os.getenv("PRESUMMARIZE") == "1":
+            from summary_worker import SummaryQueue
+            _summary_queue = SummaryQueue()
+        return _summary_queue
 
-    with connect_to_local(
-            port=8080,
-            grpc_port=50051,
-            additional_config=wvc.init.AdditionalConfig(
-                timeout=wvc.init.Timeout(init=10))
-        ) as client:                           # ← client auto-closes on exit.
-        
-        handler = WeaviateHandler(COLLECTION_NAME,client)
-        handler.insert_chunks(chunks, embeddings, metadatas)
 
+def ingest_pdf(pdf_path):
+    """Ingest (or re-sync) one PDF; returns the pipeline / sync report (with its trace)."""
+    with get_tracer().trace("ingest_pdf", file=os.path.basename(pdf_path)) as trace:
+        report = _ingest_pdf(pdf_path)
+    print("⏱️  Spans:", {name: f"{t['total_ms']:.0f} ms ×{t['count']}" for name, t in trace.totals().items()})
+    return {**report, "trace": trace.totals()}
 
-def run_rag_query_and_generate(query,k):
-    print(f"\n💬 Query: {query}")
-
-    with connect_to_local(port=8080, grpc_port=50051) as client:
-        retriever = RAGRetriever(COLLECTION_NAME, embedding_model, client)
-        hits = retriever.retrieve(query, k=k)# [{'text', 'summary', ...}]
-
-        collection = retriever.weaviate_handler.collection
-
-    # Decide which tactic to use
-    strategy = choose_strategy(len(hits), CHUNK_SIZE, MODEL_CONTEXT)
-    print("🔧 Chosen strategy →", strategy)
-
-    if strategy == "full_text":
-        context  = [h["text"] for h in hits]
-
-    
-    elif strategy == "sliding_window":
-        window_tokens = 200           # first 200-token slice of each hit
-        context = [h["text"].split()[:window_tokens] for h in hits]
-        context = [" ".join(t) for t in context]
-
-    elif strategy == "summarize":
-        context = [get_or_create_summary(h, collection) for h in hits]
 
-    sources = sorted({f"{h['file_name']} page {h['page']}" for h in hits}) #removes duplicates
+def _ingest_pdf(pdf_path):
+    from pipeline import IngestPipeline, format_report
+    from incremental import sync_document, format_sync_report
+    file_name = os.path.basename(pdf_path) #would work for both with pdf_path being either a full path or just something like "sample.pdf"
+    client = get_resources().vector_client()   # shared Weaviate connection, or the embedded store
+    handler = open_handler(COLLECTION_NAME, client)
+
+    # ---- already indexed: only re-embed what changed ----
+    if handler.document_already_exists(file_name):
+        print(f"♻️  {file_name} is already indexed — syncing changed chunks only.")
+        report = sync_document(pdf_path, handler, get_embedder(),
+                               chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                               min_tokens=MIN_TOKENS, summary_queue=get_summary_queue(), tables=EXTRACT_TABLES)
+        print(f"⏱️  {format_sync_report(report)}")
+        return {"mode": "sync", **report}
+    # ---------------------------
 
-    answer = generate_answer_hf_api(query, context)
+    print(f"📄 Processing: {file_name}")
 
-    print("\n Answer:\n", answer)
-    print("\n Sources:", ", ".join(sources))
+    # Extract → clean → chunk → filter → embed → store, streamed page by page
+    pipeline = IngestPipeline(handler, get_embedder(),
+                              chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                              min_tokens=MIN_TOKENS, summary_queue=get_summary_queue(), tables=EXTRACT_TABLES)
+    report = pipeline.run(pdf_path)
+    print(f"⏱️  {format_report(report)}")
+    return {"mode": "ingest", "file_name": file_name, **report}
+
+
+def get_engine(query_embedder=None):
+    # Built on first query: ingestion-only runs never open the async clients.
+    # query_embedder: e.g. api_server's QueryBatcher around get_embedder()
+    global _engine
+    with _init_lock:
+        if _engine is None:
+            from context_packer import ContextPacker
+            packer = ContextPacker(MODEL_CONTEXT, answer_tokens=300)    # default 300 answer tokens
+            _engine = AsyncQueryEngine(COLLECTION_NAME, query_embedder or get_embedder(), packer,
+                                       candidates=RERANK_CANDIDATES)
+        return _engine
+
+
+def run_rag_query_and_generate(query,k, filters=None, hybrid=None):
+    # filters: optional scope, e.g. {"file_names": ["test.pdf"], "page_range": (1, 20)}
+    # hybrid: None → RETRIEVAL_MODE
+    print(f"\n💬 Query: {query}")
+    if hybrid is None:
+        hybrid = RETRIEVAL_MODE == "hybrid"
+
+    # embed ∥ BM25 → search → rerank → answer cache → pack (summaries) → generate, with per-stage timeouts
+    result = get_engine().answer(query, k, hybrid=hybrid, filters=filters, reranker=get_reranker())
+    print("⏱️  Stages:", {stage: f"{t * 1000:.0f} ms" for stage, t in result["timings"].items()})
+    if result["events"]:
+        print("📊 Events:", result["events"])
+
+    if result["cached"]:
+        # Same (or near-identical) question over the same chunks → reused answer
+        print("\n Answer (cached):\n", result["answer"])
+        print("\n Sources:", ", ".join(result["sources"]))
+        print("📊 Answer cache:", get_answer_cache().stats())
+        return result
+
+    print("🔧 Context →", result["strategy"])
+    print("\n Answer:\n", result["answer"])
+    print("\n Sources:", ", ".join(result["sources"]))
+    return result
     
 
 if __name__ == "__main__":
@@ -1,19 +1,163 @@
-import fitz  # PyMuPDF
+import os, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
 
+# PDF_LAYOUT=1 rebuilds reading order from text blocks (multi-column slides / papers);
+# EXTRACT_TABLES=1 also turns detected tables into row text (and implies PDF_LAYOUT).
+# Read when extracting, so ingestion and re-sync always see the same text.
+WIDE_BLOCK = 0.6        # blocks wider than this share of the page span all columns (titles, full-width text)
 
-def extract_text_from_pdf(pdf_path, max_pages=None):
-    """Yield text and page number from the given PDF file."""
-    doc = fitz.open(pdf_path)
-    for page_num in range(len(doc)):    
-        if max_pages is not None and page_num >= max_pages:
-            break
-        page = doc[page_num]
-        text = page.get_text("text")
-        yield {
-            "page": page_num + 1,
-            "text": text,
-            "filename": pdf_path.split("/")[-1],
-        }
+
+def clean_page_text(text: str) -> str:
+    # Clean line breaks and excess spacing in each page. This increases the chunk quality considerably.
+    return text.replace("\n", " ").replace("  ", " ").strip()
+
+
+def _layout_default():
+    return os.getenv("PDF_LAYOUT") == "1"
+
+
+def _tables_default():
+    return os.getenv("EXTRACT_TABLES") == "1"
+
+
+def _block_text(block: dict) -> str:
+    return "\n".join("".join(span["text"] for span in line["spans"]) for line in block["lines"]).strip()
+
+
+def _columns(blocks):
+    """Group blocks into columns (blocks overlapping horizontally), left to right, each top to bottom."""
+    columns = []        # [x0, x1, blocks]
+    for b in sorted(blocks, key=lambda b: b["bbox"][0]):
+        x0, _, x1, _ = b["bbox"]
+        for col in columns:
+            if x0 < col[1] and x1 > col[0]:
+                col[0], col[1] = min(col[0], x0), max(col[1], x1)
+                col[2].append(b)
+                break
+        else:
+            columns.append([x0, x1, [b]])
+    ordered = []
+    for n, (_, _, col_blocks) in enumerate(sorted(columns, key=lambda c: c[0])):
+        for b in sorted(col_blocks, key=lambda b: b["bbox"][1]):
+            b["column"] = n
+            ordered.append(b)
+    return ordered
+
+
+def order_blocks(blocks: list[dict], page_width: float) -> list[dict]:
+    """
+    Reading order for a page: full-width blocks cut the page into horizontal bands,
+    and inside a band the columns are read one after the other.
+    """
+    wide = sorted((b for b in blocks if b["bbox"][2] - b["bbox"][0] >= WIDE_BLOCK * page_width),
+                  key=lambda b: b["bbox"][1])
+    narrow = deque(sorted((b for b in blocks if b["bbox"][2] - b["bbox"][0] < WIDE_BLOCK * page_width),
+                          key=lambda b: b["bbox"][1]))
+    ordered = []
+    for w in wide + [None]:
+        band_end = w["bbox"][1] if w is not None else float("inf")
+        band = []
+        while narrow and narrow[0]["bbox"][1] < band_end:
+            band.append(narrow.popleft())
+        ordered += _columns(band)
+        if w is not None:
+            w["column"] = -1        # spans the columns
+            ordered.append(w)
+    return ordered
+
+
+def _table_blocks(page):
+    """Tables found by PyMuPDF, one block per table with rows as ' | '-separated lines."""
+    blocks = []
+    for table in page.find_tables().tables:
+        rows = [" | ".join((cell or "").replace("\n", " ").strip() for cell in row) for row in table.extract()]
+        blocks.append({"bbox": tuple(table.bbox), "text": "\n".join(rows), "kind": "table"})
+    return blocks
+
+
+def _inside(bbox, outer, tol=1.0):
+    return (bbox[0] >= outer[0] - tol and bbox[1] >= outer[1] - tol
+            and bbox[2] <= outer[2] + tol and bbox[3] <= outer[3] + tol)
+
+
+def extract_page_layout(page, tables: bool = False) -> dict:
+    """
+    Text of one page in reading order, plus its blocks: {"text", "blocks": [{"bbox", "text", "column", "start", "end"}]}.
+    start/end are offsets into clean_page_text(text), the text chunk offsets refer to.
+    """
+    import fitz
+    found = _table_blocks(page) if tables else []
+    blocks = []
+    for block in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
+        if block.get("type") != 0:
+            continue                                            # images
+        bbox = tuple(round(v, 1) for v in block["bbox"])
+        if any(_inside(bbox, t["bbox"]) for t in found):
+            continue                                            # already part of a table block
+        text = _block_text(block)
+        if text:
+            blocks.append({"bbox": bbox, "text": text, "kind": "text"})
+    blocks = order_blocks(blocks + found, page.rect.width)
+
+    # Blank line between blocks. Cleaning a block on its own gives exactly its stretch of the
+    # cleaned page (blocks are stripped, so no space run crosses a block border): find them in order
+    text = "\n\n".join(b["text"] for b in blocks)
+    cleaned, offset = clean_page_text(text), 0
+    for b in blocks:
+        part = clean_page_text(b["text"])
+        start = cleaned.find(part, offset)
+        b["start"], b["end"] = (start, start + len(part)) if start != -1 else (offset, offset)
+        offset = b["end"]
+    return {"text": text, "blocks": blocks}
+
+
+def _page_record(doc, page_num, pdf_path, layout, tables):
+    page = doc[page_num]
+    record = {"page": page_num + 1, "filename": pdf_path.split("/")[-1]}
+    if layout:
+        record.update(extract_page_layout(page, tables))
+    else:
+        record["text"] = page.get_text("text")
+    return record
+
+
+def _extract_range(pdf_path, first, last, layout, tables):
+    # Runs in a worker process: every task opens its own document handle
+    import fitz
+    with fitz.open(pdf_path) as doc:
+        return [_page_record(doc, n, pdf_path, layout, tables) for n in range(first, last)]
+
+
+def extract_text_from_pdf(pdf_path, max_pages=None, layout=None, tables=None,
+                          workers: int = 1,             # >1: page ranges extracted in worker processes
+                          pages_per_task: int = 16):
+    """
+    Yield text and page number from the given PDF file, in page order.
+    layout (default: PDF_LAYOUT env) adds "blocks" with bounding boxes and rebuilds
+    multi-column reading order; tables (default: EXTRACT_TABLES env) also turns detected
+    tables into row text, which needs the layout pass and so switches it on.
+    """
+    import fitz  # PyMuPDF, loaded on first extraction rather than with the module
+    tables = _tables_default() if tables is None else tables
+    layout = (_layout_default() if layout is None else layout) or tables
+    with fitz.open(pdf_path) as doc:
+        n_pages = len(doc) if max_pages is None else min(len(doc), max_pages)
+        if workers <= 1 or n_pages <= pages_per_task:
+            for page_num in range(n_pages):
+                yield _page_record(doc, page_num, pdf_path, layout, tables)
+            return
+
+    # At most 2 ranges per worker in flight: results still stream in order and memory stays bounded.
+    # Spawned, not forked: callers (the ingestion pipeline, Streamlit) run other threads.
+    ranges = deque((i, min(i + pages_per_task, n_pages)) for i in range(0, n_pages, pages_per_task))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = deque()
+        while ranges or pending:
+            while ranges and len(pending) < 2 * workers:
+                first, last = ranges.popleft()
+                pending.append(pool.submit(_extract_range, pdf_path, first, last, layout, tables))
+            yield from pending.popleft().result()
 
 
 def extract_text_as_documents(pdf_path, max_pages=None):
@@ -22,10 +166,11 @@ def extract_text_as_documents(pdf_path, max_pages=None):
 
 if __name__ == "__main__":
     pdf_path = "sample.pdf"
-    for page_data in extract_text_from_pdf(pdf_path, max_pages=3):
+    for page_data in extract_text_from_pdf(pdf_path, max_pages=3, layout=True):
         print(f"Page {page_data['page']}: {page_data['text'][:200]}...\n")
-        
+
+"""
+Plain extraction (page.get_text("text")) stays the default. Column-wise PDFs
+need layout=True / PDF_LAYOUT=1, tables in the text tables=True / EXTRACT_TABLES=1,
+and large files extract faster with workers > 1.
 """
-This file is individually working properly. have some formatting errors with column wise pdf
-But it remains to be see if that would be a problem later. 
-"""
\ No newline at end of file
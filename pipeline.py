@@ -0,0 +1,275 @@
+# pipeline.py
+"""
+Streaming ingestion: pages flow through extract → chunk → embed → insert.
+
+Each stage runs in its own thread and hands work to the next one through a
+bounded queue, so extraction of page N+1 overlaps with embedding/inserting
+earlier pages and memory stays bounded by the queue sizes, not the document.
+Large PDFs are extracted by worker processes over page ranges (EXTRACT_WORKERS),
+still handed on in page order.
+"""
+import os, time, json, queue, hashlib, threading, contextvars
+
+from pdf_extraction import extract_text_from_pdf, clean_page_text
+from chunking import chunk_texts
+from chunk_ids import chunk_uuid
+from answer_cache import get_answer_cache
+from tracing import get_tracer
+
+_DONE = object()     # end-of-stream marker passed down the queues
+
+
+def content_hash(text: str) -> str:
+    # Whitespace-insensitive, so re-extraction noise doesn't count as an edit.
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def generate_metadata(chunk_index, file_name, page=None, section="N/A",
+                      content_hash="", page_hash="", bboxes=""):
+    return {
+        "chunk_index": chunk_index,
+        "file_name": file_name,
+        "page": page or 0,
+        "section": section,
+        "content_hash": content_hash,
+        "page_hash": page_hash,
+        "bboxes": bboxes,
+    }
+
+
+def chunk_bboxes(blocks: list[dict], start, end) -> str:
+    """JSON list of the bounding boxes of the layout blocks a chunk overlaps ("" without layout)."""
+    if not blocks or start is None:
+        return ""
+    return json.dumps([list(b["bbox"]) for b in blocks if b["start"] < end and b["end"] > start])
+
+
+def page_to_chunks(page: dict, file_name: str, first_index: int,
+                   chunk_size=512, chunk_overlap=64, min_tokens=50):
+    """Clean, chunk and filter one extracted page. Returns (texts, metadatas)."""
+    text = clean_page_text(page["text"])
+    page_hash = content_hash(text)
+    blocks = page.get("blocks")           # layout extraction: offsets are into `text`, like the chunks'
+    texts, metas = [], []
+    for doc in chunk_texts([text], chunk_size, chunk_overlap, first_page=page["page"]):
+        if len(doc.page_content.split()) < min_tokens:
+            continue
+        # LangChain documents (CHUNKER=langchain) carry no offsets
+        start = getattr(doc, "start", None)
+        metas.append(generate_metadata(first_index + len(texts), file_name, page=doc.metadata["page"],
+                                       content_hash=content_hash(doc.page_content),
+                                       page_hash=page_hash,
+                                       bboxes=chunk_bboxes(blocks, start, getattr(doc, "end", None))))
+        texts.append(doc.page_content)
+    return texts, metas
+
+
+def prepare_chunks(pdf_path, chunk_size=512, chunk_overlap=64, min_tokens=50, tables=None):
+    """
+    Extract, clean, chunk and filter a whole PDF in one go.
+    Top-level and pickle-friendly so it can run in a worker process.
+    tables: extract detected tables as row text (default: EXTRACT_TABLES env).
+    Returns (file_name, texts, metadatas).
+    """
+    file_name = os.path.basename(pdf_path)
+    texts, metas = [], []
+    for page in extract_text_from_pdf(pdf_path, tables=tables):
+        page_texts, page_metas = page_to_chunks(page, file_name, len(texts),
+                                                chunk_size, chunk_overlap, min_tokens)
+        texts += page_texts
+        metas += page_metas
+    return file_name, texts, metas
+
+
+def enqueue_for_summary(summary_queue, metas, failed=()):
+    """Hand freshly inserted chunks to the background summariser (skipping failed inserts)."""
+    failed_ids = {str(uid) for uid, _ in failed or []}
+    uuids = [str(chunk_uuid(m["file_name"], m["chunk_index"])) for m in metas]
+    uuids = [u for u in uuids if u not in failed_ids]
+    if uuids:
+        summary_queue.enqueue(uuids, metas[0]["file_name"])
+
+
+class StageStats:
+    __slots__ = ("name", "busy", "items")
+
+    def __init__(self, name):
+        self.name = name
+        self.busy = 0.0     # seconds spent doing work (not waiting on queues)
+        self.items = 0      # pages for extract/chunk, chunks for embed/insert
+
+    def as_dict(self):
+        return {"busy_s": round(self.busy, 3), "items": self.items}
+
+
+class IngestPipeline:
+    def __init__(self, handler, embedder,
+                 chunk_size: int = 512, chunk_overlap: int = 64, min_tokens: int = 50,
+                 embed_batch: int = 64,     # chunks per encode() call / insert batch
+                 queue_size: int = 4,       # max batches buffered between two stages
+                 summary_queue=None,        # optional SummaryQueue fed with every inserted chunk
+                 extract_workers: int = None,   # processes for page ranges of large PDFs (EXTRACT_WORKERS, default 1)
+                 layout: bool = None,       # layout-aware reading order; default PDF_LAYOUT env
+                 tables: bool = None):      # tables as row text (implies layout); default EXTRACT_TABLES env
+        self.handler = handler
+        self.summary_queue = summary_queue
+        self.embedder = embedder
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.min_tokens = min_tokens
+        self.embed_batch = embed_batch
+        self.queue_size = queue_size
+        self.extract_workers = extract_workers or int(os.getenv("EXTRACT_WORKERS", 1))
+        self.layout = layout
+        self.tables = tables
+
+    # ---------------- queue helpers ----------------
+    def _put(self, q, item):
+        # Give up if another stage failed, instead of blocking on a queue nobody drains.
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _stage(self, name, work, out_q):
+        """Run `work()` in a thread; on failure stop the pipeline and remember the error."""
+        def runner():
+            try:
+                work()
+            except BaseException as e:
+                self._errors.append((name, e))
+                self._stop.set()
+            finally:
+                self._put(out_q, _DONE)
+        # copy_context: spans recorded by the stage land on the caller's current trace
+        t = threading.Thread(target=contextvars.copy_context().run, args=(runner,),
+                             name=f"ingest-{name}", daemon=True)
+        t.start()
+        return t
+
+    # ---------------- stages ----------------
+    def _extract(self, pdf_path, out_q):
+        stats = self.stats["extract"]
+        pages = extract_text_from_pdf(pdf_path, layout=self.layout, tables=self.tables,
+                                      workers=self.extract_workers)
+        try:
+            while True:
+                start = time.perf_counter()
+                page = next(pages, None)
+                elapsed = time.perf_counter() - start
+                stats.busy += elapsed
+                if page is None or not self._put(out_q, page):
+                    return
+                get_tracer().record("ingest.extract", elapsed, chars=len(page["text"]))
+                stats.items += 1
+        finally:
+            pages.close()               # shuts the extraction processes down if we stop early
+
+    def _chunk(self, file_name, in_q, out_q):
+        stats = self.stats["chunk"]
+        texts, metas, chunk_index = [], [], 0
+        while (page := self._get(in_q)) is not _DONE:
+            start = time.perf_counter()
+            page_texts, page_metas = page_to_chunks(page, file_name, chunk_index, self.chunk_size,
+                                                    self.chunk_overlap, self.min_tokens)
+            texts += page_texts
+            metas += page_metas
+            chunk_index += len(page_texts)
+            elapsed = time.perf_counter() - start
+            stats.busy += elapsed
+            get_tracer().record("ingest.chunk", elapsed, chunks=len(page_texts))
+            stats.items += 1
+
+            if len(texts) >= self.embed_batch:
+                if not self._put(out_q, (texts, metas)):
+                    return
+                texts, metas = [], []
+        if texts:
+            self._put(out_q, (texts, metas))
+
+    def _embed(self, in_q, out_q):
+        stats = self.stats["embed"]
+        while (item := self._get(in_q)) is not _DONE:
+            texts, metas = item
+            start = time.perf_counter()
+            vectors = self.embedder.encode(texts)
+            elapsed = time.perf_counter() - start
+            stats.busy += elapsed
+            get_tracer().record("ingest.embed", elapsed, texts=len(texts))
+            stats.items += len(texts)
+            if not self._put(out_q, (texts, vectors, metas)):
+                return
+
+    def _insert(self, in_q):
+        stats = self.stats["insert"]
+        while (item := self._get(in_q)) is not _DONE:
+            texts, vectors, metas = item
+            start = time.perf_counter()
+            # Duplicate check already happened once, before the stream started.
+            failed = self.handler.insert_chunks(texts, vectors, metas, skip_existing=False)
+            elapsed = time.perf_counter() - start
+            stats.busy += elapsed
+            get_tracer().record("ingest.insert", elapsed, chunks=len(texts))
+            stats.items += len(texts) - len(failed or [])
+            if self.summary_queue is not None:
+                enqueue_for_summary(self.summary_queue, metas, failed)
+
+    # ---------------- entry point ----------------
+    def run(self, pdf_path) -> dict:
+        """
+        Ingest one PDF. Returns per-stage timings:
+        {"extract": {"busy_s", "items"}, ..., "wall_s": float, "chunks": int}
+        """
+        file_name = os.path.basename(pdf_path)
+        self._stop = threading.Event()
+        self._errors = []
+        self.stats = {name: StageStats(name) for name in ("extract", "chunk", "embed", "insert")}
+
+        pages_q  = queue.Queue(maxsize=self.queue_size * 8)   # pages are small, allow more look-ahead
+        chunks_q = queue.Queue(maxsize=self.queue_size)
+        vecs_q   = queue.Queue(maxsize=self.queue_size)
+
+        start = time.perf_counter()
+        threads = [
+            self._stage("extract", lambda: self._extract(pdf_path, pages_q), pages_q),
+            self._stage("chunk",   lambda: self._chunk(file_name, pages_q, chunks_q), chunks_q),
+            self._stage("embed",   lambda: self._embed(chunks_q, vecs_q), vecs_q),
+        ]
+        try:
+            self._insert(vecs_q)            # last stage runs on the caller's thread
+        except BaseException as e:
+            self._errors.append(("insert", e))
+            self._stop.set()
+        for t in threads:
+            t.join()
+
+        if self._errors:
+            stage, err = self._errors[0]
+            raise RuntimeError(f"Ingestion of {file_name} failed in '{stage}' stage: {err}") from err
+
+        # Cached answers built on an older version of this file are stale now
+        get_answer_cache().invalidate_file(file_name)
+
+        report = {name: s.as_dict() for name, s in self.stats.items()}
+        report["wall_s"] = round(time.perf_counter() - start, 3)
+        report["chunks"] = self.stats["insert"].items
+        get_tracer().record("ingest.pipeline", report["wall_s"], pages=self.stats["extract"].items,
+                            chunks=report["chunks"])
+        return report
+
+
+def format_report(report: dict) -> str:
+    stages = ", ".join(f"{name} {report[name]['busy_s']:.2f}s"
+                       for name in ("extract", "chunk", "embed", "insert"))
+    return f"{report['chunks']} chunks in {report['wall_s']:.2f}s ({stages})"
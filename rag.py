@@ -1,34 +1,74 @@
 from typing import List
-import weaviate.classes as wvc
-from weaviate_handler import WeaviateHandler
+from embedded_store import open_handler
+from embedding_cache import with_cache
 
+RRF_K = 60        # standard reciprocal-rank-fusion damping constant
 
+
+def fetch_sizes(k: int, hybrid: bool = False, reranked: bool = False, candidates: int = 20) -> tuple[int, int]:
+    """
+    (hits to keep after fusion, hits to fetch per search leg). A reranker over-fetches
+    `candidates` and keeps the k best; hybrid legs over-fetch so fusion has room.
+    """
+    fetch = max(k, candidates) if reranked else k
+    return fetch, (max(2 * fetch, 10) if hybrid else fetch)
+
+
+def reciprocal_rank_fusion(vector_hits: list[dict], keyword_hits: list[dict],
+                           k: int, alpha: float = 0.5) -> list[dict]:
+    """
+    Fuse two ranked lists: score = alpha/(RRF_K + rank_vector) + (1-alpha)/(RRF_K + rank_bm25).
+    alpha=1 is pure vector search, alpha=0 pure keyword search.
+    """
+    fused = {}
+    for weight, hits in ((alpha, vector_hits), (1 - alpha, keyword_hits)):
+        for rank, h in enumerate(hits, start=1):
+            uid = str(h["uuid"])
+            entry = fused.setdefault(uid, {**h, "score": 0.0})
+            if entry.get("distance") is None and h.get("distance") is not None:
+                entry["distance"] = h["distance"]
+            entry["score"] += weight / (RRF_K + rank)
+    return sorted(fused.values(), key=lambda h: h["score"], reverse=True)[:k]
+
+
+# Plain blocking vector search for scripts; hybrid search and the app's query path live in
+# async_engine.AsyncQueryEngine, which shares fetch_sizes / reciprocal_rank_fusion from here.
 class RAGRetriever:
-    def __init__(self, collection_name: str, embedding_model, client):
+    def __init__(self, collection_name: str, embedding_model, client, use_cache: bool = True,
+                 reranker=None, candidates: int = 20):
         """
         collection_name : Weaviate collection to search
         embedding_model : any object with .encode(list[str]) → vectors
-        client          : an **open** weaviate.WeaviateClient instance
+        client          : an **open** weaviate.WeaviateClient, or an EmbeddedClient (VECTOR_BACKEND=embedded)
+        use_cache       : put the persistent embedding cache in front of the model
+        reranker        : optional CrossEncoderReranker; retrieval then over-fetches
+                          `candidates` hits and keeps the k best by cross-encoder score
+        """
+        self.embedding_model = with_cache(embedding_model) if use_cache else embedding_model
+        self.weaviate_handler = open_handler(collection_name, client)   # same surface for either backend
+        self.reranker = reranker
+        self.candidates = candidates
+
+    def embed_query(self, query: str) -> list[float]:
+        vector = self.embedding_model.encode([query])[0]  # float32 row
+        if hasattr(vector, "tolist"):
+            vector = vector.tolist()
+        return vector
+
+    def retrieve(self, query: str, k: int = 5, vector=None, candidates: int = None,
+                 filters: dict = None) -> List[dict]:
+        """
+        vector     : pass a precomputed query embedding to skip the encode call.
+        candidates : how many hits to over-fetch for the reranker (default: self.candidates).
+        filters    : scope, e.g. {"file_names": [...], "page_range": (3, 10), "sections": [...]};
+                     applied by Weaviate as a pre-filter (see weaviate_handler.build_filters).
         """
-        self.embedding_model = embedding_model
-        self.weaviate_handler = WeaviateHandler(collection_name, client)
-
-    def retrieve(self, query: str, k: int = 5) -> List[str]:
-        vector = self.embedding_model.encode([query])[0]  # list[float]
-        collection = self.weaviate_handler.collection
-        result = collection.query.near_vector(
-            near_vector=vector,
-            limit=k,
-            return_properties=["text","page","summary","file_name"],
-            return_metadata=wvc.query.MetadataQuery(distance=True)
-        )
-
-        return [
-            {"uuid": o.uuid,   
-             "text": o.properties["text"],
-             "summary": o.properties.get("summary", ""),
-             "page": o.properties.get("page", 0),
-             "file_name": o.properties.get("file_name", "unknown.pdf"),
-             "distance": o.metadata.distance}
-            for o in result.objects
-            ]
+        if vector is None:
+            vector = self.embed_query(query)
+        elif hasattr(vector, "tolist"):
+            vector = vector.tolist()
+        fetch, _ = fetch_sizes(k, reranked=self.reranker is not None, candidates=candidates or self.candidates)
+        hits = self.weaviate_handler.near_vector(vector, fetch, filters)
+        if self.reranker is not None:
+            hits = self.reranker.rerank(query, hits, k)
+        return hits
@@ -0,0 +1,78 @@
+# reranker.py
+import os, hashlib, threading
+from collections import OrderedDict
+import numpy as np
+
+from local_embedder import load_onnx_session, load_tokenizer
+from chunk_ids import hit_content_hash
+
+
+class CrossEncoderReranker:
+    """
+    Second retrieval stage: scores (query, chunk) pairs with a small cross-encoder
+    on CPU (ONNX Runtime) and keeps the best k.
+
+    Pairs are scored in length-sorted batches; scores are cached by
+    (query hash, chunk uuid, content hash) so re-asking a question only scores
+    new or edited candidates.
+    """
+
+    def __init__(self, model_id="cross-encoder/ms-marco-MiniLM-L-6-v2",
+                 onnx_file: str = "onnx/model.onnx",
+                 num_threads: int = None,
+                 batch_size: int = 16,
+                 max_length: int = 512,
+                 cache_size: int = 20_000):
+        self.model_id = model_id
+        self.batch_size = batch_size
+        num_threads = num_threads or int(os.getenv("RERANK_THREADS", os.cpu_count() or 1))
+        self.tokenizer = load_tokenizer(model_id, max_length)
+        self.session = load_onnx_session(model_id, onnx_file, num_threads)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _score_pairs(self, query: str, texts: list[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch([(query, t) for t in texts])
+        order = sorted(range(len(texts)), key=lambda i: len(encodings[i].ids))
+        scores = np.empty(len(texts), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            seq_len = max(len(encodings[i].ids) for i in idx)
+            ids  = np.zeros((len(idx), seq_len), dtype=np.int64)
+            mask = np.zeros((len(idx), seq_len), dtype=np.int64)
+            type_ids = np.zeros((len(idx), seq_len), dtype=np.int64)
+            for row, i in enumerate(idx):
+                enc = encodings[i]
+                n = len(enc.ids)
+                ids[row, :n], mask[row, :n], type_ids[row, :n] = enc.ids, 1, enc.type_ids
+            feeds = {"input_ids": ids, "attention_mask": mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = type_ids
+            logits = self.session.run(None, feeds)[0]         # (batch, 1)
+            scores[idx] = logits.reshape(len(idx), -1)[:, 0]
+        return scores
+
+    def rerank(self, query: str, hits: list[dict], k: int) -> list[dict]:
+        """Return the k best hits by cross-encoder score (added as hit["rerank_score"])."""
+        if not hits:
+            return []
+        qhash = hashlib.sha1(query.strip().lower().encode("utf-8")).hexdigest()
+        keys = [(qhash, str(h["uuid"]), hit_content_hash(h)) for h in hits]   # stale after an edit otherwise
+
+        with self._lock:
+            known = {key: self._cache[key] for key in keys if key in self._cache}
+            for key in known:
+                self._cache.move_to_end(key)
+        todo = [i for i, key in enumerate(keys) if key not in known]
+        if todo:
+            new_scores = self._score_pairs(query, [hits[i]["text"] for i in todo])
+            with self._lock:
+                for i, score in zip(todo, new_scores):
+                    known[keys[i]] = self._cache[keys[i]] = float(score)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        scored = [{**h, "rerank_score": known[key]} for h, key in zip(hits, keys)]
+        return sorted(scored, key=lambda h: h["rerank_score"], reverse=True)[:k]
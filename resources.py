@@ -0,0 +1,165 @@
+# resources.py
+"""
+Process-wide owner of the long-lived clients:
+
+  - one Weaviate client (health-checked, reconnected when it goes away), handed out
+    as a SharedWeaviateClient proxy, or the in-process embedded store when VECTOR_BACKEND=embedded
+  - one pooled requests.Session for the HF inference endpoints
+  - one OpenAI-compatible client for the HF router LLMs
+
+Everything that talks to a remote service goes through get_resources(), so a
+process pays the connection handshakes once instead of per call.
+
+The endpoints can be pointed elsewhere (e.g. benchmark.py's local stand-ins)
+with HF_ROUTER_URL, LLM_BASE_URL and SUMMARY_API_URL.
+"""
+import os, time, atexit, threading
+
+
+# Read at call time: modules get imported before load_dotenv() runs in main.py / app.py.
+def hf_router_url() -> str:
+    return os.getenv("HF_ROUTER_URL", "https://router.huggingface.co").rstrip("/")
+
+
+def llm_base_url() -> str:
+    """OpenAI-compatible chat endpoint (the HF router's /v1 unless LLM_BASE_URL is set)."""
+    return os.getenv("LLM_BASE_URL", f"{hf_router_url()}/v1")
+
+
+class SharedWeaviateClient:
+    """
+    What ResourceManager.weaviate() hands out: a stable stand-in for the shared client.
+    Every attribute access goes to the current connection, so handlers, engines and
+    workers that hold on to it keep working after a reconnect.
+    """
+
+    def __init__(self, manager):
+        self._manager = manager
+
+    def __getattr__(self, name):
+        return getattr(self._manager._current_weaviate(), name)
+
+    def close(self):
+        # Shared: closed once by ResourceManager.close(), not by whichever holder finishes first
+        pass
+
+
+class ResourceManager:
+    def __init__(self, host: str = None, http_port: int = None, grpc_port: int = None,
+                 init_timeout: int = 10,
+                 health_interval: float = 30,     # seconds between is_ready() probes
+                 pool_size: int = 16):
+        self.host = host or os.getenv("WEAVIATE_HOST", "localhost")
+        self.http_port = http_port or int(os.getenv("WEAVIATE_HTTP_PORT", 8080))
+        self.grpc_port = grpc_port or int(os.getenv("WEAVIATE_GRPC_PORT", 50051))
+        self.init_timeout = init_timeout
+        self.health_interval = health_interval
+        self.pool_size = pool_size
+        self.vector_backend = os.getenv("VECTOR_BACKEND", "weaviate")   # "weaviate" | "embedded"
+
+        self._lock = threading.RLock()
+        self._weaviate = None
+        self._weaviate_proxy = SharedWeaviateClient(self)
+        self._last_check = 0.0
+        self._session = None
+        self._llm = None
+        self._embedded = None
+
+    # ---------------- Weaviate ----------------
+    def _connect(self):
+        from weaviate import connect_to_local
+        import weaviate.classes as wvc
+        return connect_to_local(
+            host=self.host, port=self.http_port, grpc_port=self.grpc_port,
+            additional_config=wvc.init.AdditionalConfig(
+                timeout=wvc.init.Timeout(init=self.init_timeout)),
+        )
+
+    def _healthy(self) -> bool:
+        try:
+            return self._weaviate.is_connected() and self._weaviate.is_ready()
+        except Exception:
+            return False
+
+    def weaviate(self) -> SharedWeaviateClient:
+        """The shared Weaviate client (as a proxy that follows reconnects)."""
+        self._current_weaviate()        # connect now, so connection errors surface here
+        return self._weaviate_proxy
+
+    def _current_weaviate(self):
+        """The live client; re-created if the last health check failed."""
+        with self._lock:
+            now = time.monotonic()
+            if self._weaviate is not None and now - self._last_check < self.health_interval:
+                return self._weaviate
+            if self._weaviate is None or not self._healthy():
+                if self._weaviate is not None:
+                    print("🔌 Weaviate connection lost — reconnecting …")
+                    try:
+                        self._weaviate.close()
+                    except Exception:
+                        pass
+                self._weaviate = self._connect()
+            self._last_check = now
+            return self._weaviate
+
+    def embedded(self):
+        """The in-process store (embedded_store.EmbeddedClient), opened once."""
+        with self._lock:
+            if self._embedded is None:
+                from embedded_store import EmbeddedClient
+                self._embedded = EmbeddedClient()
+            return self._embedded
+
+    def vector_client(self):
+        """Client for the configured vector backend; pass it to embedded_store.open_handler()."""
+        return self.embedded() if self.vector_backend == "embedded" else self.weaviate()
+
+    # ---------------- HTTP ----------------
+    def http_session(self):
+        """Pooled keep-alive session shared by the embedder and the summariser."""
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
+
+    # ---------------- LLM ----------------
+    def llm(self):
+        """OpenAI-compatible client for the HF router (it pools its own connections)."""
+        with self._lock:
+            if self._llm is None:
+                import openai
+                hf_key = os.getenv("HUGGINGFACE_API_KEY")
+                if not hf_key:
+                    raise RuntimeError("HUGGINGFACE_API_KEY not set")
+                self._llm = openai.OpenAI(base_url=llm_base_url(), api_key=hf_key)
+            return self._llm
+
+    def close(self):
+        with self._lock:
+            for closeable in (self._weaviate, self._embedded, self._session, self._llm):
+                if closeable is not None:
+                    try:
+                        closeable.close()
+                    except Exception:
+                        pass
+            self._weaviate = self._embedded = self._session = self._llm = None
+
+
+_resources = None
+_resources_lock = threading.Lock()
+
+
+def get_resources() -> ResourceManager:
+    global _resources
+    with _resources_lock:
+        if _resources is None:
+            _resources = ResourceManager()
+            atexit.register(_resources.close)
+        return _resources
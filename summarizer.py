@@ -1,18 +1,25 @@
-# summarizer.py  
-import os, requests
+# summarizer.py
+import os, threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from resources import get_resources
+from tracing import get_tracer
 
 
-HEADERS = {"Authorization": f"Bearer {os.getenv('HUGGINGFACE_API_KEY')}"}
-# Even if you just import the get_or... function, value of headers variable 
-# would be passed along as well. 
+def _headers():
+    # Read at call time: modules get imported before load_dotenv() runs in main.py / app.py.
+    return {"Authorization": f"Bearer {os.getenv('HUGGINGFACE_API_KEY')}"}
+
 
 API_URL = "https://api-inference.huggingface.co/models/sshleifer/distilbart-cnn-12-6"
 
 
-def summarise_via_api(text: str,  max_tokens: int = 60) -> str:
-    """Return an abstractive summary from the HF Inference API."""
-    payload = {
-        "inputs": text,
+def _api_url():
+    return os.getenv("SUMMARY_API_URL", API_URL)
+
+
+def _payload(inputs, max_tokens):
+    return {
+        "inputs": inputs,
         "parameters": {
             "max_new_tokens": max_tokens,
             "min_length": 25,
@@ -20,19 +27,121 @@ def summarise_via_api(text: str,  max_tokens: int = 60) -> str:
         },
         "options": {"wait_for_model": True}
     }
-    r = requests.post(API_URL, headers=HEADERS, json=payload, timeout=40)
-    r.raise_for_status()
-    data = r.json()
+
+
+def summarise_via_api(text: str,  max_tokens: int = 60) -> str:
+    """Return an abstractive summary from the HF Inference API."""
+    with get_tracer().span("summarize.api", texts=1, chars=len(text)):
+        r = get_resources().http_session().post(_api_url(), headers=_headers(),
+                                                json=_payload(text, max_tokens), timeout=40)
+        r.raise_for_status()
+        data = r.json()
     if isinstance(data, list) and data and "summary_text" in data[0]:
         return data[0]["summary_text"]
     raise RuntimeError(f"Summarisation failed: {data}")
 
 
+def _summarise_batch(texts: list[str], max_tokens: int, before_request=None) -> list[str]:
+    """
+    One request for several texts; falls back to one request per text if the endpoint refuses lists.
+    before_request() (e.g. a rate limiter) runs before every request, the fallback ones included.
+    """
+    before_request = before_request or (lambda: None)
+    if len(texts) == 1:
+        before_request()
+        return [summarise_via_api(texts[0], max_tokens)]
+    try:
+        before_request()
+        with get_tracer().span("summarize.api", texts=len(texts), chars=sum(map(len, texts))):
+            r = get_resources().http_session().post(_api_url(), headers=_headers(),
+                                                    json=_payload(texts, max_tokens), timeout=40 + 5 * len(texts))
+            r.raise_for_status()
+            data = r.json()
+        if (isinstance(data, list) and len(data) == len(texts)
+                and all(isinstance(d, dict) and "summary_text" in d for d in data)):
+            return [d["summary_text"] for d in data]
+        print(f"⚠️  Batched summarisation returned an unexpected payload; falling back per text")
+    except Exception as e:
+        print(f"⚠️  Batched summarisation failed ({e}); falling back per text")
+    get_tracer().count("summarize_fallback", len(texts), reason="per_text")
+    summaries = []
+    for t in texts:
+        before_request()
+        summaries.append(summarise_via_api(t, max_tokens))
+    return summaries
+
+
+def summarise_many(texts: list[str], max_tokens: int = 60,
+                   batch_size: int = 4, max_workers: int = 4, before_request=None) -> list[str]:
+    """Summarise texts in batched requests, with at most `max_workers` requests in flight."""
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    if len(batches) <= 1:
+        return _summarise_batch(texts, max_tokens, before_request) if texts else []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+        results = pool.map(lambda b: _summarise_batch(b, max_tokens, before_request), batches)
+        return [s for batch in results for s in batch]
+
+
 def get_or_create_summary(hit: dict, collection):
     if hit["summary"]:
         return hit["summary"]                         # already cached
 
     summary = summarise_via_api(hit["text"])          # call HF API once
-    collection.data.update(oid=hit["uuid"],
+    collection.data.update(uuid=hit["uuid"],
                            properties={"summary": summary})
     return summary
+
+
+# uuid → Future of the summary currently being produced, shared by all threads/sessions,
+# so two users asking about the same chunk trigger only one summarisation.
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def get_or_create_summaries(hits: list[dict], handler, wait_timeout: float = 120) -> list[str]:
+    """
+    Summaries for all hits, aligned with `hits`.
+    Missing ones are summarised in batched/concurrent requests and written back
+    to the store (failed writes are reported, not raised); hits are updated in place.
+    """
+    owned, waiting = {}, {}
+    with _in_flight_lock:
+        for h in hits:
+            uid = str(h["uuid"])
+            if h["summary"] or uid in owned or uid in waiting:
+                continue
+            if uid in _in_flight:
+                waiting[uid] = _in_flight[uid]        # someone else is already on it
+            else:
+                owned[uid] = _in_flight[uid] = Future()
+
+    tracer = get_tracer()
+    tracer.count("summary", sum(1 for h in hits if h["summary"]), result="stored")
+    tracer.count("summary", len(waiting), result="in_flight")
+    tracer.count("summary", len(owned), result="generated")
+    if owned:
+        texts = {str(h["uuid"]): h["text"] for h in hits if str(h["uuid"]) in owned}
+        try:
+            summaries = dict(zip(texts, summarise_many(list(texts.values()))))
+            failed = handler.update_properties({uid: {"summary": s} for uid, s in summaries.items()})
+            if failed:
+                # The summaries are still good for this answer; the next query (or the worker) retries storing them
+                tracer.count("summary_store_failed", len(failed))
+                print(f"⚠️ Could not store {len(failed)}/{len(summaries)} summaries: {failed[0][1]}")
+            for uid, summary in summaries.items():
+                owned[uid].set_result(summary)
+        except BaseException as e:
+            for fut in owned.values():
+                if not fut.done():
+                    fut.set_exception(e)
+            raise
+        finally:
+            with _in_flight_lock:
+                for uid in owned:
+                    _in_flight.pop(uid, None)
+
+    for h in hits:
+        uid = str(h["uuid"])
+        if not h["summary"]:
+            h["summary"] = (owned.get(uid) or waiting[uid]).result(timeout=wait_timeout)
+    return [h["summary"] for h in hits]
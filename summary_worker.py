@@ -0,0 +1,226 @@
+# summary_worker.py
+"""
+Background pre-summarisation.
+
+Ingestion pushes the UUIDs of new chunks into a persistent SQLite queue; a
+worker thread drains it at a bounded request rate, summarises the chunks and
+writes the summaries back, so the "summarize" strategy finds them ready at
+query time. The queue survives restarts: claimed-but-unfinished items go back
+to pending when a worker starts.
+
+    python summary_worker.py [--backfill] [--rpm 20]
+"""
+import os, time, sqlite3, argparse, threading
+
+from summarizer import summarise_many
+
+DEFAULT_QUEUE_PATH = os.getenv("SUMMARY_QUEUE_PATH", "summary_queue.sqlite")
+
+
+class SummaryQueue:
+    def __init__(self, path: str = DEFAULT_QUEUE_PATH, max_attempts: int = 3):
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS queue (
+                uuid TEXT PRIMARY KEY,
+                file_name TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',   -- pending | in_progress | done | failed
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated REAL
+            );
+            CREATE INDEX IF NOT EXISTS queue_status ON queue(status);
+        """)
+
+    def enqueue(self, uuids, file_name: str = ""):
+        """Add chunks; anything already queued is (re)set to pending."""
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO queue (uuid, file_name, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(uuid) DO UPDATE SET status = 'pending', attempts = 0, error = NULL, updated = ?",
+                [(str(u), file_name, now, now) for u in uuids])
+            self._db.commit()
+
+    def backfill(self, handler) -> int:
+        """Queue every stored chunk that has no summary yet (e.g. ingested before the worker existed)."""
+        count = 0
+        batch = []
+        for uid, file_name in handler.iter_missing_summaries():
+            batch.append((uid, file_name))
+            if len(batch) >= 500:
+                count += self._insert_missing(batch)
+                batch = []
+        return count + self._insert_missing(batch)
+
+    def _insert_missing(self, rows) -> int:
+        with self._lock:
+            before = self._db.total_changes
+            self._db.executemany("INSERT OR IGNORE INTO queue (uuid, file_name, updated) VALUES (?, ?, ?)",
+                                 [(u, f, time.time()) for u, f in rows])
+            self._db.commit()
+            return self._db.total_changes - before
+
+    def recover(self) -> int:
+        """Put items claimed by a worker that died back in the queue."""
+        with self._lock:
+            n = self._db.execute(
+                "UPDATE queue SET status = 'pending' WHERE status = 'in_progress'").rowcount
+            self._db.commit()
+            return n
+
+    def claim(self, n: int) -> list[str]:
+        with self._lock:
+            rows = [u for (u,) in self._db.execute(
+                "SELECT uuid FROM queue WHERE status = 'pending' ORDER BY updated LIMIT ?", (n,))]
+            self._db.executemany("UPDATE queue SET status = 'in_progress', updated = ? WHERE uuid = ?",
+                                 [(time.time(), u) for u in rows])
+            self._db.commit()
+            return rows
+
+    def complete(self, uuids):
+        with self._lock:
+            self._db.executemany("UPDATE queue SET status = 'done', updated = ? WHERE uuid = ?",
+                                 [(time.time(), str(u)) for u in uuids])
+            self._db.commit()
+
+    def fail(self, uuids, error: str):
+        with self._lock:
+            self._db.executemany(
+                "UPDATE queue SET attempts = attempts + 1, error = ?, updated = ?, "
+                "status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END WHERE uuid = ?",
+                [(error[:500], time.time(), self.max_attempts, str(u)) for u in uuids])
+            self._db.commit()
+
+    def progress(self) -> dict:
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM queue GROUP BY status"))
+        return {s: counts.get(s, 0) for s in ("pending", "in_progress", "done", "failed")}
+
+
+class SummaryWorker:
+    def __init__(self, handler, summary_queue: SummaryQueue,
+                 requests_per_minute: float = 20,   # HF inference rate budget for this worker
+                 batch_size: int = 4,               # chunks per summarisation request
+                 idle_sleep: float = 2.0):
+        self.handler = handler
+        self.queue = summary_queue
+        self.min_interval = 60.0 / requests_per_minute
+        self.batch_size = batch_size
+        self.idle_sleep = idle_sleep
+        self.processed = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_request = 0.0
+        self._throttle_lock = threading.Lock()
+        self._owners = set()                # who wants the worker running (e.g. Streamlit sessions)
+        self._owners_lock = threading.Lock()
+
+    def start(self):
+        if self._thread and self._thread.is_alive() and not self._stop.is_set():
+            return self
+        recovered = self.queue.recover()
+        if recovered:
+            print(f"🔁 Resuming {recovered} summaries left in progress by a previous run")
+        # A fresh event per thread: a thread still finishing its batch after stop() keeps its own
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop,), name="summary-worker", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def is_running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive() and not self._stop.is_set())
+
+    # Shared worker (one per Streamlit server): it runs while at least one owner wants it
+    def acquire(self, owner):
+        with self._owners_lock:
+            self._owners.add(owner)
+            return self.start()
+
+    def release(self, owner):
+        with self._owners_lock:
+            self._owners.discard(owner)
+            if not self._owners and self.is_running():
+                self.stop(timeout=0)
+
+    def wanted_by(self, owner) -> bool:
+        with self._owners_lock:
+            return owner in self._owners
+
+    def progress(self) -> dict:
+        return {**self.queue.progress(), "processed_this_run": self.processed}
+
+    def _throttle(self, stop: threading.Event):
+        """Wait out the request budget; called before every summarisation request."""
+        with self._throttle_lock:
+            wait = self._last_request + self.min_interval - time.monotonic()
+            if wait > 0:
+                stop.wait(wait)
+            self._last_request = time.monotonic()
+
+    def _process(self, uuids: list[str], stop: threading.Event):
+        chunks = self.handler.fetch_chunks(uuids)
+        todo = {u: c["text"] for u, c in chunks.items() if not c.get("summary")}
+        done_already = [u for u in uuids if u not in todo]     # summarised meanwhile, or deleted
+        if todo:
+            # The throttle also covers the per-text fallback requests of a refused batch
+            summaries = summarise_many(list(todo.values()), batch_size=len(todo), max_workers=1,
+                                       before_request=lambda: self._throttle(stop))
+            failed = dict(self.handler.update_properties(dict(zip(todo, ({"summary": s} for s in summaries)))))
+            if failed:
+                self.queue.fail(list(failed), next(iter(failed.values())))
+            self.queue.complete([u for u in todo if u not in failed])
+            self.processed += len(todo) - len(failed)
+        self.queue.complete(done_already)
+
+    def _run(self, stop: threading.Event):
+        while not stop.is_set():
+            uuids = self.queue.claim(self.batch_size)
+            if not uuids:
+                stop.wait(self.idle_sleep)
+                continue
+            try:
+                self._process(uuids, stop)
+            except Exception as e:
+                print(f"❌ Summary worker batch failed: {e}")
+                self.queue.fail(uuids, str(e))
+                stop.wait(self.min_interval)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from resources import get_resources
+    from embedded_store import open_handler
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Pre-summarise queued chunks in the background.")
+    parser.add_argument("--collection", default="LectureSlides")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH)
+    parser.add_argument("--rpm", type=float, default=20, help="max summarisation requests per minute")
+    parser.add_argument("--backfill", action="store_true", help="queue every chunk without a summary first")
+    args = parser.parse_args()
+
+    handler = open_handler(args.collection, get_resources().vector_client())
+    summary_queue = SummaryQueue(args.queue)
+    if args.backfill:
+        print(f"📥 Queued {summary_queue.backfill(handler)} chunks without summaries")
+
+    worker = SummaryWorker(handler, summary_queue, requests_per_minute=args.rpm).start()
+    try:
+        while True:
+            p = worker.progress()
+            print(f"📝 pending {p['pending']}, done {p['done']}, failed {p['failed']}")
+            if p["pending"] == 0 and p["in_progress"] == 0:
+                break
+            time.sleep(10)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.stop()
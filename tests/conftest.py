@@ -0,0 +1,34 @@
+# tests/conftest.py
+import numpy as np
+import pytest
+
+from embedded_store import EmbeddedClient, EmbeddedVectorStore
+
+
+class FakeEmbedder:
+    """Deterministic .encode(list[str]) stand-in: the vector depends on the text only."""
+    model_id = "fake-embedder"
+
+    def __init__(self, dim: int = 8):
+        self.dim = dim
+        self.calls = []
+
+    def vector(self, text: str) -> np.ndarray:
+        rng = np.random.default_rng(sum(map(ord, text)) * 31 + len(text))
+        return rng.random(self.dim, dtype=np.float32)
+
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        return np.stack([self.vector(t) for t in texts]) if texts else np.empty((0, self.dim), np.float32)
+
+
+@pytest.fixture
+def embedder():
+    return FakeEmbedder()
+
+
+@pytest.fixture
+def store(tmp_path):
+    client = EmbeddedClient(str(tmp_path / "store"))
+    yield EmbeddedVectorStore("Test", client)
+    client.close()
@@ -0,0 +1,140 @@
+# tests/test_api_server.py
+import json
+import queue
+import threading
+import time
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from api_server import Handler, QueryBatcher, WorkQueue
+
+
+class SlowEmbedder:
+    model_id = "slow"
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        self.release.wait(5)
+        return np.array([[len(t), i] for i, t in enumerate(texts)], dtype=np.float32)
+
+
+def test_batcher_coalesces_waiting_requests_and_keeps_their_order():
+    embedder = SlowEmbedder()
+    batcher = QueryBatcher(embedder, max_batch=64)
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        first = pool.submit(batcher.encode, ["first"])
+        while not embedder.calls:              # the lone first request goes out on its own
+            time.sleep(0.01)
+        rest = [pool.submit(batcher.encode, [f"q{i}", f"query {i}"]) for i in range(5)]
+        while batcher._pending.qsize() < 5:
+            time.sleep(0.01)
+        embedder.release.set()
+        assert first.result(5).tolist() == [[5, 0]]
+        results = [f.result(5) for f in rest]
+    assert [len(c) for c in embedder.calls] == [1, 10]
+    for i, vectors in enumerate(results):       # each caller gets back its own rows
+        assert vectors[:, 0].tolist() == [len(f"q{i}"), len(f"query {i}")]
+    assert batcher.stats()["batches"] == 2
+
+
+def test_batcher_passes_embedder_errors_to_every_caller():
+    class Broken:
+        def encode(self, texts):
+            raise RuntimeError("endpoint down")
+    batcher = QueryBatcher(Broken())
+    with pytest.raises(RuntimeError, match="endpoint down"):
+        batcher.encode(["q"])
+
+
+def test_work_queue_rejects_jobs_when_full():
+    release = threading.Event()
+    jobs = WorkQueue("test", workers=1, size=1)
+    running = jobs.submit(release.wait, 5)
+    while jobs.depth():                         # the worker picked the first job up
+        time.sleep(0.01)
+    waiting = jobs.submit(lambda: "done")
+    with pytest.raises(queue.Full):
+        jobs.submit(lambda: "too many")
+    release.set()
+    assert running.result(5) is True
+    assert waiting.result(5) == "done"
+
+
+class FakeService:
+    def __init__(self, workers=1, size=1, request_timeout=5):
+        self.started, self.release = threading.Event(), threading.Event()
+        self.queries = WorkQueue("query", workers, size)
+        self.request_timeout = request_timeout
+
+    def query(self, body):
+        if not body.get("query"):
+            raise ValueError("'query' is required")
+        self.started.set()
+        self.release.wait(5)
+        return {"answer": body["query"].upper()}
+
+
+@pytest.fixture
+def server():
+    servers = []
+
+    def start(service):
+        handler = type("TestHandler", (Handler,), {"service": service})
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        httpd.daemon_threads = True
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        servers.append(httpd)
+        return httpd.server_address[1]
+    yield start
+    for httpd in servers:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def post(port, body: dict):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.request("POST", "/query", json.dumps(body), {"Content-Type": "application/json"})
+    response = conn.getresponse()
+    result = response.status, json.loads(response.read()), response.getheader("Retry-After")
+    conn.close()
+    return result
+
+
+def test_full_query_queue_answers_503_with_retry_after(server):
+    service = FakeService(workers=1, size=1)
+    port = server(service)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        running = pool.submit(post, port, {"query": "one"})
+        assert service.started.wait(5)              # the only worker is busy
+        queued = pool.submit(post, port, {"query": "two"})
+        while not service.queries.depth():
+            time.sleep(0.01)
+        status, body, retry_after = post(port, {"query": "three"})
+        assert (status, retry_after) == (503, "1")
+        assert "queue full" in body["error"]
+        service.release.set()
+        status, body, _ = running.result(10)
+        assert (status, body["answer"]) == (200, "ONE")
+        assert queued.result(10)[0] == 200
+
+
+def test_queued_query_is_cancelled_on_timeout_and_bad_input_is_400(server):
+    service = FakeService(workers=1, size=4, request_timeout=0.3)
+    port = server(service)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        running = pool.submit(post, port, {"query": "one"})
+        assert service.started.wait(5)
+        status, body, _ = post(port, {"query": "two"})      # waits behind "one" past the timeout
+        assert (status, body) == (504, {"error": "timed out", "cancelled": True})
+        # Already running: can't be cancelled, finishes in the background
+        assert running.result(10)[:2] == (504, {"error": "timed out", "cancelled": False})
+        service.release.set()
+    assert post(port, {})[:2] == (400, {"error": "'query' is required"})
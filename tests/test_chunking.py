@@ -0,0 +1,56 @@
+# tests/test_chunking.py
+import random
+
+import pytest
+
+from chunking import TextChunker, chunk_texts
+
+
+def sample_text(seed: int = 0, paragraphs: int = 12) -> str:
+    rng = random.Random(seed)
+    words = "the model reads slides and notes about vector search ranking chunks and pages".split()
+    sentence = lambda: " ".join(rng.choice(words) for _ in range(rng.randint(4, 18))).capitalize() + "."
+    return "\n\n".join("\n".join(" ".join(sentence() for _ in range(rng.randint(1, 4)))
+                                 for _ in range(rng.randint(1, 3)))
+                       for _ in range(paragraphs))
+
+
+@pytest.mark.parametrize("size,overlap", [(512, 64), (200, 40), (80, 0)])
+def test_spans_are_stripped_slices_within_chunk_size(size, overlap):
+    text = sample_text(size)
+    chunker = TextChunker(size, overlap)
+    spans = chunker.split_spans(text)
+    assert spans and all(e - s <= size for s, e in spans)
+    for (s, e), chunk in zip(spans, chunker.split_text(text)):
+        assert chunk == text[s:e] == text[s:e].strip()
+    assert all(a[0] < b[0] for a, b in zip(spans, spans[1:]))     # in text order
+
+
+def test_overlap_repeats_the_tail_of_the_previous_chunk():
+    spans = TextChunker(120, 40).split_spans(sample_text(1))
+    assert any(b[0] < a[1] for a, b in zip(spans, spans[1:]))
+
+
+def test_chunk_texts_numbers_pages_from_first_page():
+    chunks = chunk_texts([sample_text(2, 3), sample_text(3, 3)], chunk_size=200, chunk_overlap=20, first_page=5)
+    assert {c.metadata["page"] for c in chunks} == {5, 6}
+
+
+def test_sentence_mode_keeps_punctuation_with_its_sentence():
+    text = "First point here. Second point follows! Third one? " * 6
+    for chunk in TextChunker(60, 0, mode="sentence").split_text(text):
+        assert chunk[-1] in ".!?"
+
+
+def test_overlap_larger_than_size_is_refused():
+    with pytest.raises(ValueError):
+        TextChunker(50, 60)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_same_chunks_as_langchain(seed):
+    splitters = pytest.importorskip("langchain_text_splitters")
+    text = sample_text(seed, paragraphs=20)
+    reference = splitters.RecursiveCharacterTextSplitter(chunk_size=256, chunk_overlap=32,
+                                                         separators=["\n\n", "\n", ".", " ", ""])
+    assert TextChunker(256, 32).split_text(text) == reference.split_text(text)
@@ -0,0 +1,61 @@
+# tests/test_embedding_cache.py
+import os
+import sqlite3
+
+import numpy as np
+
+from embedding_cache import CachedEmbedder, text_key
+
+
+def entries(cache) -> int:
+    return cache._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+def test_hits_skip_the_backend_and_whitespace_is_ignored(tmp_path, embedder):
+    cache = CachedEmbedder(embedder, str(tmp_path), max_entries=100)
+    first = cache.encode(["one text", "two  texts"])
+    again = cache.encode(["two texts", "one text", "one text"])
+    assert embedder.calls == [["one text", "two  texts"]]
+    assert np.allclose(again, first[[1, 0, 0]])
+    assert (cache.hits, cache.misses) == (3, 2)
+    cache.close()
+
+
+def test_eviction_keeps_the_file_within_max_entries(tmp_path, embedder):
+    cache = CachedEmbedder(embedder, str(tmp_path), max_entries=50, memory_items=1)
+    for start in range(0, 200, 25):
+        texts = [f"text {i}" for i in range(start, start + 25)]
+        assert np.allclose(cache.encode(texts), embedder.encode(texts))
+        assert entries(cache) <= 50
+    assert cache.capacity <= 50
+    assert os.path.getsize(cache.vec_path) <= 50 * embedder.dim * 4
+    cache.close()
+
+
+def test_least_recently_used_entries_go_first(tmp_path, embedder):
+    cache = CachedEmbedder(embedder, str(tmp_path), max_entries=4, memory_items=1)
+    for text in ("a", "b", "c", "d"):
+        cache.encode([text])
+    cache.encode(["a"])                     # refresh a
+    cache.encode(["e", "f"])                # evicts the two oldest: b, c
+    keys = {k for (k,) in cache._db.execute("SELECT key FROM entries")}
+    assert keys == {text_key(cache.model_id, t) for t in ("a", "d", "e", "f")}
+    cache.close()
+
+
+def test_reused_slots_never_serve_another_texts_vector(tmp_path, embedder):
+    # Two handles on one cache file, as two processes would have: B evicts A's rows and
+    # re-uses their slots; A must then get the right vectors (re-embedded), never B's
+    a = CachedEmbedder(embedder, str(tmp_path), max_entries=20, memory_items=1)
+    b = CachedEmbedder(embedder, str(tmp_path), max_entries=20, memory_items=1)
+    old = [f"old {i}" for i in range(20)]
+    a.encode(old)
+    b.encode([f"new {i}" for i in range(15)])
+    assert np.allclose(a.encode(old), embedder.encode(old))
+    assert entries(a) <= 20
+    db = sqlite3.connect(os.path.join(str(tmp_path), "fake-embedder.sqlite"))
+    slots = [s for (s,) in db.execute("SELECT slot FROM entries")]
+    assert len(slots) == len(set(slots)) and max(slots) < 20
+    db.close()
+    a.close()
+    b.close()
@@ -0,0 +1,103 @@
+# tests/test_incremental.py
+import pytest
+
+import incremental
+from chunk_ids import chunk_uuid
+from incremental import sync_document
+from pipeline import content_hash
+
+FILE = "deck.pdf"
+
+
+def make_chunks(texts):
+    metas = [{"file_name": FILE, "chunk_index": i, "page": i + 1, "section": "",
+              "content_hash": content_hash(t), "page_hash": content_hash(f"page {i + 1}: {t}"), "bboxes": ""}
+             for i, t in enumerate(texts)]
+    return FILE, list(texts), metas
+
+
+@pytest.fixture
+def pdf(monkeypatch):
+    """Stands in for the PDF on disk: set .texts to what the next sync extracts."""
+    class Doc:
+        texts = []
+    monkeypatch.setattr(incremental, "prepare_chunks", lambda *args, **kwargs: make_chunks(Doc.texts))
+    return Doc
+
+
+def failing_inserts(store, monkeypatch, failing_indexes):
+    """Make inserts of the given chunk indexes fail the way a Weaviate batch reports it."""
+    insert = store.insert_chunks
+    failing = {chunk_uuid(FILE, i) for i in failing_indexes}
+
+    def insert_chunks(chunks, embeddings, metadatas, **kwargs):
+        keep = [n for n, m in enumerate(metadatas) if chunk_uuid(FILE, m["chunk_index"]) not in failing]
+        insert([chunks[n] for n in keep], [embeddings[n] for n in keep], [metadatas[n] for n in keep], **kwargs)
+        return [(chunk_uuid(FILE, m["chunk_index"]), "boom") for m in metadatas
+                if chunk_uuid(FILE, m["chunk_index"]) in failing]
+    monkeypatch.setattr(store, "insert_chunks", insert_chunks)
+
+
+def stored_texts(store):
+    chunks = store.fetch_file_chunks(FILE)
+    texts = store.fetch_chunks([c["uuid"] for c in chunks], ("text",))
+    return {c["chunk_index"]: texts[c["uuid"]]["text"] for c in chunks}
+
+
+def test_first_sync_embeds_everything_then_nothing_changes(store, embedder, pdf):
+    pdf.texts = ["alpha chunk", "beta chunk", "gamma chunk"]
+    report = sync_document("deck.pdf", store, embedder)
+    assert (report["embedded"], report["unchanged"], report["failed"]) == (3, 0, 0)
+
+    embedder.calls.clear()
+    report = sync_document("deck.pdf", store, embedder)
+    assert (report["unchanged"], report["embedded"], report["reused"]) == (3, 0, 0)
+    assert embedder.calls == []
+
+
+def test_moved_text_is_reused_and_tail_deleted(store, embedder, pdf):
+    pdf.texts = ["alpha chunk", "beta chunk", "gamma chunk"]
+    sync_document("deck.pdf", store, embedder)
+
+    embedder.calls.clear()
+    pdf.texts = ["new intro", "alpha chunk"]
+    report = sync_document("deck.pdf", store, embedder)
+    assert (report["embedded"], report["reused"], report["deleted"]) == (1, 1, 1)
+    assert embedder.calls == [["new intro"]]
+    assert stored_texts(store) == {0: "new intro", 1: "alpha chunk"}
+
+
+def test_failed_inserts_are_counted_and_retried(store, embedder, pdf, monkeypatch):
+    pdf.texts = ["alpha chunk", "beta chunk", "gamma chunk"]
+    with monkeypatch.context() as m:
+        failing_inserts(store, m, failing_indexes={1})
+        report = sync_document("deck.pdf", store, embedder)
+    assert (report["embedded"], report["failed"]) == (2, 1)
+    assert sorted(stored_texts(store)) == [0, 2]
+
+    report = sync_document("deck.pdf", store, embedder)
+    assert (report["unchanged"], report["embedded"], report["failed"]) == (2, 1, 0)
+    assert stored_texts(store)[1] == "beta chunk"
+
+
+def test_legacy_copy_kept_while_its_replacement_fails(store, embedder, pdf, monkeypatch):
+    # Ingested before deterministic ids: the object sits under a random uuid
+    pdf.texts = ["alpha chunk", "beta chunk"]
+    sync_document("deck.pdf", store, embedder)
+    legacy_meta = make_chunks(["beta chunk"])[2][0]
+    vector = store.fetch_vectors([chunk_uuid(FILE, 1)])[chunk_uuid(FILE, 1)]
+    store.delete_chunks([chunk_uuid(FILE, 1)])
+    monkeypatch.setattr("embedded_store.chunk_uuid", lambda f, i: "00000000-0000-4000-8000-000000000001")
+    store.insert_chunks(["beta chunk"], [vector], [legacy_meta], skip_existing=False)
+    monkeypatch.undo()
+    monkeypatch.setattr(incremental, "prepare_chunks", lambda *args, **kwargs: make_chunks(pdf.texts))
+
+    with monkeypatch.context() as m:
+        failing_inserts(store, m, failing_indexes={1})
+        report = sync_document("deck.pdf", store, embedder)
+    assert (report["failed"], report["migrated"]) == (1, 0)
+    assert "00000000-0000-4000-8000-000000000001" in {str(c["uuid"]) for c in store.fetch_file_chunks(FILE)}
+
+    report = sync_document("deck.pdf", store, embedder)
+    assert (report["reused"], report["migrated"], report["failed"]) == (1, 1, 0)
+    assert {str(c["uuid"]) for c in store.fetch_file_chunks(FILE)} == {chunk_uuid(FILE, 0), chunk_uuid(FILE, 1)}
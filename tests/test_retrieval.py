@@ -0,0 +1,67 @@
+# tests/test_retrieval.py
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from rag import RRF_K, fetch_sizes, reciprocal_rank_fusion
+from reranker import CrossEncoderReranker
+
+
+def hit(uid, text="", distance=None):
+    return {"uuid": uid, "text": text or f"text of {uid}", "file_name": "deck.pdf", "page": 1, "distance": distance}
+
+
+def test_rrf_rewards_hits_found_by_both_legs():
+    vector = [hit("a", distance=0.1), hit("b", distance=0.2), hit("c", distance=0.3)]
+    keyword = [{**hit("c"), "distance": None}, {**hit("d"), "distance": None}]
+    fused = reciprocal_rank_fusion(vector, keyword, k=2)
+    assert [h["uuid"] for h in fused] == ["c", "a"]
+    assert fused[0]["score"] == 0.5 / (RRF_K + 3) + 0.5 / (RRF_K + 1)
+    assert fused[0]["distance"] == 0.3          # kept from the vector leg
+
+
+def test_rrf_alpha_picks_one_leg():
+    vector, keyword = [hit("a"), hit("b")], [hit("b"), hit("a")]
+    assert [h["uuid"] for h in reciprocal_rank_fusion(vector, keyword, 2, alpha=1.0)] == ["a", "b"]
+    assert [h["uuid"] for h in reciprocal_rank_fusion(vector, keyword, 2, alpha=0.0)] == ["b", "a"]
+
+
+def test_fetch_sizes():
+    assert fetch_sizes(3) == (3, 3)
+    assert fetch_sizes(3, hybrid=True) == (3, 10)
+    assert fetch_sizes(3, reranked=True, candidates=20) == (20, 20)
+    assert fetch_sizes(3, hybrid=True, reranked=True, candidates=20) == (20, 40)
+
+
+class StubReranker(CrossEncoderReranker):
+    """The cache and ranking logic of CrossEncoderReranker without loading a model: longer text scores higher."""
+
+    def __init__(self, cache_size: int = 100):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.scored = []
+
+    def _score_pairs(self, query, texts):
+        self.scored.append(list(texts))
+        return np.array([len(t) for t in texts], dtype=np.float32)
+
+
+def test_rerank_keeps_the_best_k_and_caches_scores():
+    reranker = StubReranker()
+    hits = [hit("a", "short"), hit("b", "a much longer text"), hit("c", "medium text")]
+    top = reranker.rerank("question", hits, k=2)
+    assert [h["uuid"] for h in top] == ["b", "c"]
+    assert top[0]["rerank_score"] == len("a much longer text")
+
+    reranker.rerank("  Question ", hits + [hit("d", "new one")], k=2)
+    assert reranker.scored[1:] == [["new one"]]     # same question: only the new candidate is scored
+
+
+def test_rerank_rescores_a_chunk_whose_text_changed():
+    reranker = StubReranker()
+    reranker.rerank("question", [hit("a", "old text")], k=1)
+    top = reranker.rerank("question", [hit("a", "the re-ingested, longer text")], k=1)
+    assert reranker.scored[-1] == ["the re-ingested, longer text"]
+    assert top[0]["rerank_score"] == len("the re-ingested, longer text")
@@ -0,0 +1,220 @@
+# tracing.py
+"""
+Lightweight in-process tracing and metrics.
+
+    tracer = get_tracer()
+    with tracer.trace("query") as t:              # one request
+        with tracer.span("embed", texts=1):      # one stage; numeric attrs are payload sizes
+            ...
+        tracer.count("answer_cache", result="hit")
+    t.breakdown()                                # [{"span", "ms", "depth", attrs…}] in start order
+
+Every span also lands in a process-wide latency histogram per stage, numeric
+attributes in a payload-size histogram and count() in counters, exported as
+Prometheus text by prometheus_text() (api_server.py serves it on /metrics).
+With TRACING_OTEL=1 and the opentelemetry SDK installed, spans are mirrored to
+the configured OpenTelemetry tracer as well.
+
+The current trace follows contextvars, so it crosses asyncio tasks and
+asyncio.to_thread; plain threads need contextvars.copy_context().run.
+"""
+import os, time, threading, contextvars
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+# Up to an hour: ingest.* spans cover whole documents, not single requests
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+                120, 300, 600, 1800, 3600)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384, 65536)
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_depth = contextvars.ContextVar("span_depth", default=0)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q: float):
+        """
+        Upper bucket bound below which a fraction q of observations fall; None when
+        it lies past the largest bucket (no finite bound to report, and JSON has no inf).
+        """
+        target, seen = q * self.count, 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return None
+
+
+class Trace:
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.spans = []              # (offset_s, duration_s, name, depth, attrs)
+        self.events = {}             # "answer_cache result=hit" → count, within this trace
+        self._lock = threading.Lock()
+
+    def add(self, name, start, duration, depth, attrs):
+        with self._lock:
+            self.spans.append((start - self.start, duration, name, depth, attrs))
+
+    def breakdown(self) -> list[dict]:
+        with self._lock:
+            spans = sorted(self.spans)
+        return [{"span": name, "start_ms": round(1000 * off, 1), "ms": round(1000 * dur, 1),
+                 "depth": depth, **attrs} for off, dur, name, depth, attrs in spans]
+
+    def totals(self) -> dict:
+        """Per span name: count and total / max milliseconds (for spans repeated per batch)."""
+        out = {}
+        with self._lock:
+            for _, dur, name, _, _ in self.spans:
+                entry = out.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+                entry["count"] += 1
+                entry["total_ms"] = round(entry["total_ms"] + 1000 * dur, 1)
+                entry["max_ms"] = round(max(entry["max_ms"], 1000 * dur), 1)
+        return out
+
+
+class Tracer:
+    def __init__(self, keep_traces: int = 100):
+        self._lock = threading.Lock()
+        self._latency = {}           # stage → Histogram (seconds)
+        self._sizes = {}             # (stage, field) → Histogram
+        self._counters = {}          # (event, sorted labels) → int
+        self.recent = deque(maxlen=keep_traces)
+        self._otel = self._load_otel() if os.getenv("TRACING_OTEL") == "1" else None
+
+    @staticmethod
+    def _load_otel():
+        try:
+            from opentelemetry import trace
+            return trace.get_tracer("rag_qna")
+        except ImportError as e:
+            print(f"⚠️  OpenTelemetry unavailable ({e}); exporting Prometheus text only")
+            return None
+
+    @contextmanager
+    def trace(self, name: str, **attrs):
+        """Root of one request; spans opened inside it (in this context) are collected on it."""
+        t = Trace(name, attrs)
+        token = _current_trace.set(t)
+        try:
+            with self.span(name, **attrs):
+                yield t
+        finally:
+            _current_trace.reset(token)
+            self.recent.append(t)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Time a stage. Yields a dict; values put in it are recorded like the keyword attrs."""
+        depth = _depth.get()
+        token = _depth.set(depth + 1)
+        otel = self._otel.start_as_current_span(name) if self._otel else nullcontext()
+        start = time.perf_counter()
+        try:
+            with otel as otel_span:
+                yield attrs
+                if otel_span is not None:
+                    for key, value in attrs.items():
+                        otel_span.set_attribute(key, value)
+        except BaseException as e:
+            attrs["error"] = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            _depth.reset(token)
+            self._record(name, duration, attrs)
+            t = _current_trace.get()
+            if t is not None:
+                t.add(name, start, duration, depth, attrs)
+
+    def record(self, name: str, seconds: float, **attrs):
+        """A span timed by the caller (e.g. across the yields of a streaming generator)."""
+        self._record(name, seconds, attrs)
+        t = _current_trace.get()
+        if t is not None:
+            t.add(name, time.perf_counter() - seconds, seconds, _depth.get(), attrs)
+
+    def _record(self, name, duration, attrs):
+        with self._lock:
+            self._latency.setdefault(name, Histogram(TIME_BUCKETS)).observe(duration)
+            for field, value in attrs.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self._sizes.setdefault((name, field), Histogram(SIZE_BUCKETS)).observe(value)
+
+    def count(self, event: str, n: int = 1, **labels):
+        """Counter, e.g. count("answer_cache", result="hit") or count("llm_fallback", model=m)."""
+        key = (event, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+        t = _current_trace.get()
+        if t is not None:
+            label = event + "".join(f" {k}={v}" for k, v in sorted(labels.items()))
+            with t._lock:
+                t.events[label] = t.events.get(label, 0) + n
+
+    def stage_summary(self) -> dict:
+        """stage → {"count", "mean_ms", "p50_ms", "p95_ms"} (bucket bounds, None past the last one) for dashboards."""
+        def ms(seconds):
+            return None if seconds is None else 1000 * seconds
+
+        with self._lock:
+            return {name: {"count": h.count, "mean_ms": round(1000 * h.sum / h.count, 1),
+                           "p50_ms": ms(h.quantile(0.5)), "p95_ms": ms(h.quantile(0.95))}
+                    for name, h in self._latency.items() if h.count}
+
+    def prometheus_text(self) -> str:
+        lines = []
+
+        def histogram(metric, help_text, items):
+            lines.extend([f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"])
+            for labels, h in items:
+                cumulative = 0
+                for bound, n in zip(h.buckets, h.counts):
+                    cumulative += n
+                    lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {h.count}')
+                lines.append(f"{metric}_sum{{{labels}}} {h.sum}")
+                lines.append(f"{metric}_count{{{labels}}} {h.count}")
+
+        with self._lock:
+            histogram("rag_stage_seconds", "Latency per pipeline stage.",
+                      [(f'stage="{name}"', h) for name, h in sorted(self._latency.items())])
+            histogram("rag_payload_size", "Payload sizes (texts, chars, chunks, tokens) per stage.",
+                      [(f'stage="{name}",field="{field}"', h) for (name, field), h in sorted(self._sizes.items())])
+            lines += ["# HELP rag_events_total Cache hits/misses, retries, model fallbacks.",
+                      "# TYPE rag_events_total counter"]
+            for (event, labels), n in sorted(self._counters.items()):
+                label_text = ",".join([f'event="{event}"', *(f'{k}="{v}"' for k, v in labels)])
+                lines.append(f"rag_events_total{{{label_text}}} {n}")
+        return "\n".join(lines) + "\n"
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
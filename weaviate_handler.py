@@ -1,47 +1,407 @@
 # weaviate_handler.py
+import os, time
+from concurrent.futures import ThreadPoolExecutor
 import weaviate
 import weaviate.classes as wvc
-from weaviate.classes.query import Filter   
+from weaviate.classes.query import Filter
+
+from chunk_ids import chunk_uuid
+from tracing import get_tracer
+
+
+# sha256 of the chunk text and of the whole (cleaned) page, used for incremental re-ingestion.
+HASH_PROPERTIES = [
+    wvc.config.Property(name="content_hash", data_type=wvc.config.DataType.TEXT,
+                        tokenization=wvc.config.Tokenization.FIELD, index_searchable=False),
+    wvc.config.Property(name="page_hash", data_type=wvc.config.DataType.TEXT,
+                        tokenization=wvc.config.Tokenization.FIELD, index_searchable=False),
+]
+
+# JSON list of the layout-block bounding boxes a chunk came from (PDF_LAYOUT=1), "" otherwise.
+LAYOUT_PROPERTIES = [
+    wvc.config.Property(name="bboxes", data_type=wvc.config.DataType.TEXT,
+                        index_filterable=False, index_searchable=False),
+]
+
+
+HIT_PROPERTIES = ["text", "page", "summary", "file_name", "section", "content_hash"]
+
+
+# HNSW / compression presets. ef_construction, max_connections and distance are
+# fixed once the collection exists; ef and the quantizer can be changed later.
+#   ef = -1 → dynamic ef (between dynamic_ef_min and dynamic_ef_max, scaled by k)
+INDEX_PROFILES = {
+    "default":     {},
+    "fast-ingest": {"ef_construction": 64, "max_connections": 16, "ef": 64},
+    "high-recall": {"ef_construction": 256, "max_connections": 48, "ef": 256},
+    # compressed vectors in memory, full vectors on disk for rescoring
+    "low-memory":  {"ef_construction": 128, "max_connections": 16, "ef": -1,
+                    "quantizer": "pq", "training_limit": 10_000},
+    "low-memory-bq": {"ef_construction": 128, "max_connections": 16, "ef": -1,
+                      "quantizer": "bq", "rescore_limit": 200},
+}
+DEFAULT_INDEX_PROFILE = os.getenv("INDEX_PROFILE", "default")
+
+
+def _quantizer(profile: dict, update: bool = False):
+    q = (wvc.config.Reconfigure if update else wvc.config.Configure).VectorIndex.Quantizer
+    kind = profile.get("quantizer")
+    if kind == "pq":
+        return q.pq(training_limit=profile.get("training_limit"), segments=profile.get("segments"))
+    if kind == "bq":
+        return q.bq(rescore_limit=profile.get("rescore_limit"))
+    if kind == "sq":
+        return q.sq(training_limit=profile.get("training_limit"), rescore_limit=profile.get("rescore_limit"))
+    return None
+
+
+def hnsw_config(profile_name: str = None):
+    """Creation-time vector index config for a profile in INDEX_PROFILES."""
+    profile = INDEX_PROFILES[profile_name or DEFAULT_INDEX_PROFILE]
+    return wvc.config.Configure.VectorIndex.hnsw(
+        distance_metric=wvc.config.VectorDistances.COSINE,
+        ef_construction=profile.get("ef_construction"),
+        max_connections=profile.get("max_connections"),
+        ef=profile.get("ef"),
+        quantizer=_quantizer(profile),
+    )
+
+
+def build_filters(file_names=None, page_range=None, sections=None):
+    """
+    Scope for a search, pushed down to Weaviate as a pre-filter (the HNSW search
+    only visits matching objects). Returns None when nothing is restricted.
+        file_names : only these files
+        page_range : (first, last) page, inclusive; either end may be None
+        sections   : only these section labels
+    """
+    parts = []
+    if file_names:
+        parts.append(Filter.by_property("file_name").contains_any(list(file_names)))
+    if page_range:
+        first, last = page_range
+        if first is not None:
+            parts.append(Filter.by_property("page").greater_or_equal(int(first)))
+        if last is not None:
+            parts.append(Filter.by_property("page").less_or_equal(int(last)))
+    if sections:
+        parts.append(Filter.by_property("section").contains_any(list(sections)))
+    if not parts:
+        return None
+    return parts[0] if len(parts) == 1 else Filter.all_of(parts)
+
+
+def _as_filter(filters):
+    # Callers pass either a scope dict (see build_filters) or a ready-made Weaviate filter.
+    if isinstance(filters, dict):
+        return build_filters(**filters)
+    return filters
+
 
 class WeaviateHandler:
-    def __init__(self, collection_name: str, client: weaviate.WeaviateClient):
+    def __init__(self, collection_name: str, client: weaviate.WeaviateClient, index_profile: str = None):
+        """
+        index_profile : key of INDEX_PROFILES (env INDEX_PROFILE). Used when the collection is
+                        created; passing it explicitly for an existing collection also applies
+                        its mutable settings (see apply_index_profile).
+        """
         self.client = client
-        self.collection_name = collection_name # A collection is basically a schema/ blueprint. 
+        self.collection_name = collection_name # A collection is basically a schema/ blueprint.
 
+        created = False
         if self.collection_name not in self.client.collections.list_all():
+            created = True
             self.client.collections.create(
                 name=self.collection_name,
-                vectorizer_config=wvc.config.Configure.Vectorizer.none(), #We are going to provide the embeddings as we want full control over the process. Normally, a model gives the values from their side. 
-                vector_index_config=wvc.config.Configure.VectorIndex.hnsw(), # A popular algorithm for nearest neighbour search. 
+                vectorizer_config=wvc.config.Configure.Vectorizer.none(), #We are going to provide the embeddings as we want full control over the process. Normally, a model gives the values from their side.
+                vector_index_config=hnsw_config(index_profile), # HNSW (nearest neighbour graph) tuned by the profile
                 properties=[
                     wvc.config.Property(name="text", data_type=wvc.config.DataType.TEXT),
-                    wvc.config.Property(name="page", data_type=wvc.config.DataType.INT),
-                    wvc.config.Property(name="chunk_index", data_type=wvc.config.DataType.INT),
-                    wvc.config.Property(name="summary",  data_type=wvc.config.DataType.TEXT),
-                    wvc.config.Property(name="file_name", data_type=wvc.config.DataType.TEXT),
-                    wvc.config.Property(name="section", data_type=wvc.config.DataType.TEXT),
+                    # page / chunk_index get a range index so page-range scopes and
+                    # "chunk_index >= n" deletes don't scan every object
+                    wvc.config.Property(name="page", data_type=wvc.config.DataType.INT,
+                                        index_filterable=True, index_range_filters=True),
+                    wvc.config.Property(name="chunk_index", data_type=wvc.config.DataType.INT,
+                                        index_filterable=True, index_range_filters=True),
+                    wvc.config.Property(name="summary",  data_type=wvc.config.DataType.TEXT,
+                                        index_filterable=False),
+                    # Whole-value (FIELD) tokenisation: "week 1.pdf" matches only that file, not every
+                    # file containing "week". Filterable, not part of BM25.
+                    wvc.config.Property(name="file_name", data_type=wvc.config.DataType.TEXT,
+                                        tokenization=wvc.config.Tokenization.FIELD,
+                                        index_filterable=True, index_searchable=False),
+                    wvc.config.Property(name="section", data_type=wvc.config.DataType.TEXT,
+                                        tokenization=wvc.config.Tokenization.FIELD,
+                                        index_filterable=True, index_searchable=False),
+                    *HASH_PROPERTIES,
+                    *LAYOUT_PROPERTIES,
                 ]
             )
 
-        self.collection = self.client.collections.get(self.collection_name)
+        self._ensure_added_properties()
+        if index_profile and not created:
+            self.apply_index_profile(index_profile)
+
+    @property
+    def collection(self):
+        # Looked up per use (no round trip): with the shared client proxy it always
+        # belongs to the current connection, also after a reconnect
+        return self.client.collections.get(self.collection_name)
+
+    def apply_index_profile(self, profile_name: str):
+        """
+        Move an existing collection to a profile as far as Weaviate allows: ef and
+        compression are updated in place; ef_construction / max_connections are
+        immutable and only reported if they differ.
+        """
+        profile = INDEX_PROFILES[profile_name]
+        current = self.collection.config.get().vector_index_config
+        for key in ("ef_construction", "max_connections"):
+            if key in profile and getattr(current, key, None) != profile[key]:
+                print(f"⚠️  {self.collection_name}: {key} is {getattr(current, key, None)} "
+                      f"(profile '{profile_name}' wants {profile[key]}); recreate the collection to change it")
+        quantizer = None
+        if profile.get("quantizer") and getattr(current, "quantizer", None) is None:
+            quantizer = _quantizer(profile, update=True)     # compression can be switched on, not off
+        try:
+            self.collection.config.update(vector_index_config=wvc.config.Reconfigure.VectorIndex.hnsw(
+                ef=profile.get("ef"), quantizer=quantizer))
+        except Exception as e:
+            print(f"⚠️  Could not apply index profile '{profile_name}' to {self.collection_name}: {e}")
+
+    def _ensure_added_properties(self):
+        # Collections created before content hashing / layout boxes existed get the new properties added in place.
+        existing = {p.name for p in self.collection.config.get().properties}
+        for prop in HASH_PROPERTIES + LAYOUT_PROPERTIES:
+            if prop.name not in existing:
+                self.collection.config.add_property(prop)
 
     def document_already_exists(self, file_name):
+         # Exact name check: a legacy word-tokenised file_name also matches similar names
          flt = Filter.by_property("file_name").equal(file_name)
-         return bool(self.collection.query.fetch_objects(limit=1, filters=flt).objects)
-    
-    def insert_chunks(self, chunks: list[str], embeddings: list[list[float]], metadatas: list[dict]):
-        
-        if self.document_already_exists(metadatas[0]["file_name"]):
-            print(f"⚠️ File '{metadatas[0]['file_name']}' already ingested. Skipping.")
-            return
-        
-        for chunk, vector, metadata in zip(chunks, embeddings, metadatas): #zip is converting them into a tuple. 
-            self.collection.data.insert(
-                properties={**metadata, "text": chunk, "summary": ""},
-                vector=vector
+         result = self.collection.aggregate.over_all(
+             filters=flt, group_by=wvc.aggregate.GroupByAggregate(prop="file_name", limit=10_000),
+             total_count=True)
+         return any(g.grouped_by.value == file_name for g in result.groups)
+
+    @staticmethod
+    def _to_hit(o) -> dict:
+        return {"uuid": o.uuid,
+                "text": o.properties["text"],
+                "summary": o.properties.get("summary", ""),
+                "page": o.properties.get("page", 0),
+                "file_name": o.properties.get("file_name", "unknown.pdf"),
+                "section": o.properties.get("section") or "N/A",
+                "content_hash": o.properties.get("content_hash") or "",
+                "distance": o.metadata.distance}
+
+    def near_vector(self, vector, k: int, filters=None) -> list[dict]:
+        """filters: scope dict for build_filters() or a Weaviate Filter."""
+        with get_tracer().span("weaviate.near_vector", k=k, filtered=bool(filters)):
+            result = self.collection.query.near_vector(
+                near_vector=vector,
+                limit=k,
+                filters=_as_filter(filters),
+                return_properties=HIT_PROPERTIES,
+                return_metadata=wvc.query.MetadataQuery(distance=True)
             )
-        print(f"✅ Inserted {len(chunks)} chunks into Weaviate!")
-    
+        return [self._to_hit(o) for o in result.objects]
+
+    def bm25(self, query: str, k: int, filters=None) -> list[dict]:
+        """Keyword (BM25) search over the chunk text; hits carry no distance."""
+        with get_tracer().span("weaviate.bm25", k=k, filtered=bool(filters)):
+            result = self.collection.query.bm25(
+                query=query,
+                query_properties=["text"],
+                limit=k,
+                filters=_as_filter(filters),
+                return_properties=HIT_PROPERTIES,
+                return_metadata=wvc.query.MetadataQuery(score=True)
+            )
+        return [{**self._to_hit(o), "distance": None, "bm25_score": o.metadata.score}
+                for o in result.objects]
+
+    def existing_file_names(self, file_names: list[str], group_limit: int = 10_000) -> set[str]:
+        """One aggregate query instead of a document_already_exists call per file."""
+        if not file_names:
+            return set()
+        # On word-tokenised (legacy) collections contains_any also matches other files, so the
+        # groups are not capped at len(file_names) and names are compared here
+        result = self.collection.aggregate.over_all(
+            filters=Filter.by_property("file_name").contains_any(list(file_names)),
+            group_by=wvc.aggregate.GroupByAggregate(prop="file_name", limit=group_limit),
+            total_count=True,
+        )
+        if len(result.groups) < group_limit:
+            return {g.grouped_by.value for g in result.groups} & set(file_names)
+        return {name for name in file_names if self.document_already_exists(name)}     # groups cut off
+
+    def _group_counts(self, prop: str, limit: int = 10_000) -> dict:
+        result = self.collection.aggregate.over_all(
+            group_by=wvc.aggregate.GroupByAggregate(prop=prop, limit=limit),
+            total_count=True,
+        )
+        return {g.grouped_by.value: g.total_count for g in result.groups}
+
+    def list_file_names(self) -> list[str]:
+        """Every ingested file (one aggregate query), for scoping searches."""
+        return sorted(self._group_counts("file_name"))
+
+    def list_sections(self, file_names=None) -> list[str]:
+        if file_names:
+            result = self.collection.aggregate.over_all(
+                filters=build_filters(file_names=file_names),
+                group_by=wvc.aggregate.GroupByAggregate(prop="section", limit=10_000),
+                total_count=True,
+            )
+            return sorted(g.grouped_by.value for g in result.groups)
+        return sorted(self._group_counts("section"))
+
+    def max_page(self, file_names=None) -> int:
+        result = self.collection.aggregate.over_all(
+            filters=build_filters(file_names=file_names),
+            return_metrics=wvc.query.Metrics("page").integer(maximum=True),
+        )
+        return result.properties["page"].maximum or 0
+
+    def fetch_file_chunks(self, file_name: str, page_size: int = 1000) -> list[dict]:
+        """All stored chunks of a file (no vectors): uuid, chunk_index, page, hashes, summary."""
+        # Collections created before file_name used FIELD tokenisation match word-wise
+        # ("week 1.pdf" also hits "week 2.pdf"), so the name is checked again here.
+        flt = Filter.by_property("file_name").equal(file_name)
+        chunks, offset = [], 0
+        while True:
+            result = self.collection.query.fetch_objects(
+                filters=flt, limit=page_size, offset=offset,
+                return_properties=["file_name", "chunk_index", "page", "content_hash", "page_hash", "summary"],
+            )
+            chunks += [{"uuid": o.uuid, **o.properties} for o in result.objects
+                       if o.properties.get("file_name") == file_name]
+            if len(result.objects) < page_size:
+                return chunks
+            offset += page_size
+
+    def fetch_chunks(self, uuids: list, properties=("text", "summary", "file_name")) -> dict:
+        """uuid (str) → selected properties, for the given object ids."""
+        if not uuids:
+            return {}
+        result = self.collection.query.fetch_objects(
+            filters=Filter.by_id().contains_any(list(uuids)),
+            limit=len(uuids), return_properties=list(properties),
+        )
+        return {str(o.uuid): o.properties for o in result.objects}
+
+    def iter_missing_summaries(self):
+        """Yield (uuid, file_name) for every chunk whose summary is still empty."""
+        for o in self.collection.iterator(return_properties=["summary", "file_name"]):
+            if not o.properties.get("summary"):
+                yield str(o.uuid), o.properties.get("file_name", "")
+
+    def fetch_vectors(self, uuids: list) -> dict:
+        """uuid → stored vector, for re-using embeddings without recomputing them."""
+        if not uuids:
+            return {}
+        result = self.collection.query.fetch_objects(
+            filters=Filter.by_id().contains_any(list(uuids)),
+            limit=len(uuids), include_vector=True, return_properties=[],
+        )
+        return {o.uuid: o.vector["default"] for o in result.objects}
+
+    def update_properties(self, updates: dict, max_workers: int = 8) -> list:
+        """
+        Write {uuid: {prop: value}} into stored objects, one partial update (PATCH) per
+        object on a small thread pool. Only the given properties are sent, so concurrent
+        changes to the rest of an object are never overwritten.
+        Returns [(uuid, error message)] for objects that could not be written.
+        """
+        if not updates:
+            return []
+
+        def update(uid):
+            try:
+                self.collection.data.update(uuid=uid, properties=updates[uid])
+            except Exception as e:
+                return str(uid), str(e)
+            return None
+
+        with get_tracer().span("weaviate.update", objects=len(updates)), \
+                ThreadPoolExecutor(max_workers=min(max_workers, len(updates))) as pool:
+            return [f for f in pool.map(update, list(updates)) if f is not None]
+
+    def delete_chunks(self, uuids: list, page_size: int = 1000) -> int:
+        """Delete objects by id. Returns how many were removed."""
+        uuids, removed = list(uuids), 0
+        for i in range(0, len(uuids), page_size):
+            result = self.collection.data.delete_many(where=Filter.by_id().contains_any(uuids[i:i + page_size]))
+            removed += result.successful
+        return removed
+
+    def delete_chunks_from(self, file_name: str, first_index: int) -> int:
+        """Delete a file's chunks with chunk_index >= first_index. Returns how many were removed."""
+        # By the exact ids of this file's chunks: a file_name filter alone can reach other files
+        stale = [c["uuid"] for c in self.fetch_file_chunks(file_name)
+                 if (c.get("chunk_index") or 0) >= first_index]
+        return self.delete_chunks(stale)
+
+    def insert_chunks(self, chunks: list[str], embeddings: list[list[float]], metadatas: list[dict],
+                      batch_size: int = 100, concurrent_requests: int = 2,
+                      max_retries: int = 3, skip_existing: bool = True):
+        """
+        Bulk insert through the gRPC batch API.
+        Objects get deterministic UUIDs from (file_name, chunk_index), so a retry
+        (or a second run) overwrites rather than duplicates. Objects that fail are
+        collected and re-queued up to `max_retries` times.
+        Returns the list of objects that still failed: [(uuid, error message)].
+        """
+        if not chunks:
+            return []
+
+        if skip_existing and self.document_already_exists(metadatas[0]["file_name"]):
+            print(f"⚠️ File '{metadatas[0]['file_name']}' already ingested. Skipping.")
+            return []
+
+        pending = {}
+        for chunk, vector, metadata in zip(chunks, embeddings, metadatas): #zip is converting them into a tuple.
+            uid = chunk_uuid(metadata["file_name"], metadata["chunk_index"])
+            if hasattr(vector, "tolist"):        # numpy row → plain floats
+                vector = vector.tolist()
+            # metadata may carry an existing summary (incremental re-ingestion keeps it)
+            pending[uid] = ({"summary": "", **metadata, "text": chunk}, vector)
+
+        start = time.perf_counter()
+        errors = {}
+        tracer = get_tracer()
+        for attempt in range(max_retries + 1):
+            if not pending:
+                break
+            if attempt:
+                print(f"🔁 Retrying {len(pending)} failed objects (attempt {attempt}/{max_retries}) …")
+                time.sleep(2 ** (attempt - 1))      # back off before re-sending
+
+            collection = self.collection            # failed_objects lives on this instance's batch
+            with tracer.span("weaviate.insert", objects=len(pending), attempt=attempt), \
+                    collection.batch.fixed_size(batch_size=batch_size,
+                                               concurrent_requests=concurrent_requests) as batch:
+                for uid, (properties, vector) in pending.items():
+                    batch.add_object(properties=properties, vector=vector, uuid=uid)
+
+            # Per-object errors; everything else went through.
+            failed = collection.batch.failed_objects
+            errors = {str(f.object_.uuid): f.message for f in failed}
+            pending = {uid: obj for uid, obj in pending.items() if str(uid) in errors}
+            if pending:
+                tracer.count("weaviate_insert_failed", len(pending), attempt=attempt)
+
+        elapsed = time.perf_counter() - start
+        inserted = len(chunks) - len(pending)
+        rate = inserted / elapsed if elapsed > 0 else float("inf")
+        print(f"✅ Inserted {inserted}/{len(chunks)} chunks into Weaviate "
+              f"in {elapsed:.2f}s ({rate:.1f} objects/s)")
+
+        if pending:
+            print(f"❌ {len(pending)} chunks could not be inserted after {max_retries} retries.")
+        return [(uid, errors.get(str(uid), "")) for uid in pending]
+
 
     def close(self):
         self.client.close()
\ No newline at end of file